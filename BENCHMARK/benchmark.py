@@ -0,0 +1,344 @@
+# benchmark.py
+# Mide el rendimiento del ETL de FACTURAS por etapa sobre ZIPs sintéticos (ver generar_zips.py).
+#
+#   python benchmark.py --docs 10000                 # genera (si hace falta) y mide
+#   python benchmark.py --docs 1000000 --streaming   # volúmenes grandes con memoria plana
+#   python benchmark.py --docs 10000 --main-args "--workers 4"   # además, corrida completa de main.py
+#   python benchmark.py --docs 10000 --parsers       # además, compara los backends de --parser
+#
+# Etapas: control_faltantes, extracción de ZIP, parse_ubl_document, marcado de anulaciones,
+# escritura CSV y la dimensión de productos. Reporta segundos, docs/s, líneas/s y RSS pico,
+# y deja el detalle en <trabajo>/benchmark_resultados.json.
+
+import os
+import sys
+import json
+import time
+import shlex
+import argparse
+import platform
+import subprocess
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+FACTURAS_DIR = os.path.join(AQUI, "..", "FACTURAS")
+sys.path.insert(0, FACTURAS_DIR)
+
+import main as etl  # FACTURAS/main.py
+from generar_zips import generar
+from ubl_parsers import PARSER_DEFAULT, parsers_disponibles, usar_parser
+
+try:
+    import resource
+except ImportError:  # Windows: sin RSS pico
+    resource = None
+
+def rss_pico_mb():
+    if resource is None:
+        return None
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB, macOS bytes
+    return round(kb / 1024 / (1024 if sys.platform == "darwin" else 1), 1)
+
+class Etapas:
+    """Acumula tiempo por etapa (una etapa puede medirse en muchos tramos, ej. un ZIP a la vez)."""
+
+    def __init__(self):
+        self.segundos = {}
+        self.rss = {}
+
+    def sumar(self, etapa, dt):
+        self.segundos[etapa] = self.segundos.get(etapa, 0.0) + dt
+
+    def cerrar(self, etapa):
+        self.segundos.setdefault(etapa, 0.0)
+        self.rss[etapa] = rss_pico_mb()
+
+def medir_etl(zips, streaming=False):
+    """
+    Recorre los ZIP como procesar_zips(), pero tomando el tiempo de cada etapa por separado.
+    Retorna (etapas, conteos).
+    """
+    et = Etapas()
+    c = {"zips": len(zips), "docs": 0, "lineas": 0, "notas_credito": 0, "anulaciones": 0,
+         "anulados": 0, "errores": 0, "bytes_xml": 0}
+    agregados = etl.AgregadosVentas()
+    sink = etl.StreamingSink(agregados=agregados) if streaming else None
+    filas_totales = [[] for _ in etl.SALIDAS_POR_ZIP]
+
+    for zname in zips:
+        t0 = time.perf_counter()
+        try:
+            xml_files = etl.load_zip_xmls(os.path.join(etl.ZIP_DIR, zname))
+        except Exception:
+            xml_files = None
+        et.sumar("extraccion_zip", time.perf_counter() - t0)
+        if not xml_files:
+            c["errores"] += 1
+            continue
+
+        filas = [[] for _ in etl.SALIDAS_POR_ZIP]
+        docs, items, errores, anulaciones, nc, nc_items = filas
+        t0 = time.perf_counter()
+        for xml_name, xml_src in xml_files:
+            c["bytes_xml"] += len(xml_src.getbuffer())
+            try:
+                header, its, nota = etl.parse_ubl_document(xml_src, xml_name)
+            except Exception as e:
+                errores.append({"ZIP_Origen": zname, "ArchivoXML": xml_name, "Error": str(e)})
+                continue
+            header["ZIP_Origen"] = zname
+            docs.append(header)
+            items.extend(its)
+            if nota is not None:
+                nc.append(nota[0])
+                nc_items.extend(nota[1])
+            if header["TipoDocumentoXML"] == "CreditNote" and header["EsAnulacionOperacion"] == "SI":
+                anulaciones.append(etl.anulacion_row(zname, header))
+        et.sumar("parse_ubl_document", time.perf_counter() - t0)
+
+        c["docs"] += len(docs)
+        c["lineas"] += len(items) + len(nc_items)
+        c["notas_credito"] += len(nc)
+        c["errores"] += len(errores)
+
+        if sink is not None:
+            t0 = time.perf_counter()
+            sink.add(*filas)
+            et.sumar("escritura_csv", time.perf_counter() - t0)
+        else:
+            for total, f in zip(filas_totales, filas):
+                total.extend(f)
+
+    et.cerrar("extraccion_zip")
+    et.cerrar("parse_ubl_document")
+
+    if sink is not None:
+        # En streaming el marcado es la 2da pasada sobre facturas.csv (incluye reescribirlo)
+        t0 = time.perf_counter()
+        c["anulaciones"], c["anulados"], _ = sink.close()
+        et.sumar("marcado_anulaciones", time.perf_counter() - t0)
+        et.cerrar("marcado_anulaciones")
+        et.cerrar("escritura_csv")
+        # La suma por ZIP queda dentro de escritura_csv (la hace sink.add)
+        t0 = time.perf_counter()
+        agregados.guardar(etl.OUT_DIR)
+        et.sumar("agregados_ventas", time.perf_counter() - t0)
+        et.cerrar("agregados_ventas")
+        return et, c
+
+    docs_rows, _, _, anulaciones_rows, _, _ = filas_totales
+    t0 = time.perf_counter()
+    docs_anulados = set()
+    for a in anulaciones_rows:
+        etl.add_doc_anulado(docs_anulados, a)
+    for d in docs_rows:
+        marca = etl.es_anulado(d.get("TipoDocumentoXML"), d.get("NumeroDocumento"), d.get("RUC_Emisor"),
+                               docs_anulados)
+        if marca is not None:
+            d["EsAnulado"] = marca
+            c["anulados"] += marca == "SI"
+    c["anulaciones"] = len(anulaciones_rows)
+    et.sumar("marcado_anulaciones", time.perf_counter() - t0)
+    et.cerrar("marcado_anulaciones")
+
+    t0 = time.perf_counter()
+    for (path, fields), rows in zip(etl.SALIDAS_POR_ZIP, filas_totales):
+        etl.write_csv(path, rows, fields)
+    et.sumar("escritura_csv", time.perf_counter() - t0)
+    et.cerrar("escritura_csv")
+
+    # Ventas pre-agregadas, como MemorySink.close(): solo las facturas sin anular
+    t0 = time.perf_counter()
+    agregados.agregar([d for d in docs_rows if d.get("EsAnulado") != "SI"], filas_totales[1])
+    agregados.guardar(etl.OUT_DIR)
+    et.sumar("agregados_ventas", time.perf_counter() - t0)
+    et.cerrar("agregados_ventas")
+    return et, c
+
+def comparar_parsers(zips):
+    """
+    Parsea cada XML con todos los backends disponibles (ZIP por ZIP, memoria plana) y compara sus
+    filas con las de etree. Retorna {backend: {segundos, docs_por_seg, distintos, ejemplo}}.
+    """
+    nombres = parsers_disponibles()
+    res = {n: {"segundos": 0.0, "distintos": 0, "ejemplo": None} for n in nombres}
+    n_docs = 0
+    for zname in zips:
+        try:
+            xml_files = etl.load_zip_xmls(os.path.join(etl.ZIP_DIR, zname))
+        except Exception:
+            continue
+        for xml_name, xml_src in xml_files:
+            n_docs += 1
+            ref = None
+            for nombre in nombres:
+                usar_parser(nombre)
+                xml_src.seek(0)
+                t0 = time.perf_counter()
+                try:
+                    filas = etl.parse_ubl_document(xml_src, xml_name)
+                except Exception as e:
+                    filas = ("error", str(e))
+                res[nombre]["segundos"] += time.perf_counter() - t0
+                if ref is None:
+                    ref = filas   # el primero es etree
+                elif filas != ref:
+                    res[nombre]["distintos"] += 1
+                    res[nombre]["ejemplo"] = res[nombre]["ejemplo"] or f"{zname}/{xml_name}"
+    usar_parser(PARSER_DEFAULT)
+    for r in res.values():
+        r["docs_por_seg"] = round(n_docs / r["segundos"], 1) if r["segundos"] else None
+        r["segundos"] = round(r["segundos"], 3)
+    return res
+
+def medir_dim_productos(et):
+    try:
+        import main_dim_productos
+    except ImportError as e:
+        print(f"⚠️ Se omite dim_productos ({e})")
+        return None
+    t0 = time.perf_counter()
+    main_dim_productos.main(["--sin-cache"])   # clasifica todo: la caché de una corrida anterior no cuenta
+    et.sumar("dim_productos", time.perf_counter() - t0)
+    et.cerrar("dim_productos")
+    return main_dim_productos.normalize_cache_stats()
+
+# Corre main.py dentro de un lanzador que al final reporta su VmHWM: el ru_maxrss de RUSAGE_CHILDREN
+# arrastra el RSS del padre al momento del fork (pandas ya cargado), VmHWM se reinicia con el exec.
+_LANZADOR = """
+import os, sys, runpy
+script = sys.argv[1]
+sys.argv = sys.argv[1:]
+sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+try:
+    runpy.run_path(script, run_name="__main__")
+finally:
+    try:
+        with open("/proc/self/status") as f:
+            hwm = [l.split()[1] for l in f if l.startswith("VmHWM:")]
+        sys.stderr.write(f"RSS_PICO_KB={hwm[0]}\\n")
+    except OSError:
+        pass
+"""
+
+def medir_main(main_args):
+    """Corrida completa de FACTURAS/main.py en un subproceso (tiempo de pared + RSS pico del proceso principal)."""
+    cmd = [sys.executable, "-c", _LANZADOR, os.path.join(FACTURAS_DIR, "main.py")] + shlex.split(main_args)
+    t0 = time.perf_counter()
+    p = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    seg = time.perf_counter() - t0
+    if p.returncode != 0:
+        sys.stderr.write(p.stderr)
+        raise SystemExit(f"main.py {main_args} falló (código {p.returncode})")
+    rss = None
+    for linea in p.stderr.splitlines():
+        if linea.startswith("RSS_PICO_KB="):
+            rss = round(int(linea.split("=", 1)[1]) / 1024, 1)
+    return {"args": main_args, "segundos": round(seg, 3), "rss_pico_mb": rss}
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark por etapa del ETL SUNAT (FACTURAS)")
+    ap.add_argument("--trabajo", default="bench_trabajo",
+                    help="Carpeta de trabajo (se usan <trabajo>/descargas_zip y <trabajo>/salida_csv)")
+    ap.add_argument("--docs", type=int, default=1000, help="Documentos a generar si la carpeta está vacía")
+    ap.add_argument("--lineas-min", type=int, default=1)
+    ap.add_argument("--lineas-max", type=int, default=8)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--regenerar", action="store_true", help="Borra y vuelve a generar los ZIP")
+    ap.add_argument("--streaming", action="store_true", help="Mide con StreamingSink (memoria plana)")
+    ap.add_argument("--sin-dim", action="store_true", help="No mide main_dim_productos")
+    ap.add_argument("--parsers", action="store_true",
+                    help="Mide cada backend de --parser (etree, expat, lxml si está) y verifica que den filas idénticas")
+    ap.add_argument("--main-args", default=None,
+                    help='Además corre FACTURAS/main.py completo con estos argumentos (ej. "--workers 4")')
+    return ap.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.trabajo, exist_ok=True)
+    os.chdir(args.trabajo)
+    os.makedirs(etl.ZIP_DIR, exist_ok=True)
+    os.makedirs(etl.OUT_DIR, exist_ok=True)
+
+    existentes = [f for f in os.listdir(etl.ZIP_DIR) if f.lower().endswith(".zip")]
+    generado = None
+    if args.regenerar or not existentes:
+        for f in existentes:
+            os.remove(os.path.join(etl.ZIP_DIR, f))
+        t0 = time.perf_counter()
+        generado = generar(etl.ZIP_DIR, args.docs, args.lineas_min, args.lineas_max, seed=args.seed)
+        generado["segundos"] = round(time.perf_counter() - t0, 3)
+        print(f"ZIPs generados: {generado['zips']} en {generado['segundos']}s")
+
+    et = Etapas()
+
+    # 1) listdir + control_faltantes
+    t0 = time.perf_counter()
+    zips = sorted([f for f in os.listdir(etl.ZIP_DIR) if f.lower().endswith(".zip")])
+    etl.control_faltantes(zips, etl.TOTAL_ESPERADO)
+    et.sumar("control_faltantes", time.perf_counter() - t0)
+    et.cerrar("control_faltantes")
+
+    # 2) - 5) extracción, parseo, marcado, escritura
+    et_etl, c = medir_etl(zips, args.streaming)
+    et.segundos.update(et_etl.segundos)
+    et.rss.update(et_etl.rss)
+
+    # 6) dimensión de productos
+    cache = None if args.sin_dim else medir_dim_productos(et)
+
+    parsers = comparar_parsers(zips) if args.parsers else None
+
+    e2e = medir_main(args.main_args) if args.main_args is not None else None
+
+    # ====== REPORTE ======
+    etapas = []
+    for nombre, seg in et.segundos.items():
+        etapas.append({
+            "etapa": nombre,
+            "segundos": round(seg, 3),
+            "docs_por_seg": round(c["docs"] / seg, 1) if seg else None,
+            "lineas_por_seg": round(c["lineas"] / seg, 1) if seg else None,
+            "rss_pico_mb": et.rss.get(nombre),
+        })
+    etl_seg = sum(s for n, s in et.segundos.items() if n != "dim_productos")
+    resultado = {
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "streaming": args.streaming,
+        "generacion": generado,
+        "conteos": c,
+        "etapas": etapas,
+        "total_etl": {
+            "segundos": round(etl_seg, 3),
+            "docs_por_seg": round(c["docs"] / etl_seg, 1) if etl_seg else None,
+            "lineas_por_seg": round(c["lineas"] / etl_seg, 1) if etl_seg else None,
+            "rss_pico_mb": rss_pico_mb(),
+        },
+        "cache_normalize_text": cache,
+        "parsers": parsers,
+        "main_completo": e2e,
+    }
+    with open("benchmark_resultados.json", "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=1)
+
+    print("✅ Listo")
+    print(f"ZIP: {c['zips']} | Documentos: {c['docs']} | Líneas: {c['lineas']} | "
+          f"XML: {c['bytes_xml'] / 1e6:.1f} MB | Errores: {c['errores']}")
+    print(f"{'Etapa':<22}{'seg':>10}{'docs/s':>12}{'líneas/s':>12}{'RSS MB':>10}")
+    for e in etapas + [{"etapa": "TOTAL ETL", **resultado["total_etl"]}]:
+        print(f"{e['etapa']:<22}{e['segundos']:>10.3f}{e['docs_por_seg'] or 0:>12.0f}"
+              f"{e['lineas_por_seg'] or 0:>12.0f}{e['rss_pico_mb'] or 0:>10.1f}")
+    if parsers:
+        print(f"{'Parser':<22}{'seg':>10}{'docs/s':>12}{'distintos':>12}")
+        for nombre, r in parsers.items():
+            print(f"{nombre:<22}{r['segundos']:>10.3f}{r['docs_por_seg'] or 0:>12.0f}{r['distintos']:>12}")
+    if e2e:
+        print(f"main.py {e2e['args']}: {e2e['segundos']}s | RSS pico {e2e['rss_pico_mb']} MB")
+    print(f"Detalle -> {os.path.join(args.trabajo, 'benchmark_resultados.json')}")
+    if parsers and any(r["distintos"] for r in parsers.values()):
+        malos = ", ".join(f"{n} ({r['ejemplo']})" for n, r in parsers.items() if r["distintos"])
+        raise SystemExit(f"⚠️ Backends con filas distintas a etree: {malos}")
+
+if __name__ == "__main__":
+    main()
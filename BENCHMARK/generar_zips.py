@@ -0,0 +1,203 @@
+# generar_zips.py
+# Genera ZIPs SUNAT sintéticos (UBL 2.1, namespaces cbc/cac) para medir rendimiento sin datos reales.
+#
+#   python generar_zips.py --docs 100000 --salida descargas_zip
+#
+# Cada ZIP trae un XML (Invoice o CreditNote) y se llama FACTURA<SERIE>-<NUM><RUC>.zip (calza con ZIP_RE).
+# Incluye: líneas por factura configurables, NCE motivo 01 que referencian facturas anteriores,
+# ZIPs duplicados (mismo número con otro nombre) y huecos en la numeración.
+# Es determinista (--seed) y se escribe en streaming: escala de 1k a 1M documentos.
+
+import os
+import argparse
+import random
+import zipfile
+from datetime import date, timedelta
+
+RUC_EMISOR = "20123456789"
+SERIE_FACTURA = "E001"
+SERIE_NOTA = "F001"
+
+NS_INVOICE = "urn:oasis:names:specification:ubl:schema:xsd:Invoice-2"
+NS_CREDITNOTE = "urn:oasis:names:specification:ubl:schema:xsd:CreditNote-2"
+NS_CBC = "urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2"
+NS_CAC = "urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2"
+
+# Vocabulario del catálogo (con typos/variantes reales, para que la dimensión de productos trabaje)
+FAMILIAS = ["SOGA", "DRIZA", "DRIZ", "CABO", "CORDEL", "CUERDA", "HILO", "CINTA", "FIBRA", "Soga", "driza"]
+MATERIALES = ["POLIPROPILENO", "PP", "NYLON", "NAYLON", "POLIESTER", "POLYESTER", "RAFIA", "MACRAME", "MIXTO", ""]
+PROCESOS = ["TORCIDO", "TRENZADO", "TRENZADA", "ALQUITRANADO", "PLANO", "SEMI ESTATICA", "", "", ""]
+MEDIDAS = ["{n}MM", "{n} mm", "{n}/210", "{n}/250", "3/32", "1/2 PULG", "{n}PULG", "1000D", "{n}000 DENIER", "DIAMETRO {n} MM"]
+COLORES = ["BLANCO", "NEGRO", "ROJO", "AZUL", "VERDE", "AMARILLO", "NARANJA", "natural", "", ""]
+RUIDO = ["", "", "", " X ROLLO", " KILOGRAMOS", " - PAGO ANTICIPADO", ","]
+
+CLIENTES = 5000
+
+def descripcion(rnd):
+    medida = rnd.choice(MEDIDAS).format(n=rnd.randint(1, 40))
+    partes = [rnd.choice(FAMILIAS), rnd.choice(MATERIALES), rnd.choice(PROCESOS), medida, rnd.choice(COLORES)]
+    return " ".join(p for p in partes if p) + rnd.choice(RUIDO)
+
+def xml_documento(rnd, tipo, serie, numero, fecha, n_lineas, ref=None, motivo=None):
+    """Un documento UBL con la forma de los XML de SUNAT (firma, emisor, receptor, totales, líneas)."""
+    if tipo == "Invoice":
+        raiz, ns, tag_linea, tag_cant = "Invoice", NS_INVOICE, "InvoiceLine", "InvoicedQuantity"
+    else:
+        raiz, ns, tag_linea, tag_cant = "CreditNote", NS_CREDITNOTE, "CreditNoteLine", "CreditedQuantity"
+
+    cliente = rnd.randrange(CLIENTES)
+    lineas = []
+    subtotal = 0
+    for i in range(n_lineas):
+        cant = rnd.randint(1, 500)
+        precio = rnd.randint(50, 5000)          # en céntimos
+        valor = cant * precio
+        igv = valor * 18 // 100
+        subtotal += valor
+        lineas.append(
+            f"<cac:{tag_linea}><cbc:ID>{i + 1}</cbc:ID>"
+            f'<cbc:{tag_cant} unitCode="KGM">{cant}.00</cbc:{tag_cant}>'
+            f'<cbc:LineExtensionAmount currencyID="PEN">{valor // 100}.{valor % 100:02d}</cbc:LineExtensionAmount>'
+            f'<cac:PricingReference><cac:AlternativeConditionPrice><cbc:PriceAmount currencyID="PEN">{precio * 118 // 10000}.00</cbc:PriceAmount>'
+            f"<cbc:PriceTypeCode>01</cbc:PriceTypeCode></cac:AlternativeConditionPrice></cac:PricingReference>"
+            f'<cac:TaxTotal><cbc:TaxAmount currencyID="PEN">{igv // 100}.{igv % 100:02d}</cbc:TaxAmount>'
+            f'<cac:TaxSubtotal><cbc:TaxableAmount currencyID="PEN">{valor // 100}.{valor % 100:02d}</cbc:TaxableAmount>'
+            f'<cbc:TaxAmount currencyID="PEN">{igv // 100}.{igv % 100:02d}</cbc:TaxAmount>'
+            f"<cac:TaxCategory><cbc:Percent>18.00</cbc:Percent><cbc:TaxExemptionReasonCode>10</cbc:TaxExemptionReasonCode>"
+            f"<cac:TaxScheme><cbc:ID>1000</cbc:ID><cbc:Name>IGV</cbc:Name><cbc:TaxTypeCode>VAT</cbc:TaxTypeCode></cac:TaxScheme>"
+            f"</cac:TaxCategory></cac:TaxSubtotal></cac:TaxTotal>"
+            f"<cac:Item><cbc:Description><![CDATA[{descripcion(rnd)}]]></cbc:Description>"
+            f"<cac:SellersItemIdentification><cbc:ID>P{rnd.randint(1, 999):03d}</cbc:ID></cac:SellersItemIdentification></cac:Item>"
+            f'<cac:Price><cbc:PriceAmount currencyID="PEN">{precio // 100}.{precio % 100:02d}</cbc:PriceAmount></cac:Price>'
+            f"</cac:{tag_linea}>"
+        )
+    igv_total = subtotal * 18 // 100
+    total = subtotal + igv_total
+
+    nota = ""
+    if tipo != "Invoice":
+        nota = (
+            f"<cac:DiscrepancyResponse><cbc:ReferenceID>{ref}</cbc:ReferenceID>"
+            f"<cbc:ResponseCode>{motivo}</cbc:ResponseCode>"
+            f"<cbc:Description><![CDATA[{'ANULACION DE LA OPERACION' if motivo == '01' else 'DESCUENTO POR ITEM'}]]></cbc:Description>"
+            f"</cac:DiscrepancyResponse>"
+            f"<cac:BillingReference><cac:InvoiceDocumentReference><cbc:ID>{ref}</cbc:ID>"
+            f"<cbc:DocumentTypeCode>01</cbc:DocumentTypeCode></cac:InvoiceDocumentReference></cac:BillingReference>"
+        )
+
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<{raiz} xmlns="{ns}" xmlns:cac="{NS_CAC}" xmlns:cbc="{NS_CBC}" '
+        f'xmlns:ds="http://www.w3.org/2000/09/xmldsig#" '
+        f'xmlns:ext="urn:oasis:names:specification:ubl:schema:xsd:CommonExtensionComponents-2">'
+        f"<ext:UBLExtensions><ext:UBLExtension><ext:ExtensionContent>"
+        f'<ds:Signature Id="SignatureSP"><ds:SignedInfo><ds:DigestValue>{rnd.getrandbits(128):032x}</ds:DigestValue>'
+        f"</ds:SignedInfo><ds:SignatureValue>{rnd.getrandbits(512):0128x}</ds:SignatureValue></ds:Signature>"
+        f"</ext:ExtensionContent></ext:UBLExtension></ext:UBLExtensions>"
+        f"<cbc:UBLVersionID>2.1</cbc:UBLVersionID><cbc:CustomizationID>2.0</cbc:CustomizationID>"
+        f"<cbc:ID>{serie}-{numero}</cbc:ID><cbc:IssueDate>{fecha.isoformat()}</cbc:IssueDate>"
+        f"<cbc:IssueTime>{rnd.randint(8, 19):02d}:{rnd.randint(0, 59):02d}:00</cbc:IssueTime>"
+        f"<cbc:DocumentCurrencyCode>PEN</cbc:DocumentCurrencyCode>"
+        f"{nota}"
+        f"<cac:Signature><cbc:ID>{serie}-{numero}</cbc:ID></cac:Signature>"
+        f"<cac:AccountingSupplierParty><cac:Party>"
+        f'<cac:PartyIdentification><cbc:ID schemeID="6">{RUC_EMISOR}</cbc:ID></cac:PartyIdentification>'
+        f"<cac:PartyName><cbc:Name><![CDATA[SOGAS DEL PERU]]></cbc:Name></cac:PartyName>"
+        f"<cac:PartyLegalEntity><cbc:RegistrationName><![CDATA[SOGAS DEL PERU S.A.C.]]></cbc:RegistrationName></cac:PartyLegalEntity>"
+        f"</cac:Party></cac:AccountingSupplierParty>"
+        f"<cac:AccountingCustomerParty><cac:Party>"
+        f'<cac:PartyIdentification><cbc:ID schemeID="6">20{cliente:09d}</cbc:ID></cac:PartyIdentification>'
+        f"<cac:PartyLegalEntity><cbc:RegistrationName><![CDATA[CLIENTE {cliente} S.A.C.]]></cbc:RegistrationName></cac:PartyLegalEntity>"
+        f"</cac:Party></cac:AccountingCustomerParty>"
+        f"<cac:PaymentTerms><cbc:ID>FormaPago</cbc:ID><cbc:PaymentMeansID>{rnd.choice(['Contado', 'Credito'])}</cbc:PaymentMeansID></cac:PaymentTerms>"
+        f'<cac:TaxTotal><cbc:TaxAmount currencyID="PEN">{igv_total // 100}.{igv_total % 100:02d}</cbc:TaxAmount>'
+        f'<cac:TaxSubtotal><cbc:TaxableAmount currencyID="PEN">{subtotal // 100}.{subtotal % 100:02d}</cbc:TaxableAmount>'
+        f'<cbc:TaxAmount currencyID="PEN">{igv_total // 100}.{igv_total % 100:02d}</cbc:TaxAmount>'
+        f"<cac:TaxCategory><cac:TaxScheme><cbc:ID>1000</cbc:ID><cbc:Name>IGV</cbc:Name><cbc:TaxTypeCode>VAT</cbc:TaxTypeCode></cac:TaxScheme></cac:TaxCategory>"
+        f"</cac:TaxSubtotal></cac:TaxTotal>"
+        f'<cac:LegalMonetaryTotal><cbc:LineExtensionAmount currencyID="PEN">{subtotal // 100}.{subtotal % 100:02d}</cbc:LineExtensionAmount>'
+        f'<cbc:TaxInclusiveAmount currencyID="PEN">{total // 100}.{total % 100:02d}</cbc:TaxInclusiveAmount>'
+        f'<cbc:PayableAmount currencyID="PEN">{total // 100}.{total % 100:02d}</cbc:PayableAmount></cac:LegalMonetaryTotal>'
+        f"{''.join(lineas)}"
+        f"</{raiz}>"
+    ).encode("utf-8")
+
+def escribir_zip(path, xml_name, data):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr(xml_name, data)
+
+def generar(salida, docs=1000, lineas_min=1, lineas_max=8, pct_notas=0.03, pct_anulacion=0.6,
+            pct_duplicados=0.002, pct_faltantes=0.005, seed=7, desde=date(2022, 1, 1), dias=1095):
+    """
+    Genera `docs` documentos en `salida` (un ZIP por documento) y retorna un resumen:
+    {"docs", "facturas", "notas", "anulaciones", "lineas", "zips", "duplicados", "faltantes", "bytes_xml"}.
+    Las fechas avanzan con la numeración (como en la vida real) dentro de `dias` a partir de `desde`.
+    """
+    os.makedirs(salida, exist_ok=True)
+    rnd = random.Random(seed)
+    r = {"docs": 0, "facturas": 0, "notas": 0, "anulaciones": 0, "lineas": 0,
+         "zips": 0, "duplicados": 0, "faltantes": 0, "bytes_xml": 0}
+
+    num_factura = 0
+    num_nota = 0
+    for i in range(docs):
+        fecha = desde + timedelta(days=i * dias // max(docs, 1))
+        n_lineas = rnd.randint(lineas_min, lineas_max)
+
+        if num_factura and rnd.random() < pct_notas:
+            num_nota += 1
+            serie, numero, tipo_cod = SERIE_NOTA, num_nota, "07"
+            motivo = "01" if rnd.random() < pct_anulacion else "07"
+            ref = f"{SERIE_FACTURA}-{rnd.randint(1, num_factura)}"
+            data = xml_documento(rnd, "CreditNote", serie, numero, fecha, n_lineas, ref, motivo)
+            r["notas"] += 1
+            r["anulaciones"] += motivo == "01"
+        else:
+            num_factura += 1
+            # Hueco en la numeración: el número se "salta"
+            if rnd.random() < pct_faltantes:
+                num_factura += 1
+                r["faltantes"] += 1
+            serie, numero, tipo_cod = SERIE_FACTURA, num_factura, "01"
+            data = xml_documento(rnd, "Invoice", serie, numero, fecha, n_lineas)
+            r["facturas"] += 1
+
+        xml_name = f"{RUC_EMISOR}-{tipo_cod}-{serie}-{numero}.xml"
+        escribir_zip(os.path.join(salida, f"FACTURA{serie}-{numero}{RUC_EMISOR}.zip"), xml_name, data)
+        r["docs"] += 1
+        r["lineas"] += n_lineas
+        r["zips"] += 1
+        r["bytes_xml"] += len(data)
+
+        # Duplicado: el mismo documento re-descargado con otro nombre (número con cero a la izquierda)
+        if rnd.random() < pct_duplicados:
+            escribir_zip(os.path.join(salida, f"FACTURA{serie}-0{numero}{RUC_EMISOR}.zip"), xml_name, data)
+            r["zips"] += 1
+            r["duplicados"] += 1
+
+    return r
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Genera ZIPs SUNAT sintéticos para benchmark")
+    ap.add_argument("--salida", default="descargas_zip", help="Carpeta destino de los ZIP")
+    ap.add_argument("--docs", type=int, default=1000, help="Cantidad de documentos (1 ZIP por documento)")
+    ap.add_argument("--lineas-min", type=int, default=1, help="Mínimo de líneas por documento")
+    ap.add_argument("--lineas-max", type=int, default=8, help="Máximo de líneas por documento")
+    ap.add_argument("--pct-notas", type=float, default=0.03, help="Fracción de documentos que son Notas de Crédito")
+    ap.add_argument("--pct-anulacion", type=float, default=0.6, help="Fracción de NCE con motivo 01 (anulación)")
+    ap.add_argument("--pct-duplicados", type=float, default=0.002, help="Fracción de ZIPs duplicados con otro nombre")
+    ap.add_argument("--pct-faltantes", type=float, default=0.005, help="Fracción de números de factura saltados")
+    ap.add_argument("--seed", type=int, default=7)
+    return ap.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    r = generar(args.salida, args.docs, args.lineas_min, args.lineas_max, args.pct_notas,
+                args.pct_anulacion, args.pct_duplicados, args.pct_faltantes, args.seed)
+    print("✅ Listo")
+    print(f"ZIPs generados en {args.salida}: {r['zips']} (duplicados: {r['duplicados']})")
+    print(f"Documentos: {r['docs']} | Facturas: {r['facturas']} | NCE: {r['notas']} (anulación: {r['anulaciones']})")
+    print(f"Líneas: {r['lineas']} | Números saltados: {r['faltantes']} | XML: {r['bytes_xml'] / 1e6:.1f} MB")
+
+if __name__ == "__main__":
+    main()
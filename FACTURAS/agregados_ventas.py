@@ -0,0 +1,189 @@
+# agregados_ventas.py
+# Ventas pre-agregadas para Power BI, así un refresco lee miles de filas en vez de todo items.csv:
+#
+#   ventas_mes_cliente.csv            Mes × Moneda × RUC_Receptor: documentos, base, IGV, subtotal, total
+#   ventas_mes_producto.csv           Mes × Moneda × Descripcion: líneas, cantidad, valor sin IGV, impuesto
+#   ventas_mes_familia_material.csv   Mes × Moneda × FamiliaProducto × Material (main_dim_productos.py)
+#
+# Solo cuentan las facturas (TipoDocumentoXML = Invoice) con EsAnulado distinto de SI, y sus items.
+# Los montos se suman como Decimal (exactos, sin error de punto flotante). Mes = año-mes de
+# FechaEmision; Moneda va en la clave para no sumar soles con dólares.
+#
+# main.py las arma en la misma pasada que escribe los CSV (sin volver a leer nada). Si después
+# NOTAS DE CREDITO/main.py re-marca EsAnulado, ajusta estas tablas solo con los documentos que
+# cambiaron (ajustar_agregados).
+
+import os
+import csv
+from decimal import Decimal, InvalidOperation
+
+VENTAS_MES_CLIENTE = "ventas_mes_cliente.csv"
+VENTAS_MES_PRODUCTO = "ventas_mes_producto.csv"
+VENTAS_MES_FAMILIA = "ventas_mes_familia_material.csv"
+
+CLIENTE_MONTOS = ["BaseImponible", "IGV", "SubtotalSinIGV", "Total"]
+PRODUCTO_MONTOS = ["Cantidad", "ValorLineaSinIGV", "ImpuestoLinea"]
+
+VENTAS_MES_CLIENTE_FIELDS = ["Mes", "Moneda", "RUC_Receptor", "Nombre_Receptor", "Documentos"] + CLIENTE_MONTOS
+VENTAS_MES_PRODUCTO_FIELDS = ["Mes", "Moneda", "Descripcion", "Lineas"] + PRODUCTO_MONTOS
+VENTAS_MES_FAMILIA_FIELDS = ["Mes", "Moneda", "FamiliaProducto", "Material", "Lineas"] + PRODUCTO_MONTOS
+
+CERO = Decimal(0)
+
+def monto(s):
+    # Vacío o no numérico cuenta como 0 (la fila igual se cuenta)
+    if not s:
+        return CERO
+    try:
+        d = Decimal(s)
+    except InvalidOperation:
+        return CERO
+    return d if d.is_finite() else CERO
+
+def mes(fecha):
+    return (fecha or "")[:7]
+
+def _escribir(path, fields, filas):
+    # csv.writer con listas (no DictWriter): son muchas filas y str(Decimal) ya es el texto exacto
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(fields)
+        w.writerows(filas)
+
+def _acumular(tabla, clave, inicio, valores, signo):
+    # acc = [inicio..., cantidad de filas, montos...]; restar (no sumar -x) evita el "-0.00"
+    acc = tabla.get(clave)
+    if acc is None:
+        acc = tabla[clave] = list(inicio) + [0] + [CERO] * len(valores)
+    i = len(inicio)
+    acc[i] += signo
+    for j, v in enumerate(valores, i + 1):
+        acc[j] = acc[j] + v if signo > 0 else acc[j] - v
+
+class AgregadosVentas:
+    def __init__(self):
+        self.clientes = {}    # (mes, moneda, ruc) -> [nombre, documentos, montos...]
+        self.productos = {}   # (mes, moneda, descripcion) -> [lineas, montos...]
+
+    def agregar(self, docs, items, signo=1):
+        """
+        Suma (signo=-1: resta) las facturas de `docs` y las líneas de `items` que son de esas
+        facturas; las de otros documentos se ignoran (así se dejan fuera las anuladas).
+        """
+        monedas = {}
+        for d in docs:
+            if d.get("TipoDocumentoXML") != "Invoice":
+                continue
+            moneda = monedas[d.get("DocumentoKey")] = d.get("Moneda") or ""
+            _acumular(self.clientes, (mes(d.get("FechaEmision")), moneda, d.get("RUC_Receptor") or ""),
+                      [d.get("Nombre_Receptor") or ""], [monto(d.get(c)) for c in CLIENTE_MONTOS], signo)
+        # Líneas: son la mayoría de las filas, el acumulado va en línea (sin _acumular)
+        productos = self.productos
+        for it in items:
+            moneda = monedas.get(it.get("DocumentoKey"))
+            if moneda is None:
+                continue
+            clave = ((it.get("FechaEmision") or "")[:7], moneda, it.get("Descripcion") or "")
+            cantidad = monto(it.get("Cantidad"))
+            valor = monto(it.get("ValorLineaSinIGV"))
+            impuesto = monto(it.get("ImpuestoLinea"))
+            acc = productos.get(clave)
+            if acc is None:
+                acc = productos[clave] = [0, CERO, CERO, CERO]
+            if signo > 0:
+                acc[0] += 1
+                acc[1] += cantidad
+                acc[2] += valor
+                acc[3] += impuesto
+            else:
+                acc[0] -= 1
+                acc[1] -= cantidad
+                acc[2] -= valor
+                acc[3] -= impuesto
+
+    @classmethod
+    def cargar(cls, out_dir):
+        """Lee las tablas escritas por guardar(); None si falta alguna."""
+        paths = [os.path.join(out_dir, n) for n in (VENTAS_MES_CLIENTE, VENTAS_MES_PRODUCTO)]
+        if not all(os.path.exists(p) for p in paths):
+            return None
+        agg = cls()
+        for path, tabla, n_clave, n_inicio in ((paths[0], agg.clientes, 3, 1), (paths[1], agg.productos, 3, 0)):
+            with open(path, "r", newline="", encoding="utf-8") as f:
+                r = csv.reader(f)
+                next(r, None)
+                for row in r:
+                    inicio = row[n_clave:n_clave + n_inicio]
+                    n = int(row[n_clave + n_inicio])
+                    tabla[tuple(row[:n_clave])] = inicio + [n] + [Decimal(v) for v in row[n_clave + n_inicio + 1:]]
+        return agg
+
+    def guardar(self, out_dir):
+        """
+        Escribe las tablas ordenadas por clave (las claves que quedaron sin filas no se escriben).
+        Retorna {archivo: filas}.
+        """
+        escritas = {}
+        for nombre, tabla, fields, n_inicio in (
+                (VENTAS_MES_CLIENTE, self.clientes, VENTAS_MES_CLIENTE_FIELDS, 1),
+                (VENTAS_MES_PRODUCTO, self.productos, VENTAS_MES_PRODUCTO_FIELDS, 0)):
+            filas = [k + tuple(v) for k, v in sorted(tabla.items()) if v[n_inicio] > 0]
+            _escribir(os.path.join(out_dir, nombre), fields, filas)
+            escritas[nombre] = len(filas)
+        return escritas
+
+def leer_filas(path, claves):
+    """Filas (dict) de un CSV cuyo DocumentoKey está en `claves`, en una pasada."""
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if row.get("DocumentoKey") in claves:
+                yield row
+
+def anuladas_csv(facturas_csv):
+    """Facturas con EsAnulado = SI de un facturas.csv (son pocas)."""
+    with open(facturas_csv, "r", newline="", encoding="utf-8") as f:
+        return [r for r in csv.DictReader(f) if r.get("TipoDocumentoXML") == "Invoice" and r.get("EsAnulado") == "SI"]
+
+def ajustar_agregados(out_dir, cambios, items_csv):
+    """
+    Después de re-marcar facturas.csv: cambios = filas de facturas cuyo EsAnulado cambió (con la
+    marca nueva). Las que pasaron a SI se restan y las que volvieron a NO se suman, con sus items.
+    Retorna la cantidad de documentos ajustados, o None si no hay tablas que ajustar.
+    """
+    agg = AgregadosVentas.cargar(out_dir)
+    if agg is None:
+        return None
+    if not cambios:
+        return 0
+    items = list(leer_filas(items_csv, {d.get("DocumentoKey") for d in cambios})) if os.path.exists(items_csv) else []
+    for marca, signo in (("SI", -1), ("NO", 1)):
+        docs = [d for d in cambios if d.get("EsAnulado") == marca]
+        if docs:
+            agg.agregar(docs, items, signo)
+    agg.guardar(out_dir)
+    return len(cambios)
+
+def ventas_familia_material(out_dir, clasificacion):
+    """
+    ventas_mes_producto.csv -> ventas_mes_familia_material.csv.
+    clasificacion: {Descripcion: (FamiliaProducto, Material)} de dim_productos.
+    Retorna la cantidad de filas escritas, o None si no existe ventas_mes_producto.csv.
+    """
+    path = os.path.join(out_dir, VENTAS_MES_PRODUCTO)
+    if not os.path.exists(path):
+        return None
+    tabla = {}
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        for r in csv.DictReader(f):
+            familia, material = clasificacion.get(r["Descripcion"], ("", ""))
+            clave = (r["Mes"], r["Moneda"], familia, material)
+            acc = tabla.get(clave)
+            if acc is None:
+                acc = tabla[clave] = [0] + [CERO] * len(PRODUCTO_MONTOS)
+            acc[0] += int(r["Lineas"])
+            for j, c in enumerate(PRODUCTO_MONTOS, 1):
+                acc[j] += Decimal(r[c])
+    _escribir(os.path.join(out_dir, VENTAS_MES_FAMILIA), VENTAS_MES_FAMILIA_FIELDS,
+              (k + tuple(v) for k, v in sorted(tabla.items())))
+    return len(tabla)
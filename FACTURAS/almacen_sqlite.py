@@ -0,0 +1,256 @@
+# almacen_sqlite.py
+# Almacén local opcional en SQLite (main.py --sqlite), además de los CSV.
+#
+# Una tabla por salida (facturas, items, errores, anulaciones, notas_credito, notas_credito_items)
+# con las mismas columnas que el CSV + "ZIP" (de qué ZIP salió la fila). Las cabeceras se guardan
+# con upsert por DocumentoKey / NotaCreditoKey; la tabla "zips" recuerda el sha256 de cada ZIP
+# ingerido, así re-ingerir un ZIP sin cambios no hace nada y uno modificado reemplaza sus filas.
+# "zip_docs" guarda qué documentos trajo cada ZIP: si se borra el ZIP dueño de un documento, solo
+# se re-ingieren los duplicados que también lo traían.
+#
+# Con índices por clave, RUC, fecha y DocReferencia, preguntas como "todas las líneas del cliente X
+# en marzo" se responden sin recorrer items.csv:
+#
+#   python almacen_sqlite.py salida_csv/etl.sqlite --consulta \
+#     "SELECT * FROM items WHERE RUC_Receptor = '20100000001' AND FechaEmision LIKE '2024-03-%'"
+#
+# Y los CSV para Power BI salen de una consulta (--exportar DIR).
+
+import os
+import sys
+import csv
+import sqlite3
+import argparse
+
+# Filas por executemany / commit (una transacción cubre varios ZIP)
+LOTE_FILAS = 50_000
+
+# Columnas internas (no van al CSV exportado)
+COL_ZIP = "ZIP"
+COL_ORDEN = "Orden"       # posición de la línea dentro de su documento
+COL_DOC_NORM = "DocNorm"  # NumeroDocumento normalizado, para marcar EsAnulado por índice
+
+def _q(nombre):
+    return '"' + nombre.replace('"', '""') + '"'
+
+class Tabla:
+    """
+    Una salida de main.py: nombre, columnas del CSV, clave primaria (None = sin upsert, solo por ZIP)
+    e índices adicionales. Si la clave incluye Orden, se numera la línea dentro de su documento.
+    """
+
+    def __init__(self, nombre, fields, clave=None, indices=(), doc_norm=None):
+        self.nombre = nombre
+        self.fields = list(fields)
+        self.clave = tuple(clave) if clave else None
+        self.indices = [tuple(ix) for ix in indices]
+        self.doc_norm = doc_norm   # función para DocNorm (solo facturas)
+        self.columnas = self.fields + [COL_ZIP]
+        if self.clave and COL_ORDEN in self.clave:
+            self.columnas.append(COL_ORDEN)
+        if doc_norm is not None:
+            self.columnas.append(COL_DOC_NORM)
+
+    def ddl(self):
+        cols = ", ".join(f"{_q(c)} TEXT" if c != COL_ORDEN else f"{_q(c)} INTEGER" for c in self.columnas)
+        if self.clave:
+            cols += f", PRIMARY KEY ({', '.join(map(_q, self.clave))})"
+        sql = [f"CREATE TABLE IF NOT EXISTS {_q(self.nombre)} ({cols})"]
+        for ix in [(COL_ZIP,)] + self.indices:
+            nombre_ix = f"ix_{self.nombre}_{'_'.join(ix)}"
+            sql.append(f"CREATE INDEX IF NOT EXISTS {_q(nombre_ix)} ON {_q(self.nombre)} ({', '.join(map(_q, ix))})")
+        return sql
+
+    def sql_insert(self):
+        cols = ", ".join(map(_q, self.columnas))
+        marcas = ", ".join("?" for _ in self.columnas)
+        sql = f"INSERT INTO {_q(self.nombre)} ({cols}) VALUES ({marcas})"
+        if self.clave:
+            resto = [c for c in self.columnas if c not in self.clave]
+            # El primer ZIP que trae un documento es su dueño: un ZIP duplicado no lo pisa
+            sql += f" ON CONFLICT ({', '.join(map(_q, self.clave))}) DO UPDATE SET " + \
+                   ", ".join(f"{_q(c)} = excluded.{_q(c)}" for c in resto) + \
+                   f" WHERE {_q(COL_ZIP)} = excluded.{_q(COL_ZIP)}"
+        return sql
+
+    def valores(self, zname, rows):
+        doc_col = self.clave[0] if self.clave and COL_ORDEN in self.clave else None
+        orden = {}
+        for r in rows:
+            v = [r.get(f) or "" for f in self.fields]
+            v.append(zname)
+            if doc_col is not None:
+                k = r.get(doc_col) or ""
+                orden[k] = orden.get(k, 0) + 1
+                v.append(orden[k])
+            if self.doc_norm is not None:
+                v.append(self.doc_norm(r.get("NumeroDocumento")))
+            yield v
+
+class AlmacenSQLite:
+    """
+    tablas: lista de Tabla en el mismo orden que las filas de cada ZIP (SALIDAS_POR_ZIP);
+    la primera es la de documentos: la tabla zip_docs guarda qué claves trajo cada ZIP (sea o no el
+    dueño de la fila), para saber qué duplicados re-ingerir cuando se borra el ZIP dueño.
+    """
+
+    def __init__(self, path, tablas):
+        self.path = path
+        self.tablas = tablas
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # check_same_thread=False: con --pipeline las filas se agregan desde el hilo escritor
+        self.con = sqlite3.connect(path, check_same_thread=False)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute("PRAGMA synchronous=NORMAL")
+        with self.con:
+            for t in tablas:
+                for sql in t.ddl():
+                    self.con.execute(sql)
+            self.con.execute("CREATE TABLE IF NOT EXISTS zips (zip TEXT PRIMARY KEY, sha256 TEXT, docs INTEGER)")
+            self.con.execute("CREATE TABLE IF NOT EXISTS zip_docs (zip TEXT, clave TEXT, PRIMARY KEY (zip, clave))")
+            self.con.execute("CREATE INDEX IF NOT EXISTS ix_zip_docs_clave ON zip_docs (clave)")
+        self.inserts = [t.sql_insert() for t in tablas]
+        self.ingeridos = {}
+        self.pendientes = 0
+        self.n_ingeridos = 0
+
+    def preparar(self, firmas):
+        """
+        Borra las filas de ZIP que ya no están o cambiaron (sha256 distinto) y olvida solo los ZIP
+        duplicados que traían algún documento cuyo dueño era uno de esos (se re-ingieren y uno
+        de ellos pasa a ser el dueño). Los demás duplicados no se tocan.
+        firmas: {zip: {"sha256": ...}} de los ZIP vigentes.
+        """
+        previos = dict(self.con.execute("SELECT zip, sha256 FROM zips"))
+        borrar = [z for z, sha in previos.items() if z not in firmas or firmas[z]["sha256"] != sha]
+        incompletos = []
+        with self.con:
+            if borrar:
+                incompletos = self._duplicados_de(borrar)
+            self._borrar(borrar + incompletos)
+            if borrar:
+                incompletos += self._incompletos_sin_registro()
+        self.ingeridos = dict(self.con.execute("SELECT zip, sha256 FROM zips"))
+        return len(borrar), len(incompletos)
+
+    def _duplicados_de(self, zips):
+        """ZIP (fuera de `zips`) que trajeron alguna clave cuya fila es de uno de `zips`."""
+        docs = self.tablas[0]
+        if not docs.clave:
+            return []
+        self.con.execute("CREATE TEMP TABLE IF NOT EXISTS borrar_zips (zip TEXT PRIMARY KEY)")
+        self.con.execute("DELETE FROM borrar_zips")
+        self.con.executemany("INSERT OR IGNORE INTO borrar_zips (zip) VALUES (?)", [(z,) for z in zips])
+        return [z for (z,) in self.con.execute(
+            f"SELECT DISTINCT zd.zip FROM zip_docs zd JOIN {_q(docs.nombre)} d ON d.{_q(docs.clave[0])} = zd.clave "
+            f"WHERE d.{_q(COL_ZIP)} IN (SELECT zip FROM borrar_zips) AND zd.zip NOT IN (SELECT zip FROM borrar_zips) "
+            f"ORDER BY zd.zip")]
+
+    def _incompletos_sin_registro(self):
+        # Almacenes de antes de zip_docs: para esos ZIP solo queda comparar cuántos documentos son dueños
+        docs = self.tablas[0]
+        reales = dict(self.con.execute(
+            f"SELECT {_q(COL_ZIP)}, COUNT(*) FROM {_q(docs.nombre)} GROUP BY {_q(COL_ZIP)}"))
+        incompletos = [z for z, n in self.con.execute(
+            "SELECT zip, docs FROM zips WHERE docs > 0 AND zip NOT IN (SELECT zip FROM zip_docs)")
+            if reales.get(z, 0) < n]
+        self._borrar(incompletos)
+        return incompletos
+
+    def _borrar(self, zips):
+        params = [(z,) for z in zips]
+        for t in self.tablas:
+            self.con.executemany(f"DELETE FROM {_q(t.nombre)} WHERE {_q(COL_ZIP)} = ?", params)
+        self.con.executemany("DELETE FROM zips WHERE zip = ?", params)
+        self.con.executemany("DELETE FROM zip_docs WHERE zip = ?", params)
+
+    def agregar(self, zname, sha256, filas):
+        """Upsert de las filas de un ZIP; no hace nada si ese ZIP ya está con el mismo sha256."""
+        if self.ingeridos.get(zname) == sha256:
+            return False
+        for t, sql, rows in zip(self.tablas, self.inserts, filas):
+            if rows:
+                self.con.executemany(sql, t.valores(zname, rows))
+                self.pendientes += len(rows)
+        docs = self.tablas[0]
+        if docs.clave:
+            claves = {r.get(docs.clave[0]) or "" for r in filas[0]}
+            self.con.executemany("INSERT OR IGNORE INTO zip_docs (zip, clave) VALUES (?, ?)",
+                                 [(zname, k) for k in claves])
+            n_docs = len(claves)
+        else:
+            n_docs = len(filas[0])
+        self.con.execute("INSERT OR REPLACE INTO zips (zip, sha256, docs) VALUES (?, ?, ?)", (zname, sha256, n_docs))
+        self.ingeridos[zname] = sha256
+        self.n_ingeridos += 1
+        if self.pendientes >= LOTE_FILAS:
+            self.con.commit()
+            self.pendientes = 0
+        return True
+
+    def marcar_anulados(self, docs_anulados):
+        """EsAnulado de las facturas (Invoice) según el set (RUC emisor, documento normalizado)."""
+        t = _q(self.tablas[0].nombre)
+        with self.con:
+            self.con.execute(f"UPDATE {t} SET EsAnulado = 'NO' WHERE TipoDocumentoXML = 'Invoice' AND EsAnulado <> 'NO'")
+            self.con.executemany(
+                f"UPDATE {t} SET EsAnulado = 'SI' WHERE RUC_Emisor = ? AND {_q(COL_DOC_NORM)} = ? "
+                f"AND TipoDocumentoXML = 'Invoice'",
+                docs_anulados,
+            )
+
+    def cerrar(self):
+        self.con.commit()
+        self.con.close()
+
+    def abortar(self):
+        # Lo no confirmado se descarta; los ZIP de lotes ya confirmados quedan como ingeridos
+        self.con.rollback()
+        self.con.close()
+
+# =========================
+# Consultas / exportación
+# =========================
+def exportar_csv(con, tabla, fields, path):
+    """CSV de una tabla con las columnas originales (orden: ZIP y orden de llegada)."""
+    cur = con.execute(f"SELECT {', '.join(map(_q, fields))} FROM {_q(tabla)} ORDER BY {_q(COL_ZIP)}, rowid")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(fields)
+        w.writerows(cur)
+
+def columnas_csv(con, tabla):
+    internas = {COL_ZIP, COL_ORDEN, COL_DOC_NORM}
+    return [r[1] for r in con.execute(f"PRAGMA table_info({_q(tabla)})") if r[1] not in internas]
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Consultas / exportación del almacén SQLite de main.py --sqlite")
+    ap.add_argument("db", help="Ruta del .sqlite (ej. salida_csv/etl.sqlite)")
+    ap.add_argument("--consulta", metavar="SQL", help="Ejecuta una consulta y la imprime como CSV")
+    ap.add_argument("--exportar", metavar="DIR", help="Escribe un CSV por tabla en DIR")
+    args = ap.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        print(f"⚠️ No existe {args.db}")
+        return 1
+    con = sqlite3.connect(args.db)
+    try:
+        if args.consulta:
+            cur = con.execute(args.consulta)
+            w = csv.writer(sys.stdout)
+            w.writerow([d[0] for d in cur.description or []])
+            w.writerows(cur)
+        if args.exportar:
+            tablas = [r[0] for r in con.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT IN ('zips', 'zip_docs')")]
+            for tabla in tablas:
+                path = os.path.join(args.exportar, f"{tabla}.csv")
+                exportar_csv(con, tabla, columnas_csv(con, tabla), path)
+                print(f"{tabla} -> {path}")
+    finally:
+        con.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+# consolidacion_productos.py
+# Consolidación automática de ProductoStd parecidos (main_dim_productos.py, columnas ProductoId /
+# ProductoCanonico / Confianza), para los typos que las variantes del archivo de reglas no cubren.
+#
+# 1) Palabras: cada palabra alfabética de MIN_LARGO+ letras se indexa por sí misma y por sus
+#    borrados de una letra (DRYZA -> RYZA, DYZA, DRZA, DRYA, DRYZ). Dos palabras con una clave en
+#    común están a 1 edición (cambio, letra de más/de menos o dos letras vecinas invertidas): solo
+#    esos pares se comparan, así el costo crece con el vocabulario, no con pares de descripciones.
+#    Las palabras se agrupan en estrella: la más frecuente (o la que usa una regla) absorbe a sus
+#    vecinas; nunca se encadena (A~B~C no junta A con C) y dos palabras de las reglas no se juntan.
+#    Números y medidas (2MM, 48/210) no se tocan: una letra de diferencia ahí es otro producto.
+# 2) Descripciones: clave = palabras corregidas, sin repetir y ordenadas (mismo producto aunque
+#    cambie el orden). Todas las ProductoStd con la misma clave son un producto: su canónico es la
+#    ProductoStd más frecuente del grupo y Confianza es el parecido (bigramas de letras, 0 a 1) de
+#    cada descripción con ese canónico.
+
+import hashlib
+from collections import Counter
+
+MIN_LARGO = 5
+
+def _borrados(palabra):
+    return [palabra[:i] + palabra[i + 1:] for i in range(len(palabra))]
+
+def corregir_palabras(frecuencias, protegidas=(), min_largo=MIN_LARGO):
+    """
+    frecuencias: {palabra: en cuántas descripciones está}. Retorna {palabra: palabra canónica}
+    solo para las que cambian.
+    """
+    protegidas = set(protegidas)
+    candidatas = [p for p in frecuencias if len(p) >= min_largo and p.isalpha()]
+
+    # Índice clave -> palabras (la palabra misma + sus borrados)
+    indice = {}
+    for p in candidatas:
+        for clave in [p] + _borrados(p):
+            indice.setdefault(clave, []).append(p)
+
+    # Centros: primero las palabras de las reglas, después por frecuencia
+    orden = sorted(candidatas, key=lambda p: (p not in protegidas, -frecuencias[p]))
+    asignada = {}
+    for centro in orden:
+        if centro in asignada:
+            continue
+        asignada[centro] = centro
+        for clave in [centro] + _borrados(centro):
+            for vecina in indice[clave]:
+                if vecina not in asignada and vecina not in protegidas:
+                    asignada[vecina] = centro
+    return {p: c for p, c in asignada.items() if p != c}
+
+def _bigramas(s):
+    return {s[i:i + 2] for i in range(len(s) - 1)}
+
+def parecido(a, b):
+    """Coeficiente de Dice sobre bigramas de letras (1.0 = iguales)."""
+    if a == b:
+        return 1.0
+    x, y = _bigramas(a), _bigramas(b)
+    if not x or not y:
+        return 0.0
+    return 2 * len(x & y) / (len(x) + len(y))
+
+def producto_id(clave):
+    # Estable entre corridas mientras el grupo tenga la misma clave
+    return hashlib.sha1(clave.encode("utf-8")).hexdigest()[:12]
+
+def consolidar(productos_std, protegidas=(), min_largo=MIN_LARGO):
+    """
+    productos_std: un ProductoStd por fila de la dimensión (con repetidos).
+    Retorna (ids, canonicos, confianzas, stats): tres listas alineadas con la entrada + un dict.
+    """
+    # Frecuencia de cada ProductoStd (cuántos Producto_PBI caen en él) y de cada palabra
+    por_std = Counter(productos_std)
+    tokens = {std: set(std.split(" ")) if std else set() for std in por_std}
+    palabras = {}
+    for std, n in por_std.items():
+        for p in tokens[std]:
+            palabras[p] = palabras.get(p, 0) + n
+
+    correccion = corregir_palabras(palabras, protegidas, min_largo)
+
+    claves = {}
+    grupos = {}   # clave -> ProductoStd más frecuente (el primero visto si empatan)
+    for std, n in por_std.items():
+        ts = tokens[std]
+        clave = " ".join(sorted({correccion.get(p, p) for p in ts}))
+        claves[std] = clave
+        actual = grupos.get(clave)
+        if actual is None or n > por_std[actual]:
+            grupos[clave] = std
+
+    resultado = {}
+    for std, clave in claves.items():
+        canonico = grupos[clave]
+        resultado[std] = (producto_id(clave), canonico, round(parecido(std, canonico), 3))
+
+    ids, canonicos, confianzas = zip(*(resultado[s] for s in productos_std)) if productos_std else ((), (), ())
+    stats = {"productos_std": len(por_std), "canonicos": len(grupos), "palabras_corregidas": len(correccion)}
+    return list(ids), list(canonicos), list(confianzas), stats
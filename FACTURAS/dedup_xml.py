@@ -0,0 +1,157 @@
+# dedup_xml.py
+# Deduplicación por contenido de los XML (main.py --dedup).
+#
+# El control de duplicados de siempre mira solo el nombre del ZIP. Aquí se guarda el sha256 de
+# cada XML y su DocumentoKey:
+#   - mismo contenido que un XML ya visto en otro ZIP -> no se parsea (o se descartan sus filas)
+#   - mismo DocumentoKey con contenido distinto        -> conflicto: queda el primero y se reporta
+#
+# Se persiste en salida_csv/dedup_xml.json, así un histórico re-descargado con otros nombres de ZIP
+# se salta sin parsear. Un XML es "dueño" de su hash; si su ZIP cambia o se borra, los ZIP que lo
+# tenían como duplicado se vuelven a procesar (uno de ellos pasa a ser el dueño).
+
+import os
+import json
+import hashlib
+
+DEDUP_VERSION = 1
+DEDUP_NOMBRE = "dedup_xml.json"
+
+CONFLICTOS_FIELDS = [
+    "DocumentoKey", "ZIP", "ArchivoXML", "Hash",
+    "ZIP_Original", "ArchivoXML_Original", "Hash_Original",
+]
+
+def hash_xml(src):
+    """sha256 del XML (BytesIO en memoria o ruta en disco)."""
+    if hasattr(src, "getbuffer"):
+        return hashlib.sha256(src.getbuffer()).hexdigest()
+    with open(src, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+class VistaDedup:
+    """
+    Lo que necesita process_zip para saltarse XML ya vistos (en un worker es una copia de los
+    hashes al inicio de la corrida). Junta en xml_info una entrada por XML:
+    (ArchivoXML, hash, DocumentoKey, filas aportadas a cada salida, omitido).
+    """
+
+    def __init__(self, hashes):
+        self.hashes = hashes
+        self.xml_info = []
+
+    def omitir(self, h, zname, archivo):
+        dueno = self.hashes.get(h)
+        return dueno is not None and (dueno[0], dueno[1]) != (zname, archivo)
+
+class DedupXML:
+    def __init__(self, path=None, zips=None, hashes=None, claves=None, referencias=None):
+        self.path = path
+        self.firmas = {}                      # de la corrida actual (ver preparar)
+        self.zips = zips or {}                # zip -> sha256 del ZIP cuando se registraron sus XML
+        self.hashes = hashes or {}            # hash -> [zip, ArchivoXML, DocumentoKey] (dueño)
+        self.claves = claves or {}            # DocumentoKey -> hash del dueño
+        self.referencias = referencias or {}  # zip -> [[tipo, ArchivoXML, hash, DocumentoKey, zip_dueño, xml_dueño, hash_dueño]]
+        self.n_duplicados = 0
+        self.n_conflictos = 0
+
+    @classmethod
+    def cargar(cls, path):
+        """Lee el estado anterior; si no existe, es de otra versión o está dañado, parte vacío."""
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == DEDUP_VERSION:
+                    return cls(path, data["zips"], data["hashes"], data["claves"], data["referencias"])
+            except (OSError, ValueError, KeyError):
+                pass
+        return cls(path)
+
+    def guardar(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": DEDUP_VERSION, "zips": self.zips, "hashes": self.hashes, "claves": self.claves,
+                       "referencias": self.referencias}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def preparar(self, firmas, reutilizar):
+        """
+        Antes de procesar (firmas: {zip: {"sha256": ...}} de los ZIP vigentes):
+          - olvida los XML de ZIP modificados o borrados (sha256 distinto al registrado)
+          - retorna los ZIP de `reutilizar` que se deben re-procesar igual: los que nunca pasaron
+            por --dedup y los que tenían como dueño a un ZIP olvidado
+          - borra las referencias de todo lo que se va a parsear (se vuelven a registrar)
+        """
+        self.firmas = firmas
+        validos = {z for z, sha in self.zips.items() if z in firmas and firmas[z]["sha256"] == sha}
+        self.zips = {z: self.zips[z] for z in validos}
+        for h in [h for h, d in self.hashes.items() if d[0] not in validos]:
+            _, _, key = self.hashes.pop(h)
+            if self.claves.get(key) == h:
+                del self.claves[key]
+
+        forzar = {z for z in reutilizar
+                  if z not in validos or any(r[4] not in validos for r in self.referencias.get(z, []))}
+        vigentes_reutilizados = set(reutilizar) - forzar
+        self.referencias = {z: refs for z, refs in self.referencias.items() if z in vigentes_reutilizados}
+        return forzar
+
+    def vista(self):
+        return VistaDedup(self.hashes)
+
+    def filtrar(self, zname, filas, xml_info):
+        """
+        Descarta de `filas` (las 6 salidas de un ZIP) las de XML duplicados o en conflicto,
+        usando cuántas filas aportó cada XML (en el mismo orden en que se agregaron).
+        """
+        self.zips[zname] = self.firmas[zname]["sha256"]
+        if not xml_info:
+            return filas
+        nuevas = tuple([] for _ in filas)
+        pos = [0] * len(filas)
+        refs = []
+        for archivo, h, key, conteos, omitido in xml_info:
+            queda = True
+            if omitido or key:
+                dueno = self.hashes.get(h)
+                if dueno is not None and (dueno[0], dueno[1]) != (zname, archivo):
+                    queda = False
+                    refs.append(["DUPLICADO", archivo, h, dueno[2], dueno[0], dueno[1], h])
+                    self.n_duplicados += 1
+                elif dueno is None:
+                    h0 = self.claves.get(key)
+                    if h0 is not None and h0 != h:
+                        d0 = self.hashes[h0]
+                        queda = False
+                        refs.append(["CONFLICTO", archivo, h, key, d0[0], d0[1], h0])
+                        self.n_conflictos += 1
+                    else:
+                        self.hashes[h] = [zname, archivo, key]
+                        self.claves[key] = h
+            for i, n in enumerate(conteos):
+                if queda:
+                    nuevas[i].extend(filas[i][pos[i]:pos[i] + n])
+                pos[i] += n
+        # Filas que no vienen de un XML en particular (no debería haber, pero no se pierden)
+        for i, f in enumerate(filas):
+            nuevas[i].extend(f[pos[i]:])
+        if refs:
+            self.referencias[zname] = refs
+        return nuevas
+
+    def conflictos(self, zips):
+        """Filas de conflictos_xml.csv para los ZIP vigentes, en el orden de `zips`."""
+        rows = []
+        for z in zips:
+            for tipo, archivo, h, key, z0, x0, h0 in self.referencias.get(z, []):
+                if tipo == "CONFLICTO":
+                    rows.append({
+                        "DocumentoKey": key, "ZIP": z, "ArchivoXML": archivo, "Hash": h,
+                        "ZIP_Original": z0, "ArchivoXML_Original": x0, "Hash_Original": h0,
+                    })
+        return rows
+
+    def omitidos(self, zips):
+        return sum(1 for z in zips for r in self.referencias.get(z, []) if r[0] == "DUPLICADO")
@@ -0,0 +1,105 @@
+# indice_anulaciones.py
+# Índice persistente de documentos anulados (NCE motivo 01), compartido por FACTURAS/main.py
+# y NOTAS DE CREDITO/main.py.
+#
+# Clave: (RUC emisor, documento referenciado normalizado con norm_doc_id). Así "E001 - 1093"
+# y "E001-1093" calzan, y una NCE de un RUC nunca anula la factura de otro RUC con el mismo número.
+#
+# Cada pipeline reemplaza en cada corrida solo sus propias entradas ("origen"), así el índice no
+# acumula NCE de ZIPs borrados y una NCE que llega semanas después a la carpeta de notas marca la
+# factura correcta sin volver a parsear los XML de facturas.
+
+import os
+import csv
+import json
+
+from nota_credito import norm_doc_id
+
+INDICE_VERSION = 1
+INDICE_NOMBRE = "indice_anulaciones.json"
+
+def clave_anulacion(ruc_emisor, doc_id):
+    return (ruc_emisor or "").strip(), norm_doc_id(doc_id)
+
+def es_anulado(tipo_doc, numero_doc, ruc_emisor, docs_anulados):
+    # Solo tiene sentido marcar anulados a documentos "Invoice" (None = no aplica, se deja igual)
+    if tipo_doc != "Invoice":
+        return None
+    clave = clave_anulacion(ruc_emisor, numero_doc)
+    return "SI" if clave[1] and clave in docs_anulados else "NO"
+
+class IndiceAnulaciones:
+    """
+    {origen: [[ruc_emisor, doc_referencia_norm, numero_nce, fecha_nce], ...]} en JSON.
+    claves() da el set (ruc, doc) para marcar en O(1) por factura.
+    """
+
+    def __init__(self, path=None, por_origen=None):
+        self.path = path
+        self.por_origen = por_origen or {}
+
+    @classmethod
+    def cargar(cls, path):
+        """Lee el índice; si no existe, es de otra versión o está dañado, parte vacío."""
+        por_origen = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == INDICE_VERSION:
+                    por_origen = data.get("origenes", {})
+            except (OSError, ValueError):
+                pass
+        return cls(path, por_origen)
+
+    def reemplazar(self, origen, registros):
+        """registros: (ruc_emisor, doc_referencia, numero_nce, fecha_nce); descarta los sin referencia."""
+        filas = []
+        for ruc, ref, nce, fecha in registros:
+            ruc, ref = clave_anulacion(ruc, ref)
+            if ref:
+                filas.append([ruc, ref, nce or "", fecha or ""])
+        self.por_origen[origen] = filas
+
+    def claves(self, excluir=None):
+        return {(r[0], r[1]) for origen, filas in self.por_origen.items() if origen != excluir for r in filas}
+
+    def guardar(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": INDICE_VERSION, "origenes": self.por_origen}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+def marcar_csv(src, dst, docs_anulados, cambios=None):
+    """
+    Copia src -> dst fila por fila completando EsAnulado (columnas por nombre de la cabecera).
+    src y dst pueden ser el mismo archivo: se escribe en dst.tmp y se reemplaza al final.
+    Si se pasa la lista `cambios`, se le agregan (como dict) las filas cuyo EsAnulado cambió.
+    Retorna (anulados, cambiados).
+    """
+    n_anulados = 0
+    n_cambiados = 0
+    tmp = dst + ".tmp"
+    with open(src, "r", newline="", encoding="utf-8") as fin, \
+            open(tmp, "w", newline="", encoding="utf-8") as fout:
+        r = csv.reader(fin)
+        w = csv.writer(fout)
+        cabecera = next(r)
+        w.writerow(cabecera)
+        i_tipo = cabecera.index("TipoDocumentoXML")
+        i_num = cabecera.index("NumeroDocumento")
+        i_ruc = cabecera.index("RUC_Emisor")
+        i_anulado = cabecera.index("EsAnulado")
+        for row in r:
+            marca = es_anulado(row[i_tipo], row[i_num], row[i_ruc], docs_anulados)
+            if marca is not None:
+                if row[i_anulado] != marca:
+                    n_cambiados += 1
+                    row[i_anulado] = marca
+                    if cambios is not None:
+                        cambios.append(dict(zip(cabecera, row)))
+                n_anulados += marca == "SI"
+            w.writerow(row)
+    os.replace(tmp, dst)
+    return n_anulados, n_cambiados
@@ -1,12 +1,30 @@
 import os
+import io
+import time
+import argparse
 import re
-import zipfile
-import shutil
 import csv
-import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from manifest_zip import (
+    load_manifest, save_manifest, classify_zips, iter_segments, merge_segments, ManifestMismatch,
+)
+from ubl_extractor import HEADER_PATHS, DISCREPANCY_GROUP, line_group, compile_spec, extract
+from zip_io import TMP_DIR, load_zip_xmls, iter_zip_xml_streams, write_csv
+from nota_credito import NC_FIELDS, NC_ITEMS_FIELDS, CREDITNOTE_SPEC, creditnote_rows, norm_doc_id
+from salida_columnar import PARQUET_DIR, check_pyarrow, export_parquet
+from metricas import Metricas, SIN_METRICAS
+from indice_anulaciones import INDICE_NOMBRE, IndiceAnulaciones, clave_anulacion, es_anulado, marcar_csv
+from almacen_sqlite import AlmacenSQLite, Tabla
+from vigilancia import vigilar
+from pipeline import Pipeline, Escritor
+from dedup_xml import DEDUP_NOMBRE, CONFLICTOS_FIELDS, DedupXML, VistaDedup, hash_xml
+from ubl_parsers import PARSER_DEFAULT, PARSERS, parse_cabecera, parser_en_uso, usar_parser
+from agregados_ventas import AgregadosVentas, anuladas_csv, leer_filas
+from verificacion_zip import VERIFICACION_NOMBRE, VERIFICACION_FIELDS, verificar_zips
 
 ZIP_DIR = "descargas_zip"
-TMP_DIR = "_tmp_extract"
 OUT_DIR = "salida_csv"
 
 FACTURAS_CSV = os.path.join(OUT_DIR, "facturas.csv")
@@ -15,82 +33,194 @@ ERRORES_CSV = os.path.join(OUT_DIR, "errores.csv")
 
 # NUEVO: control
 RESUMEN_CONTROL_CSV = os.path.join(OUT_DIR, "resumen_control.csv")
-FALTANTES_CSV = os.path.join(OUT_DIR, "faltantes.csv")
+FALTANTES_CSV = os.path.join(OUT_DIR, "faltantes.csv")  # rangos Desde-Hasta
+FALTANTES_DETALLE_CSV = os.path.join(OUT_DIR, "faltantes_detalle.csv")  # uno por número (--faltantes-detalle)
 DUPLICADOS_CSV = os.path.join(OUT_DIR, "duplicados.csv")
+VERIFICACION_ZIP_CSV = os.path.join(OUT_DIR, VERIFICACION_NOMBRE)  # --verificar-zip
+# --solo-cabeceras: archivos propios, no pisan facturas / anulaciones / errores del ETL
+FACTURAS_CABECERA_CSV = os.path.join(OUT_DIR, "facturas_cabecera.csv")
+ANULACIONES_CABECERA_CSV = os.path.join(OUT_DIR, "anulaciones_cabecera.csv")
+ERRORES_CABECERA_CSV = os.path.join(OUT_DIR, "errores_cabecera.csv")
 
 # NUEVO: anulaciones (NCE motivo 01)
 ANULACIONES_CSV = os.path.join(OUT_DIR, "anulaciones.csv")
 
-# Pon aquí tu total esperado
-TOTAL_ESPERADO = 1128
+# NUEVO: notas de crédito (mismas columnas que NOTAS DE CREDITO/main.py), ingesta unificada
+NC_CSV = os.path.join(OUT_DIR, "notas_credito.csv")
+NC_ITEMS_CSV = os.path.join(OUT_DIR, "notas_credito_items.csv")
 
-# Namespaces UBL (como tu XML)
-NS = {
-    "cbc": "urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2",
-    "cac": "urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2",
-}
+# NUEVO: manifest para corridas incrementales (--incremental)
+MANIFEST_JSON = os.path.join(OUT_DIR, "manifest_zip.json")
 
-def t(elem):
-    return (elem.text or "").strip() if elem is not None else ""
+# NUEVO: índice persistente de anulaciones (compartido con NOTAS DE CREDITO/main.py)
+INDICE_JSON = os.path.join(OUT_DIR, INDICE_NOMBRE)
 
-def find1(root, path):
-    return root.find(path, NS)
+# NUEVO: deduplicación por contenido de XML (--dedup)
+DEDUP_JSON = os.path.join(OUT_DIR, DEDUP_NOMBRE)
+CONFLICTOS_XML_CSV = os.path.join(OUT_DIR, "conflictos_xml.csv")
 
-def findall(root, path):
-    return root.findall(path, NS)
+# NUEVO: almacén SQLite opcional (--sqlite)
+SQLITE_DB = os.path.join(OUT_DIR, "etl.sqlite")
 
-def extract_zip(zip_path, extract_to):
-    with zipfile.ZipFile(zip_path, "r") as z:
-        z.extractall(extract_to)
+# NUEVO: instrumentación opcional (--metricas / --perfil)
+METRICAS_JSON = os.path.join(OUT_DIR, "metricas.json")
+PERFIL_PROF = os.path.join(OUT_DIR, "perfil.prof")
 
-def find_xmls(folder):
-    xmls = []
-    for rootdir, _, files in os.walk(folder):
-        for f in files:
-            if f.lower().endswith(".xml"):
-                xmls.append(os.path.join(rootdir, f))
-    return xmls
+# =========================
+# CAMPOS DE SALIDA
+# =========================
+FACTURAS_FIELDS = [
+    "DocumentoKey", "ZIP_Origen", "ArchivoXML",
+    "TipoDocumentoXML", "NumeroDocumento",
+    "FechaEmision", "HoraEmision", "Moneda",
+    "RUC_Emisor", "Nombre_Emisor",
+    "RUC_Receptor", "Nombre_Receptor",
+    "FormaPago",
+    "BaseImponible", "IGV", "SubtotalSinIGV", "Total",
+
+    # NCE
+    "DocReferencia", "MotivoCodigo", "MotivoDescripcion", "EsAnulacionOperacion",
+
+    # Lo que tú quieres para filtrar en Power BI
+    "EsAnulado",
+]
+
+ITEMS_FIELDS = [
+    "DocumentoKey", "TipoDocumentoXML", "NumeroDocumento", "FechaEmision",
+    "LineaID", "Descripcion", "Cantidad", "Unidad",
+    "PrecioUnitario", "ValorLineaSinIGV", "ImpuestoLinea",
+    "RUC_Receptor", "Nombre_Receptor",
+]
+
+ERRORES_FIELDS = ["ZIP_Origen", "ArchivoXML", "Error"]
+
+ANULACIONES_FIELDS = [
+    "ZIP_Origen", "ArchivoXML",
+    "NumeroNCE", "FechaNCE",
+    "DocReferencia",
+    "MotivoCodigo", "MotivoDescripcion",
+    "RUC_Emisor", "RUC_Receptor",
+    "TotalNCE", "Moneda"
+]
+
+# Salidas que se arman por ZIP, en el mismo orden que devuelve process_zip()
+SALIDAS_POR_ZIP = [
+    (FACTURAS_CSV, FACTURAS_FIELDS),
+    (ITEMS_CSV, ITEMS_FIELDS),
+    (ERRORES_CSV, ERRORES_FIELDS),
+    (ANULACIONES_CSV, ANULACIONES_FIELDS),
+    (NC_CSV, NC_FIELDS),
+    (NC_ITEMS_CSV, NC_ITEMS_FIELDS),
+]
+
+# Tablas que se exportan con --parquet: (nombre, csv, campos, fecha para particionar)
+TABLAS_PARQUET = [
+    ("facturas", FACTURAS_CSV, FACTURAS_FIELDS, "FechaEmision"),
+    ("items", ITEMS_CSV, ITEMS_FIELDS, "FechaEmision"),
+    ("anulaciones", ANULACIONES_CSV, ANULACIONES_FIELDS, "FechaNCE"),
+    ("notas_credito", NC_CSV, NC_FIELDS, "FechaEmision"),
+    ("notas_credito_items", NC_ITEMS_CSV, NC_ITEMS_FIELDS, "FechaEmision"),
+]
+
+# Tablas de --sqlite, en el mismo orden que SALIDAS_POR_ZIP: (clave del upsert, índices)
+TABLAS_SQLITE = [
+    Tabla("facturas", FACTURAS_FIELDS, ["DocumentoKey"],
+          [("RUC_Emisor", "DocNorm"), ("RUC_Receptor", "FechaEmision"), ("FechaEmision",), ("DocReferencia",)],
+          doc_norm=norm_doc_id),
+    Tabla("items", ITEMS_FIELDS, ["DocumentoKey", "Orden"],
+          [("RUC_Receptor", "FechaEmision"), ("FechaEmision",)]),
+    Tabla("errores", ERRORES_FIELDS),
+    Tabla("anulaciones", ANULACIONES_FIELDS, ["RUC_Emisor", "NumeroNCE"],
+          [("RUC_Emisor", "DocReferencia"), ("FechaNCE",)]),
+    Tabla("notas_credito", NC_FIELDS, ["NotaCreditoKey"],
+          [("RUC_Emisor", "DocReferencia_Normalizado"), ("RUC_Receptor", "FechaEmision"), ("FechaEmision",)]),
+    Tabla("notas_credito_items", NC_ITEMS_FIELDS, ["NotaCreditoKey", "Orden"]),
+]
+
+# Pon aquí tu total esperado (por defecto para toda serie; por RUC/serie ver --esperados)
+TOTAL_ESPERADO = 1128
 
-def write_csv(path, rows, fieldnames):
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=fieldnames)
-        w.writeheader()
-        for r in rows:
-            w.writerow(r)
+FALTANTES_FIELDS = ["Serie", "RUC", "Desde", "Hasta", "Cantidad"]
+FALTANTES_DETALLE_FIELDS = ["Serie", "RUC", "NumeroFaltante"]
 
 # =========================
 # CONTROL: Parseo nombre ZIP
 # =========================
-ZIP_RE = re.compile(r"^FACTURA([A-Z]\d{3})-(\d+)(\d{11})\.zip$", re.IGNORECASE)
+# Número y RUC van pegados: los últimos 11 dígitos son el RUC (se corta en Python, sin backtracking)
+ZIP_RE = re.compile(r"^FACTURA([A-Z]\d{3})-(\d{12,})\.zip$", re.IGNORECASE)
 
 def parse_zip_filename(zip_name):
     m = ZIP_RE.match(zip_name)
     if not m:
         return None
     serie = m.group(1).upper()
-    num_str = m.group(2)
-    ruc = m.group(3)
+    digitos = m.group(2)
+    num_str = digitos[:-11]
+    ruc = digitos[-11:]
     numero = int(num_str)
     return {"serie": serie, "numero": numero, "ruc": ruc}
 
-def control_faltantes(zips, total_esperado):
-    parsed = []
+def load_esperados(path):
+    """
+    Totales esperados por (RUC, serie) desde un CSV con columnas RUC, Serie, TotalEsperado.
+    RUC vacío o "*" aplica a la serie con cualquier RUC. Retorna {(ruc o None, serie): total}.
+    """
+    esperados = {}
+    with open(path, "r", newline="", encoding="utf-8-sig") as f:
+        for r in csv.DictReader(f):
+            serie = (r.get("Serie") or "").strip().upper()
+            if not serie:
+                continue
+            ruc = (r.get("RUC") or "").strip()
+            esperados[(ruc if ruc not in ("", "*") else None, serie)] = int(r["TotalEsperado"])
+    return esperados
+
+def rangos_faltantes(nums):
+    """Huecos de una lista ordenada de números únicos, como [(desde, hasta), ...]."""
+    rangos = []
+    for a, b in zip(nums, nums[1:]):
+        if b > a + 1:
+            rangos.append((a + 1, b - 1))
+    return rangos
+
+def expandir_faltantes(faltantes_rows):
+    """Vista expandida (una fila por número, formato antiguo de faltantes.csv), sin materializarla."""
+    for r in faltantes_rows:
+        for n in range(r["Desde"], r["Hasta"] + 1):
+            yield {"Serie": r["Serie"], "RUC": r["RUC"], "NumeroFaltante": n}
+
+def control_faltantes(zips, total_esperado, esperados=None):
+    """
+    Control de correlativos por (serie, RUC) en una sola pasada sobre los nombres de ZIP.
+    Los faltantes salen como rangos (Desde, Hasta, Cantidad): un correlativo absurdo en un
+    nombre genera una fila, no millones. esperados: {(ruc o None, serie): total} (ver
+    load_esperados); lo que no está ahí usa total_esperado.
+    """
+    esperados = esperados or {}
+    grupos = {}   # (serie, ruc) -> {numero: primer ZIP}
+    repetidos = {}   # (serie, ruc) -> {numero: [ZIPs repetidos]}
     no_parseables = []
 
     for z in zips:
         info = parse_zip_filename(z)
-        if info:
-            info["zip"] = z
-            parsed.append(info)
-        else:
+        if not info:
             no_parseables.append(z)
+            continue
+        key = (info["serie"], info["ruc"])
+        nums = grupos.get(key)
+        if nums is None:
+            nums = grupos[key] = {}
+        n = info["numero"]
+        if n in nums:
+            repetidos.setdefault(key, {}).setdefault(n, []).append(z)
+        else:
+            nums[n] = z
 
     resumen_rows = []
     faltantes_rows = []
     duplicados_rows = []
 
-    if not parsed:
+    if not grupos:
         resumen_rows.append({
             "Serie": "",
             "RUC": "",
@@ -105,55 +235,42 @@ def control_faltantes(zips, total_esperado):
             "TotalEsperado": total_esperado,
             "Diferencia_Esperado_vs_Unicos": total_esperado - 0
         })
-        for z in no_parseables:
-            duplicados_rows.append({"Serie": "", "RUC": "", "Numero": "", "ZIP": z, "Tipo": "NO_PARSEABLE"})
-        return resumen_rows, faltantes_rows, duplicados_rows
-
-    series = sorted(set(p["serie"] for p in parsed))
-
-    for serie in series:
-        pserie = [p for p in parsed if p["serie"] == serie]
-        ruc_set = sorted(set(p["ruc"] for p in pserie))
-        ruc_str = ruc_set[0] if len(ruc_set) == 1 else ",".join(ruc_set)
-
-        nums = [p["numero"] for p in pserie]
-        min_n, max_n = min(nums), max(nums)
-
-        seen = {}
-        for p in pserie:
-            key = (p["serie"], p["ruc"], p["numero"])
-            seen.setdefault(key, []).append(p["zip"])
-
-        dup_count = 0
-        unique_nums = set()
-        for (s, r, n), zlist in seen.items():
-            unique_nums.add(n)
-            if len(zlist) > 1:
-                dup_count += (len(zlist) - 1)
-                for zname in zlist:
-                    duplicados_rows.append({
-                        "Serie": s, "RUC": r, "Numero": n, "ZIP": zname, "Tipo": "DUPLICADO"
-                    })
-
-        faltantes = []
-        for n in range(min_n, max_n + 1):
-            if n not in unique_nums:
-                faltantes.append(n)
-                faltantes_rows.append({"Serie": serie, "RUC": ruc_str, "NumeroFaltante": n})
 
+    for (serie, ruc) in sorted(grupos):
+        nums = grupos[(serie, ruc)]
+        reps = repetidos.get((serie, ruc), {})
+        dup_count = sum(len(zlist) for zlist in reps.values())
+
+        # Duplicados en el orden en que aparece cada número
+        if reps:
+            for n, zname in nums.items():
+                if n in reps:
+                    for z in [zname] + reps[n]:
+                        duplicados_rows.append({
+                            "Serie": serie, "RUC": ruc, "Numero": n, "ZIP": z, "Tipo": "DUPLICADO"
+                        })
+
+        unicos = sorted(nums)
+        min_n, max_n = unicos[0], unicos[-1]
+        for desde, hasta in rangos_faltantes(unicos):
+            faltantes_rows.append({
+                "Serie": serie, "RUC": ruc, "Desde": desde, "Hasta": hasta, "Cantidad": hasta - desde + 1
+            })
+
+        esperado = esperados.get((ruc, serie), esperados.get((None, serie), total_esperado))
         resumen_rows.append({
             "Serie": serie,
-            "RUC": ruc_str,
+            "RUC": ruc,
             "TotalZIP": len(zips),
-            "ZIP_Validos_Patron": len(pserie),
+            "ZIP_Validos_Patron": len(nums) + dup_count,
             "ZIP_NoParseables": len(no_parseables),
             "MinNumero": min_n,
             "MaxNumero": max_n,
-            "Unicos": len(unique_nums),
+            "Unicos": len(unicos),
             "Duplicados": dup_count,
-            "Faltantes_EnRango": len(faltantes),
-            "TotalEsperado": total_esperado,
-            "Diferencia_Esperado_vs_Unicos": total_esperado - len(unique_nums),
+            "Faltantes_EnRango": (max_n - min_n + 1) - len(unicos),
+            "TotalEsperado": esperado,
+            "Diferencia_Esperado_vs_Unicos": esperado - len(unicos),
         })
 
     for z in no_parseables:
@@ -162,64 +279,92 @@ def control_faltantes(zips, total_esperado):
     return resumen_rows, faltantes_rows, duplicados_rows
 
 # =========================
-# NUEVO: Detectar tipo de XML
+# PARSE GENERAL UBL (Invoice + CreditNote)
 # =========================
-def localname(tag: str) -> str:
-    return tag.split("}")[-1] if "}" in tag else tag
+# Specs compilados una sola vez (ver ubl_extractor.py). Para CreditNote (discrepancy):
+#   - ref_id: documento referenciado (ej: E001-1074)
+#   - motivo_codigo: "01" = Anulación de la operación
+#   - motivo_desc: texto del motivo
+# El de CreditNote es el mismo de nota_credito.py: con UNA lectura del XML salen la fila
+# de facturas.csv y las de notas_credito.csv / notas_credito_items.csv.
+UBL_SPECS = {
+    "Invoice": compile_spec(HEADER_PATHS, {"lines": line_group("InvoiceLine", "InvoicedQuantity")}),
+    "CreditNote": CREDITNOTE_SPEC,
+}
+UBL_SPEC_OTROS = compile_spec(HEADER_PATHS)
 
-def detect_doc_type(root) -> str:
-    # Invoice / CreditNote / DebitNote / ...
-    return localname(root.tag)
+# --solo-cabeceras: lo que necesita facturas.csv / anulaciones.csv, sin grupos de líneas
+UBL_SPECS_CABECERA = {
+    "Invoice": UBL_SPEC_OTROS,
+    "CreditNote": compile_spec(HEADER_PATHS, {"discrepancy": DISCREPANCY_GROUP}),
+}
 
-def parse_discrepancy_creditnote(root):
+def parse_ubl_document(xml_path, xml_name=None):
     """
-    Para CreditNote:
-      - ReferenceID: documento referenciado (ej: E001-1074)
-      - ResponseCode: "01" = Anulación de la operación
-      - Description: texto del motivo
+    Retorna (header, items, nota):
+      - header/items: filas de facturas.csv / items.csv
+      - nota: (nc_header, nc_items) de notas_credito si es CreditNote, si no None
     """
-    ref_id = ""
-    motivo_codigo = ""
-    motivo_desc = ""
+    # xml_path puede ser ruta o archivo en memoria (BytesIO); xml_name manda para ArchivoXML
+    xml_name = xml_name or os.path.basename(xml_path)
+    doc = extract(xml_path, UBL_SPECS, UBL_SPEC_OTROS)
+    header = header_row(doc, xml_name)
+
+    # ITEMS: solo para Invoice (y opcionalmente para CreditNote si quieres)
+    items = []
+
+    if doc.doc_type == "Invoice":
+        documento_key = header["DocumentoKey"]
+        for line in doc.groups["lines"]:
+            items.append({
+                "DocumentoKey": documento_key,
+                "TipoDocumentoXML": doc.doc_type,
+                "NumeroDocumento": header["NumeroDocumento"],
+                "FechaEmision": header["FechaEmision"],
+                "LineaID": line["line_id"],
+                "Descripcion": line["desc"],
+                "Cantidad": line["qty"],
+                "Unidad": line["unit"],
+                "PrecioUnitario": line["precio_unit"],
+                "ValorLineaSinIGV": line["valor_linea"],
+                "ImpuestoLinea": line["impuesto_linea"],
+                "RUC_Receptor": header["RUC_Receptor"],
+                "Nombre_Receptor": header["Nombre_Receptor"],
+            })
 
-    dr = root.find(".//cac:DiscrepancyResponse", NS)
-    if dr is not None:
-        ref_id = t(dr.find("cbc:ReferenceID", NS))
-        motivo_codigo = t(dr.find("cbc:ResponseCode", NS))
-        motivo_desc = t(dr.find("cbc:Description", NS))
+    nota = creditnote_rows(doc, xml_name) if doc.doc_type == "CreditNote" else None
+    return header, items, nota
 
-    return ref_id, motivo_codigo, motivo_desc
+def parse_ubl_cabecera(xml_src, xml_name):
+    """
+    --solo-cabeceras: solo la fila de facturas.csv. El XML se deja de leer en la primera
+    línea (ubl_parsers.parse_cabecera), sin importar --parser.
+    """
+    return header_row(parse_cabecera(xml_src, UBL_SPECS_CABECERA, UBL_SPEC_OTROS), xml_name)
 
-# =========================
-# PARSE GENERAL UBL (Invoice + CreditNote)
-# =========================
-def parse_ubl_document(xml_path):
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
+def header_row(doc, xml_name):
+    """Fila de facturas.csv de un documento ya extraído (con o sin líneas)."""
+    v = doc.values
 
-    doc_type = detect_doc_type(root)
+    doc_type = doc.doc_type  # Invoice / CreditNote / DebitNote / ...
 
-    doc_id = t(find1(root, ".//cbc:ID"))
-    issue_date = t(find1(root, ".//cbc:IssueDate"))
-    issue_time = t(find1(root, ".//cbc:IssueTime"))
-    currency = t(find1(root, ".//cbc:DocumentCurrencyCode"))
+    doc_id = v["doc_id"]
+    issue_date = v["issue_date"]
+    issue_time = v["issue_time"]
+    currency = v["currency"]
 
-    supplier_ruc = t(find1(root, ".//cac:AccountingSupplierParty//cac:PartyIdentification//cbc:ID"))
-    supplier_name = t(find1(root, ".//cac:AccountingSupplierParty//cac:PartyLegalEntity//cbc:RegistrationName"))
-    if not supplier_name:
-        supplier_name = t(find1(root, ".//cac:AccountingSupplierParty//cac:PartyName//cbc:Name"))
+    supplier_ruc = v["supplier_ruc"]
+    supplier_name = v["supplier_name"] or v["supplier_name_alt"]
 
-    customer_ruc = t(find1(root, ".//cac:AccountingCustomerParty//cac:PartyIdentification//cbc:ID"))
-    customer_name = t(find1(root, ".//cac:AccountingCustomerParty//cac:PartyLegalEntity//cbc:RegistrationName"))
-    if not customer_name:
-        customer_name = t(find1(root, ".//cac:AccountingCustomerParty//cac:PartyName//cbc:Name"))
+    customer_ruc = v["customer_ruc"]
+    customer_name = v["customer_name"] or v["customer_name_alt"]
 
-    payment_means = t(find1(root, ".//cac:PaymentTerms//cbc:PaymentMeansID"))
+    payment_means = v["payment_means"]
 
-    base_imponible = t(find1(root, ".//cac:TaxTotal//cac:TaxSubtotal//cbc:TaxableAmount"))
-    igv_total = t(find1(root, ".//cac:TaxTotal//cbc:TaxAmount"))
-    subtotal_sin_igv = t(find1(root, ".//cac:LegalMonetaryTotal//cbc:LineExtensionAmount"))
-    total = t(find1(root, ".//cac:LegalMonetaryTotal//cbc:PayableAmount"))
+    base_imponible = v["base_imponible"]
+    igv_total = v["igv_total"]
+    subtotal_sin_igv = v["subtotal_sin_igv"]
+    total = v["total"]
 
     # Para notas (CreditNote)
     ref_id = ""
@@ -228,7 +373,8 @@ def parse_ubl_document(xml_path):
     es_anulacion_operacion = "NO"
 
     if doc_type == "CreditNote":
-        ref_id, motivo_codigo, motivo_desc = parse_discrepancy_creditnote(root)
+        dr = doc.groups["discrepancy"]
+        ref_id, motivo_codigo, motivo_desc = dr["ref_id"], dr["motivo_codigo"], dr["motivo_desc"]
         if motivo_codigo == "01":
             es_anulacion_operacion = "SI"
 
@@ -238,7 +384,7 @@ def parse_ubl_document(xml_path):
     header = {
         "DocumentoKey": documento_key,
         "TipoDocumentoXML": doc_type,  # Invoice / CreditNote / etc.
-        "ArchivoXML": os.path.basename(xml_path),
+        "ArchivoXML": xml_name,
         "NumeroDocumento": doc_id,
         "FechaEmision": issue_date,
         "HoraEmision": issue_time,
@@ -262,173 +408,742 @@ def parse_ubl_document(xml_path):
         # Se completa al final (solo aplica a Invoice/otros)
         "EsAnulado": "NO",
     }
+    return header
+
+def anulacion_row(zname, header):
+    return {
+        "ZIP_Origen": zname,
+        "ArchivoXML": header.get("ArchivoXML", ""),
+        "NumeroNCE": header.get("NumeroDocumento", ""),
+        "FechaNCE": header.get("FechaEmision", ""),
+        "DocReferencia": header.get("DocReferencia", ""),  # documento anulado
+        "MotivoCodigo": header.get("MotivoCodigo", ""),
+        "MotivoDescripcion": header.get("MotivoDescripcion", ""),
+        "RUC_Emisor": header.get("RUC_Emisor", ""),
+        "RUC_Receptor": header.get("RUC_Receptor", ""),
+        "TotalNCE": header.get("Total", ""),
+        "Moneda": header.get("Moneda", ""),
+    }
 
-    # ITEMS: solo para Invoice (y opcionalmente para CreditNote si quieres)
-    items = []
-
-    if doc_type == "Invoice":
-        lines = findall(root, ".//cac:InvoiceLine")
-        for line in lines:
-            line_id = t(line.find("cbc:ID", NS))
+# =========================
+# PROCESO POR ZIP (serial o en paralelo)
+# =========================
+def process_zip(zname, en_disco=False, tmp_dir=TMP_DIR, met=SIN_METRICAS, dedup=None, fuente=None,
+                cabeceras=False):
+    """
+    Procesa un ZIP completo y retorna sus filas:
+      (docs_rows, items_rows, errores_rows, anulaciones_rows, nc_rows, nc_items_rows)
+    zname es relativo a ZIP_DIR (los de --notas-dir vienen como "../..."); ZIP_Origen es solo el nombre.
+    Cada ZIP es independiente: el marcado EsAnulado se hace después, sobre todo el conjunto.
+    met: métricas (--metricas); por defecto no mide nada.
+    dedup: VistaDedup (--dedup); salta los XML ya vistos en otro ZIP y anota en dedup.xml_info
+    el hash, DocumentoKey y filas de cada XML (el filtro final lo hace DedupXML.filtrar).
+    fuente: el ZIP ya leído (BytesIO, --pipeline); si no, se abre desde ZIP_DIR.
+    cabeceras: --solo-cabeceras (ver _scan_cabeceras); no usa en_disco / dedup.
+    """
+    with met.medir("zip_total", zname):
+        if cabeceras:
+            filas = _scan_cabeceras(zname, met, fuente)
+        else:
+            filas = _process_zip(zname, en_disco, tmp_dir, met, dedup, fuente)
+    docs_rows, items_rows, errores_rows, _, _, nc_items_rows = filas
+    met.contar("zips")
+    met.contar("documentos", len(docs_rows))
+    met.contar("lineas", len(items_rows) + len(nc_items_rows))
+    met.contar("errores", len(errores_rows))
+    return filas
+
+def _process_zip(zname, en_disco, tmp_dir, met, dedup, fuente):
+    zip_path = fuente if fuente is not None else os.path.join(ZIP_DIR, zname)
+    zorigen = os.path.basename(zname)
+    docs_rows = []
+    items_rows = []
+    errores_rows = []
+    anulaciones_rows = []
+    nc_rows = []
+    nc_items_rows = []
+    filas = (docs_rows, items_rows, errores_rows, anulaciones_rows, nc_rows, nc_items_rows)
+
+    try:
+        with met.medir("extraccion_zip", zname):
+            xml_files = load_zip_xmls(zip_path, en_disco=en_disco, tmp_dir=tmp_dir)
+    except Exception as e:
+        errores_rows.append({"ZIP_Origen": zorigen, "ArchivoXML": "", "Error": f"No se pudo extraer ZIP: {e}"})
+        return filas
+
+    if met is not SIN_METRICAS:
+        met.contar("xml", len(xml_files))
+        met.contar("bytes_descomprimidos", sum(
+            src.getbuffer().nbytes if hasattr(src, "getbuffer") else os.path.getsize(src) for _, src in xml_files
+        ))
+
+    if not xml_files:
+        errores_rows.append({"ZIP_Origen": zorigen, "ArchivoXML": "", "Error": "ZIP sin XML"})
+        return filas
+
+    for xml_name, xml_src in xml_files:
+        if dedup is not None:
+            h = hash_xml(xml_src)
+            if dedup.omitir(h, zname, xml_name):
+                met.contar("xml_duplicados_omitidos")
+                dedup.xml_info.append((xml_name, h, "", (0,) * len(filas), True))
+                continue
+            antes = [len(f) for f in filas]
+            header = {}
 
-            qty_el = line.find("cbc:InvoicedQuantity", NS)
-            qty = t(qty_el)
-            unit = qty_el.attrib.get("unitCode", "") if qty_el is not None else ""
+        try:
+            with met.medir("parse_ubl_document", f"{zname}/{xml_name}"):
+                header, items, nota = parse_ubl_document(xml_src, xml_name)
+            header["ZIP_Origen"] = zorigen
+            docs_rows.append(header)
+            items_rows.extend(items)
+
+            # Si es CreditNote: va también a notas_credito (una sola lectura del XML)
+            if nota is not None:
+                nc_header, nc_items = nota
+                nc_header["ZIP_Origen"] = zorigen
+                nc_rows.append(nc_header)
+                nc_items_rows.extend(nc_items)
+
+            # Si es CreditNote y es anulación (motivo 01), guardo detalle
+            if header.get("TipoDocumentoXML") == "CreditNote" and header.get("EsAnulacionOperacion") == "SI":
+                anulaciones_rows.append(anulacion_row(zorigen, header))
 
-            desc = t(line.find(".//cac:Item//cbc:Description", NS))
-            valor_linea = t(line.find("cbc:LineExtensionAmount", NS))
-            precio_unit = t(line.find(".//cac:Price//cbc:PriceAmount", NS))
-            impuesto_linea = t(line.find(".//cac:TaxTotal//cbc:TaxAmount", NS))
+        except Exception as e:
+            errores_rows.append({"ZIP_Origen": zorigen, "ArchivoXML": xml_name, "Error": str(e)})
 
-            items.append({
-                "DocumentoKey": documento_key,
-                "TipoDocumentoXML": doc_type,
-                "NumeroDocumento": doc_id,
-                "FechaEmision": issue_date,
-                "LineaID": line_id,
-                "Descripcion": desc,
-                "Cantidad": qty,
-                "Unidad": unit,
-                "PrecioUnitario": precio_unit,
-                "ValorLineaSinIGV": valor_linea,
-                "ImpuestoLinea": impuesto_linea,
-                "RUC_Receptor": customer_ruc,
-                "Nombre_Receptor": customer_name,
-            })
+        if dedup is not None:
+            conteos = tuple(len(f) - a for f, a in zip(filas, antes))
+            dedup.xml_info.append((xml_name, h, header.get("DocumentoKey", ""), conteos, False))
 
-    return header, items
+    return filas
 
-def main():
-    os.makedirs(ZIP_DIR, exist_ok=True)
-    os.makedirs(OUT_DIR, exist_ok=True)
+def _scan_cabeceras(zname, met, fuente):
+    """
+    Solo facturas / errores / anulaciones: cada XML se lee en streaming desde el ZIP y el parseo
+    se corta en la primera línea (la firma del comienzo sí se recorre, pero sin guardar nada).
+    Como en _process_zip, un ZIP que no se puede leer aporta solo su fila de error. El CRC de un
+    miembro recién se verifica al leerlo entero, así que un XML dañado después de la cabecera no
+    se detecta aquí.
+    """
+    zip_path = fuente if fuente is not None else os.path.join(ZIP_DIR, zname)
+    zorigen = os.path.basename(zname)
+    docs_rows = []
+    errores_rows = []
+    anulaciones_rows = []
+    filas = (docs_rows, [], errores_rows, anulaciones_rows, [], [])
 
-    # ====== CONTROL ANTES DE PROCESAR ======
-    zips = sorted([f for f in os.listdir(ZIP_DIR) if f.lower().endswith(".zip")])
-    resumen_rows, faltantes_rows, duplicados_rows = control_faltantes(zips, TOTAL_ESPERADO)
+    n_xml = 0
+    try:
+        for xml_name, xml_src in iter_zip_xml_streams(zip_path):
+            n_xml += 1
+            try:
+                with met.medir("parse_cabecera", f"{zname}/{xml_name}"):
+                    header = parse_ubl_cabecera(xml_src, xml_name)
+            except Exception as e:
+                errores_rows.append({"ZIP_Origen": zorigen, "ArchivoXML": xml_name, "Error": str(e)})
+                continue
+            header["ZIP_Origen"] = zorigen
+            docs_rows.append(header)
+            if header.get("TipoDocumentoXML") == "CreditNote" and header.get("EsAnulacionOperacion") == "SI":
+                anulaciones_rows.append(anulacion_row(zorigen, header))
+    except Exception as e:
+        for rows in filas:
+            rows.clear()
+        errores_rows.append({"ZIP_Origen": zorigen, "ArchivoXML": "", "Error": f"No se pudo extraer ZIP: {e}"})
+        return filas
+
+    met.contar("xml", n_xml)
+    if not n_xml:
+        errores_rows.append({"ZIP_Origen": zorigen, "ArchivoXML": "", "Error": "ZIP sin XML"})
+    return filas
+
+# Cada worker recibe al iniciar el backend de --parser y, con --dedup, los hashes conocidos
+# (una vez, no por ZIP)
+_DEDUP_HASHES = None
+
+def _init_worker(dedup_hashes, parser):
+    global _DEDUP_HASHES
+    _DEDUP_HASHES = dedup_hashes
+    usar_parser(parser)
+
+def _process_zip_worker(zname, en_disco, top=None, cabeceras=False):
+    # Cada proceso usa su propia carpeta temporal (solo aplica con --extraer-disco)
+    # top: con --metricas el worker mide y devuelve sus métricas junto con las filas
+    met = Metricas(top) if top is not None else SIN_METRICAS
+    vista = VistaDedup(_DEDUP_HASHES) if _DEDUP_HASHES is not None else None
+    filas = process_zip(zname, en_disco, tmp_dir=f"{TMP_DIR}_{os.getpid()}", met=met, dedup=vista,
+                        cabeceras=cabeceras)
+    return (filas, met.exportar() if top is not None else None,
+            vista.xml_info if vista is not None else None)
+
+def leer_zip(zname):
+    with open(os.path.join(ZIP_DIR, zname), "rb") as f:
+        return f.read()
+
+def iter_zip_results(zips, workers=1, en_disco=False, met=SIN_METRICAS, dedup=None, pipe=None, cabeceras=False):
+    """
+    Genera el resultado de cada ZIP en el mismo orden de `zips`.
+    Con workers > 1 reparte los ZIP en bloques a un pool de procesos; Executor.map
+    devuelve en orden de entrada, así la salida es idéntica a una corrida serial.
+    dedup: DedupXML (--dedup); filtra cada ZIP en este proceso, en orden.
+    pipe: Pipeline (--pipeline); en serie los bytes de los ZIP se leen adelantados en hilos.
+    cabeceras: --solo-cabeceras (solo filas de facturas / errores / anulaciones).
+    """
+    resultados = _iter_zip_results(zips, workers, en_disco, met, dedup, pipe, cabeceras)
+    return pipe.parsear(resultados) if pipe is not None else resultados
+
+def _iter_zip_results(zips, workers, en_disco, met, dedup, pipe, cabeceras):
+    if workers <= 1 or len(zips) <= 1:
+        fuentes = pipe.prefetch(zips, leer_zip) if pipe is not None else ((z, None) for z in zips)
+        for zname, datos in fuentes:
+            vista = dedup.vista() if dedup is not None else None
+            fuente = io.BytesIO(datos) if datos is not None else None
+            filas = process_zip(zname, en_disco, met=met, dedup=vista, fuente=fuente, cabeceras=cabeceras)
+            yield dedup.filtrar(zname, filas, vista.xml_info) if dedup is not None else filas
+        return
+
+    top = met.top if met is not SIN_METRICAS else None
+    conocidos = dict(dedup.hashes) if dedup is not None else None
+    chunksize = max(1, len(zips) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(conocidos, parser_en_uso())) as ex:
+        resultados = ex.map(_process_zip_worker, zips, repeat(en_disco), repeat(top), repeat(cabeceras),
+                            chunksize=chunksize)
+        for zname, (filas, datos, xml_info) in zip(zips, resultados):
+            if datos is not None:
+                met.unir(datos)
+            yield dedup.filtrar(zname, filas, xml_info) if dedup is not None else filas
 
-    write_csv(RESUMEN_CONTROL_CSV, resumen_rows, list(resumen_rows[0].keys()) if resumen_rows else ["Serie"])
-    write_csv(FALTANTES_CSV, faltantes_rows, ["Serie", "RUC", "NumeroFaltante"])
-    write_csv(DUPLICADOS_CSV, duplicados_rows, ["Serie", "RUC", "Numero", "ZIP", "Tipo"])
+# =========================
+# MARCAR FACTURAS ANULADAS
+# =========================
+# Set de (RUC emisor, documento normalizado) anulados por NCE motivo 01 (DocReferencia).
+# Además de las de esta corrida, incluye las que otras corridas dejaron en el índice
+# (ej. NOTAS DE CREDITO/main.py); es_anulado está en indice_anulaciones.py.
+def add_doc_anulado(docs_anulados, anulacion):
+    clave = clave_anulacion(anulacion.get("RUC_Emisor"), anulacion.get("DocReferencia"))
+    if clave[1]:
+        docs_anulados.add(clave)
+
+def registro_indice(anulacion):
+    return (anulacion.get("RUC_Emisor"), anulacion.get("DocReferencia"),
+            anulacion.get("NumeroNCE"), anulacion.get("FechaNCE"))
+
+def docs_anulados_previos(indice):
+    return indice.claves(excluir="facturas") if indice is not None else set()
+
+def actualizar_indice(indice, registros):
+    if indice is not None:
+        indice.reemplazar("facturas", registros)
+        indice.guardar()
 
-    # ====== PROCESO XML A CSV ======
-    docs_rows = []      # antes facturas_rows
-    items_rows = []
-    errores_rows = []
+# =========================
+# SALIDA: en memoria (por defecto) o en streaming (--streaming)
+# =========================
+class MemorySink:
+    """
+    Junta todas las filas y escribe los CSV al final (comportamiento original).
+    """
 
-    # NUEVO: aquí guardo anulaciones detectadas
-    anulaciones_rows = []
+    def __init__(self, met=SIN_METRICAS, indice=None, agregados=None):
+        self.met = met
+        self.indice = indice
+        self.agregados = agregados
+        self.docs_rows = []      # antes facturas_rows
+        self.items_rows = []
+        self.errores_rows = []
+        self.anulaciones_rows = []
+        self.nc_rows = []
+        self.nc_items_rows = []
+
+    def add(self, docs, items, errores, anulaciones, nc, nc_items):
+        self.docs_rows.extend(docs)
+        self.items_rows.extend(items)
+        self.errores_rows.extend(errores)
+        self.anulaciones_rows.extend(anulaciones)
+        self.nc_rows.extend(nc)
+        self.nc_items_rows.extend(nc_items)
+
+    def abort(self):
+        pass
+
+    def close(self):
+        with self.met.medir("marcado_anulaciones"):
+            docs_anulados = docs_anulados_previos(self.indice)
+            for a in self.anulaciones_rows:
+                add_doc_anulado(docs_anulados, a)
+            actualizar_indice(self.indice, map(registro_indice, self.anulaciones_rows))
+
+            # Marco EsAnulado = SI en documentos que coincidan con (RUC_Emisor, DocReferencia)
+            n_anulados = 0
+            for d in self.docs_rows:
+                marca = es_anulado(d.get("TipoDocumentoXML"), d.get("NumeroDocumento"), d.get("RUC_Emisor"),
+                                   docs_anulados)
+                if marca is not None:
+                    d["EsAnulado"] = marca
+                    n_anulados += marca == "SI"
+
+        # Ventas pre-agregadas: solo las facturas que quedaron sin anular (y sus items)
+        if self.agregados is not None:
+            with self.met.medir("agregados"):
+                self.agregados.agregar([d for d in self.docs_rows if d.get("EsAnulado") != "SI"], self.items_rows)
+
+        salidas = (self.docs_rows, self.items_rows, self.errores_rows,
+                   self.anulaciones_rows, self.nc_rows, self.nc_items_rows)
+        for (path, fields), rows in zip(SALIDAS_POR_ZIP, salidas):
+            with self.met.medir("write_csv", path):
+                write_csv(path, rows, fields)
+        return len(self.anulaciones_rows), n_anulados, len(self.nc_rows)
+
+class StreamingSink:
+    """
+    Escribe items/errores/anulaciones/notas a medida que llega cada ZIP (memoria plana).
+    facturas va primero a un archivo parcial; al cerrar, una segunda pasada fila por fila
+    completa EsAnulado usando solo el set de DocReferencia anuladas.
+    Todo se escribe en .tmp y se reemplaza al final, así una corrida abortada no deja CSV a medias.
+    """
 
-    for zname in zips:
-        zip_path = os.path.join(ZIP_DIR, zname)
+    def __init__(self, met=SIN_METRICAS, indice=None, agregados=None):
+        self.met = met
+        self.indice = indice
+        self.agregados = agregados
+        self.docs_parcial = FACTURAS_CSV + ".parcial"
+        self.salidas = [
+            (self.docs_parcial, FACTURAS_FIELDS),
+            (ITEMS_CSV + ".tmp", ITEMS_FIELDS),
+            (ERRORES_CSV + ".tmp", ERRORES_FIELDS),
+            (ANULACIONES_CSV + ".tmp", ANULACIONES_FIELDS),
+            (NC_CSV + ".tmp", NC_FIELDS),
+            (NC_ITEMS_CSV + ".tmp", NC_ITEMS_FIELDS),
+        ]
+        self.files = []
+        self.writers = []
+        for path, fields in self.salidas:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            f = open(path, "w", newline="", encoding="utf-8")
+            w = csv.DictWriter(f, fieldnames=fields)
+            w.writeheader()
+            self.files.append(f)
+            self.writers.append(w)
+        self.docs_anulados = docs_anulados_previos(indice)
+        self.registros = []   # solo lo que va al índice (pocos campos por NCE)
+        self.n_anulaciones = 0
+        self.n_nc = 0
+
+    def add(self, docs, items, errores, anulaciones, nc, nc_items):
+        with self.met.medir("escritura_csv"):
+            for w, rows in zip(self.writers, (docs, items, errores, anulaciones, nc, nc_items)):
+                w.writerows(rows)
+        if self.agregados is not None:
+            # Se suma todo; al cerrar se restan las facturas que quedaron anuladas
+            with self.met.medir("agregados"):
+                self.agregados.agregar(docs, items)
+        for a in anulaciones:
+            add_doc_anulado(self.docs_anulados, a)
+            self.registros.append(registro_indice(a))
+        self.n_anulaciones += len(anulaciones)
+        self.n_nc += len(nc)
+
+    def _close_files(self):
+        for f in self.files:
+            f.close()
+        self.files = []
+
+    def abort(self):
+        self._close_files()
+        for path, _ in self.salidas:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def close(self):
+        self._close_files()
+
+        # 2da pasada: facturas.csv.parcial -> facturas.csv.tmp con EsAnulado
+        with self.met.medir("marcado_anulaciones"):
+            actualizar_indice(self.indice, self.registros)
+            n_anulados, _ = marcar_csv(self.docs_parcial, FACTURAS_CSV + ".tmp", self.docs_anulados)
+        os.remove(self.docs_parcial)
+
+        if self.agregados is not None and n_anulados:
+            # Las anuladas son pocas: se restan con sus items (una pasada por items filtrando por clave)
+            with self.met.medir("agregados"):
+                anuladas = anuladas_csv(FACTURAS_CSV + ".tmp")
+                items = list(leer_filas(ITEMS_CSV + ".tmp", {d["DocumentoKey"] for d in anuladas}))
+                self.agregados.agregar(anuladas, items, signo=-1)
+
+        for path in (FACTURAS_CSV, ITEMS_CSV, ERRORES_CSV, ANULACIONES_CSV, NC_CSV, NC_ITEMS_CSV):
+            os.replace(path + ".tmp", path)
+        return self.n_anulaciones, n_anulados, self.n_nc
+
+def procesar_zips(zips, firmas, manifest, reutilizar, args, met=SIN_METRICAS):
+    """
+    Arma las salidas en el orden de los ZIP: los de `reutilizar` salen de la corrida anterior
+    (manifest) y el resto se parsea. Escribe los CSV y el manifest nuevo.
+    """
+    # DEDUP (opcional): algunos ZIP sin cambios igual se re-procesan (ver DedupXML.preparar)
+    dedup = None
+    if args.dedup:
+        dedup = DedupXML.cargar(DEDUP_JSON)
+        reutilizar = set(reutilizar) - dedup.preparar(firmas, reutilizar)
+
+    # PIPELINE (opcional): lectura adelantada en hilos y escritura en su propio hilo
+    pipe = Pipeline(args.hilos_lectura, args.prefetch) if args.pipeline else None
+
+    a_procesar = [z for z in zips if z not in reutilizar]
+    nuevos = iter_zip_results(a_procesar, args.workers, args.extraer_disco, met, dedup, pipe)
+    segmentos = iter_segments(SALIDAS_POR_ZIP, manifest) if reutilizar else iter(())
+    indice = IndiceAnulaciones.cargar(args.indice)
+    agregados = None if args.sin_agregados else AgregadosVentas()
+    sink = StreamingSink(met, indice, agregados) if args.streaming else MemorySink(met, indice, agregados)
+
+    # SQLITE (opcional): solo se escriben los ZIP nuevos o cambiados según su sha256
+    almacen = None
+    if args.sqlite:
+        almacen = AlmacenSQLite(args.sqlite, TABLAS_SQLITE)
+        almacen.preparar(firmas)
+
+    # Los de ZIPs borrados simplemente ya no aparecen
+    manifest_entries = []
+
+    def escribir(zname, filas):
+        sink.add(*filas)
+        if almacen is not None:
+            with met.medir("sqlite"):
+                almacen.agregar(zname, firmas[zname]["sha256"], filas)
+        manifest_entries.append({**firmas[zname], "filas": [len(f) for f in filas]})
+
+    escritor = Escritor(escribir, pipe) if pipe is not None else None
+    try:
+        for zname, filas, _ in merge_segments(zips, reutilizar, segmentos, nuevos):
+            if escritor is not None:
+                escritor.put(zname, filas)
+            else:
+                escribir(zname, filas)
+        if escritor is not None:
+            escritor.cerrar()
+    except BaseException:
+        if escritor is not None:
+            escritor.abortar()
+        sink.abort()
+        if almacen is not None:
+            almacen.abortar()
+        nuevos.close()
+        raise
+
+    if pipe is not None:
+        met.anotar("pipeline", pipe.resumen())
+    n_anulaciones, n_anulados, n_nc = sink.close()
+    save_manifest(MANIFEST_JSON, manifest_entries)
+    filas_agregados = None
+    if agregados is not None:
+        with met.medir("agregados"):
+            filas_agregados = agregados.guardar(OUT_DIR)
+    xml_omitidos = None
+    if dedup is not None:
+        write_csv(CONFLICTOS_XML_CSV, dedup.conflictos(zips), CONFLICTOS_FIELDS)
+        dedup.guardar()
+        xml_omitidos = dedup.omitidos(zips)
+    n_sqlite = None
+    if almacen is not None:
+        with met.medir("sqlite"):
+            almacen.marcar_anulados(indice.claves())
+            almacen.cerrar()
+        n_sqlite = almacen.n_ingeridos
+    return {
+        "reutilizados": len(zips) - len(a_procesar),
+        "parseados": len(a_procesar),
+        "anulaciones": n_anulaciones,
+        "anulados": n_anulados,
+        "notas_credito": n_nc,
+        "sqlite_ingeridos": n_sqlite,
+        "xml_omitidos": xml_omitidos,
+        "pipeline": pipe.texto() if pipe is not None else None,
+        "xml_conflictos": len(dedup.conflictos(zips)) if dedup is not None else None,
+        "agregados": filas_agregados,
+    }
 
-        if os.path.exists(TMP_DIR):
-            shutil.rmtree(TMP_DIR)
-        os.makedirs(TMP_DIR, exist_ok=True)
+def escanear_cabeceras(zips, args, met=SIN_METRICAS):
+    """
+    --solo-cabeceras: facturas_cabecera.csv / anulaciones_cabecera.csv / errores_cabecera.csv
+    leyendo solo la cabecera de cada XML. Son archivos de control: las filas (y EsAnulado)
+    salen igual que en facturas.csv / anulaciones.csv / errores.csv de una corrida completa,
+    pero esos CSV, items, notas, agregados, el manifest y el índice de anulaciones no se tocan
+    (el índice solo se lee, para marcar anulaciones de corridas anteriores).
+    """
+    docs_rows, errores_rows, anulaciones_rows = [], [], []
+    for docs, _, errores, anulaciones, _, _ in iter_zip_results(zips, args.workers, met=met, cabeceras=True):
+        docs_rows.extend(docs)
+        errores_rows.extend(errores)
+        anulaciones_rows.extend(anulaciones)
+
+    with met.medir("marcado_anulaciones"):
+        docs_anulados = docs_anulados_previos(IndiceAnulaciones.cargar(args.indice))
+        for a in anulaciones_rows:
+            add_doc_anulado(docs_anulados, a)
+        n_anulados = 0
+        for d in docs_rows:
+            marca = es_anulado(d.get("TipoDocumentoXML"), d.get("NumeroDocumento"), d.get("RUC_Emisor"),
+                               docs_anulados)
+            if marca is not None:
+                d["EsAnulado"] = marca
+                n_anulados += marca == "SI"
+
+    for path, rows, fields in ((FACTURAS_CABECERA_CSV, docs_rows, FACTURAS_FIELDS),
+                               (ERRORES_CABECERA_CSV, errores_rows, ERRORES_FIELDS),
+                               (ANULACIONES_CABECERA_CSV, anulaciones_rows, ANULACIONES_FIELDS)):
+        with met.medir("write_csv", path):
+            write_csv(path, rows, fields)
+    # Mismas claves que procesar_zips (lo que no aplica va en None)
+    return {
+        "reutilizados": 0,
+        "parseados": len(zips),
+        "anulaciones": len(anulaciones_rows),
+        "anulados": n_anulados,
+        "notas_credito": sum(d.get("TipoDocumentoXML") == "CreditNote" for d in docs_rows),
+        "sqlite_ingeridos": None,
+        "xml_omitidos": None,
+        "pipeline": None,
+        "xml_conflictos": None,
+        "agregados": None,
+    }
 
-        try:
-            extract_zip(zip_path, TMP_DIR)
-        except Exception as e:
-            errores_rows.append({"ZIP_Origen": zname, "ArchivoXML": "", "Error": f"No se pudo extraer ZIP: {e}"})
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="ETL SUNAT: Facturas + Items + control + anulaciones")
+    ap.add_argument("--extraer-disco", action="store_true",
+                    help="Modo antiguo: extrae cada ZIP en _tmp_extract en vez de leerlo en memoria")
+    ap.add_argument("--workers", type=int, default=None,
+                    help="Procesos en paralelo para parsear ZIPs (1 = serial; por defecto 1, "
+                         "y con --verificar-zip uno por CPU)")
+    ap.add_argument("--verificar-zip", action="store_true",
+                    help="Solo control: verifica en paralelo cada ZIP (directorio central, CRC de cada miembro, "
+                         f"al menos un .xml, raíz UBL) y escribe los problemas en {VERIFICACION_ZIP_CSV}, sin ETL. "
+                         "Usa --workers procesos (por defecto uno por CPU; --workers 1 = serial)")
+    ap.add_argument("--solo-cabeceras", action="store_true",
+                    help="Control/conciliación rápida: lee solo la cabecera de cada XML (corta en la primera "
+                         "línea) y escribe facturas_cabecera.csv, anulaciones_cabecera.csv y errores_cabecera.csv; "
+                         "las salidas del ETL, el manifest y el índice de anulaciones no se tocan")
+    ap.add_argument("--parser", choices=list(PARSERS), default=PARSER_DEFAULT,
+                    help="Backend de parseo XML: etree (ElementTree, default), expat (streaming, sin armar árbol) "
+                         "o lxml (pip install lxml). Dan las mismas filas; ver BENCHMARK/benchmark.py --parsers")
+    ap.add_argument("--incremental", action="store_true",
+                    help="Solo parsea ZIPs nuevos o modificados según salida_csv/manifest_zip.json")
+    ap.add_argument("--streaming", action="store_true",
+                    help="Escribe los CSV a medida que procesa cada ZIP (memoria plana)")
+    ap.add_argument("--parquet", action="store_true",
+                    help=f"Además de los CSV, genera Parquet tipado por año-mes en {PARQUET_DIR}/ (requiere pyarrow)")
+    ap.add_argument("--notas-dir", action="append", default=[], metavar="DIR",
+                    help="Carpeta adicional de ZIPs a ingerir en la misma corrida "
+                         "(ej. \"../NOTAS DE CREDITO/descargas_zip\"); se puede repetir")
+    ap.add_argument("--indice", default=INDICE_JSON, metavar="RUTA",
+                    help=f"Índice persistente de anulaciones por (RUC emisor, documento) (default {INDICE_JSON}); "
+                         "NOTAS DE CREDITO/main.py también lo actualiza")
+    ap.add_argument("--vigilar", action="store_true",
+                    help="Queda corriendo y procesa (en modo incremental) los ZIP nuevos de descargas_zip y "
+                         "--notas-dir apenas terminan de copiarse. Usa watchdog si está instalado, si no polling")
+    ap.add_argument("--intervalo", type=float, default=1.0, metavar="SEG",
+                    help="Con --vigilar: cada cuántos segundos se revisan las carpetas (default 1)")
+    ap.add_argument("--estable", type=float, default=2.0, metavar="SEG",
+                    help="Con --vigilar: segundos sin cambios de tamaño/fecha para dar un ZIP por copiado (default 2)")
+    ap.add_argument("--pipeline", action="store_true",
+                    help="Lectura de ZIP adelantada en hilos, parseo y escritura de CSV en etapas paralelas "
+                         "con colas acotadas (útil en discos de red); muestra la utilización de cada etapa")
+    ap.add_argument("--prefetch", type=int, default=8, metavar="N",
+                    help="Con --pipeline: máximo de ZIP leídos por adelantado (acota la memoria; default 8)")
+    ap.add_argument("--hilos-lectura", type=int, default=4, metavar="N",
+                    help="Con --pipeline: hilos que leen ZIP del disco (default 4)")
+    ap.add_argument("--dedup", action="store_true",
+                    help="Deduplica por contenido: un XML idéntico a uno ya visto en otro ZIP no se parsea ni se "
+                         f"cuenta dos veces; mismo DocumentoKey con otro contenido va a {CONFLICTOS_XML_CSV}")
+    ap.add_argument("--sqlite", nargs="?", const=SQLITE_DB, default=None, metavar="RUTA",
+                    help=f"Además de los CSV, mantiene un almacén SQLite indexado (por defecto {SQLITE_DB}); "
+                         "solo escribe los ZIP nuevos o cambiados")
+    ap.add_argument("--sin-agregados", action="store_true",
+                    help="No escribe las ventas pre-agregadas (ventas_mes_cliente.csv / ventas_mes_producto.csv)")
+    ap.add_argument("--esperados", metavar="CSV",
+                    help="Totales esperados por RUC y serie (columnas RUC, Serie, TotalEsperado; "
+                         f"RUC vacío = cualquier RUC). Lo que no esté usa TOTAL_ESPERADO ({TOTAL_ESPERADO})")
+    ap.add_argument("--faltantes-detalle", action="store_true",
+                    help=f"Además de los rangos, escribe {FALTANTES_DETALLE_CSV} con un número faltante por fila")
+    ap.add_argument("--metricas", nargs="?", const=METRICAS_JSON, default=None, metavar="RUTA",
+                    help=f"Mide cada etapa y guarda un JSON con percentiles y los ZIP/XML más lentos "
+                         f"(por defecto {METRICAS_JSON})")
+    ap.add_argument("--metricas-top", type=int, default=10, metavar="N",
+                    help="Cantidad de ZIP/XML más lentos a reportar por etapa con --metricas (default 10)")
+    ap.add_argument("--perfil", nargs="?", const=PERFIL_PROF, default=None, metavar="RUTA",
+                    help=f"Guarda un perfil cProfile del proceso principal (por defecto {PERFIL_PROF}); "
+                         f"con --workers > 1 el parseo corre en otros procesos y no aparece")
+    args = ap.parse_args(argv)
+    if args.workers is None:
+        args.workers = (os.cpu_count() or 1) if args.verificar_zip else 1
+    if args.verificar_zip and args.vigilar:
+        ap.error("--verificar-zip no se combina con --vigilar")
+    if args.solo_cabeceras:
+        otros = [f"--{k.replace('_', '-')}" for k in ("incremental", "streaming", "parquet", "vigilar", "pipeline",
+                                                     "dedup", "sqlite") if getattr(args, k)]
+        if otros:
+            ap.error(f"--solo-cabeceras no se combina con {', '.join(otros)}")
+    return args
+
+def list_zips(folder):
+    return sorted([f for f in os.listdir(folder) if f.lower().endswith(".zip")])
+
+def zips_adicionales(carpetas):
+    """
+    ZIPs de las carpetas de --notas-dir, como rutas relativas a ZIP_DIR (así process_zip,
+    el manifest y --incremental los tratan igual que a los de descargas_zip).
+    """
+    zips = []
+    for carpeta in carpetas:
+        if not os.path.isdir(carpeta):
+            print(f"⚠️ No existe la carpeta {carpeta}; se omite")
             continue
+        rel = os.path.relpath(carpeta, ZIP_DIR)
+        zips.extend(os.path.join(rel, f) for f in list_zips(carpeta))
+    return zips
 
-        xml_files = find_xmls(TMP_DIR)
-        if not xml_files:
-            errores_rows.append({"ZIP_Origen": zname, "ArchivoXML": "", "Error": "ZIP sin XML"})
-            continue
+def solo_listos(zips, listos):
+    """
+    --vigilar: los `zips` (relativos a ZIP_DIR) que están en `listos`, la foto de ZIP ya copiados
+    (rutas de vigilancia.foto_zips). Los que siguen copiándose quedan para la próxima corrida.
+    """
+    listos = {os.path.abspath(r) for r in listos}
+    return [z for z in zips if os.path.abspath(os.path.join(ZIP_DIR, z)) in listos]
 
-        for xml_path in xml_files:
-            try:
-                header, items = parse_ubl_document(xml_path)
-                header["ZIP_Origen"] = zname
-                docs_rows.append(header)
-                items_rows.extend(items)
-
-                # Si es CreditNote y es anulación (motivo 01), guardo detalle
-                if header.get("TipoDocumentoXML") == "CreditNote" and header.get("EsAnulacionOperacion") == "SI":
-                    anulaciones_rows.append({
-                        "ZIP_Origen": zname,
-                        "ArchivoXML": header.get("ArchivoXML", ""),
-                        "NumeroNCE": header.get("NumeroDocumento", ""),
-                        "FechaNCE": header.get("FechaEmision", ""),
-                        "DocReferencia": header.get("DocReferencia", ""),  # documento anulado
-                        "MotivoCodigo": header.get("MotivoCodigo", ""),
-                        "MotivoDescripcion": header.get("MotivoDescripcion", ""),
-                        "RUC_Emisor": header.get("RUC_Emisor", ""),
-                        "RUC_Receptor": header.get("RUC_Receptor", ""),
-                        "TotalNCE": header.get("Total", ""),
-                        "Moneda": header.get("Moneda", ""),
-                    })
+def main(argv=None):
+    args = parse_args(argv)
+    if args.parquet:
+        check_pyarrow()  # antes de procesar, para no enterarse al final
+    usar_parser(args.parser)
 
-            except Exception as e:
-                errores_rows.append({"ZIP_Origen": zname, "ArchivoXML": os.path.basename(xml_path), "Error": str(e)})
-
-    # ====== MARCAR FACTURAS ANULADAS ======
-    # Construyo set de documentos anulados por NCE motivo 01 (DocReferencia)
-    docs_anulados = set()
-    for a in anulaciones_rows:
-        ref = (a.get("DocReferencia") or "").strip()
-        if ref:
-            docs_anulados.add(ref)
-
-    # Marco EsAnulado = SI en documentos que coincidan con DocReferencia
-    for d in docs_rows:
-        # Solo tiene sentido marcar anulados a documentos "Invoice"
-        if d.get("TipoDocumentoXML") == "Invoice":
-            num = (d.get("NumeroDocumento") or "").strip()
-            if num and num in docs_anulados:
-                d["EsAnulado"] = "SI"
-            else:
-                d["EsAnulado"] = "NO"
-
-    # ====== CAMPOS DE SALIDA ======
-    facturas_fields = [
-        "DocumentoKey", "ZIP_Origen", "ArchivoXML",
-        "TipoDocumentoXML", "NumeroDocumento",
-        "FechaEmision", "HoraEmision", "Moneda",
-        "RUC_Emisor", "Nombre_Emisor",
-        "RUC_Receptor", "Nombre_Receptor",
-        "FormaPago",
-        "BaseImponible", "IGV", "SubtotalSinIGV", "Total",
-
-        # NCE
-        "DocReferencia", "MotivoCodigo", "MotivoDescripcion", "EsAnulacionOperacion",
-
-        # Lo que tú quieres para filtrar en Power BI
-        "EsAnulado",
-    ]
-
-    items_fields = [
-        "DocumentoKey", "TipoDocumentoXML", "NumeroDocumento", "FechaEmision",
-        "LineaID", "Descripcion", "Cantidad", "Unidad",
-        "PrecioUnitario", "ValorLineaSinIGV", "ImpuestoLinea",
-        "RUC_Receptor", "Nombre_Receptor",
-    ]
-
-    errores_fields = ["ZIP_Origen", "ArchivoXML", "Error"]
-
-    anulaciones_fields = [
-        "ZIP_Origen", "ArchivoXML",
-        "NumeroNCE", "FechaNCE",
-        "DocReferencia",
-        "MotivoCodigo", "MotivoDescripcion",
-        "RUC_Emisor", "RUC_Receptor",
-        "TotalNCE", "Moneda"
-    ]
-
-    write_csv(FACTURAS_CSV, docs_rows, facturas_fields)
-    write_csv(ITEMS_CSV, items_rows, items_fields)
-    write_csv(ERRORES_CSV, errores_rows, errores_fields)
-    write_csv(ANULACIONES_CSV, anulaciones_rows, anulaciones_fields)
-
-    print("✅ Listo")
+    os.makedirs(ZIP_DIR, exist_ok=True)
+    os.makedirs(OUT_DIR, exist_ok=True)
+
+    # VIGILANCIA: corre en modo incremental cada vez que llegan ZIP (solo parsea lo nuevo)
+    if args.vigilar:
+        args.incremental = True
+        vigilar([ZIP_DIR] + args.notas_dir, lambda listos: corrida(args, listos), args.intervalo, args.estable)
+        return
+    corrida(args)
+
+def corrida(args, listos=None):
+    # INSTRUMENTACIÓN (opcional): sin --metricas todo usa SIN_METRICAS y no mide nada
+    met = Metricas(args.metricas_top) if args.metricas else SIN_METRICAS
+    perfil = None
+    if args.perfil:
+        import cProfile
+        perfil = cProfile.Profile()
+        perfil.enable()
+
+    t0 = time.perf_counter()
+    try:
+        run(args, met, listos)
+    finally:
+        if perfil is not None:
+            perfil.disable()
+            perfil.dump_stats(args.perfil)
+            print(f"Perfil cProfile -> {args.perfil} (ver con: python -m pstats {args.perfil})")
+    if args.metricas:
+        met.registrar("total", time.perf_counter() - t0)
+        met.guardar(args.metricas, {
+            "generado": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "argumentos": vars(args),
+        })
+        print(f"Métricas por etapa -> {args.metricas}")
+
+def run(args, met=SIN_METRICAS, listos=None):
+    """listos: con --vigilar, la foto de ZIP ya copiados; solo esos entran a la corrida (None = todos)."""
+    # ====== CONTROL ANTES DE PROCESAR ======
+    # (solo descargas_zip: el patrón FACTURA... no aplica a otras carpetas)
+    with met.medir("scan_control"):
+        zips = list_zips(ZIP_DIR)
+        if listos is not None:
+            zips = solo_listos(zips, listos)
+        esperados = load_esperados(args.esperados) if args.esperados else None
+        resumen_rows, faltantes_rows, duplicados_rows = control_faltantes(zips, TOTAL_ESPERADO, esperados)
+
+        write_csv(RESUMEN_CONTROL_CSV, resumen_rows, list(resumen_rows[0].keys()) if resumen_rows else ["Serie"])
+        write_csv(FALTANTES_CSV, faltantes_rows, FALTANTES_FIELDS)
+        if args.faltantes_detalle:
+            write_csv(FALTANTES_DETALLE_CSV, expandir_faltantes(faltantes_rows), FALTANTES_DETALLE_FIELDS)
+        write_csv(DUPLICADOS_CSV, duplicados_rows, ["Serie", "RUC", "Numero", "ZIP", "Tipo"])
+
+    # ====== PROCESO XML A CSV ======
+    # UNIFICADO: cada ZIP se lee una vez; Invoice -> facturas/items, CreditNote -> además notas_credito
+    adicionales = zips_adicionales(args.notas_dir)
+    zips_etl = zips + (adicionales if listos is None else solo_listos(adicionales, listos))
+
+    # VERIFICACIÓN DE ZIP: solo control, sin tocar las salidas del ETL
+    if args.verificar_zip:
+        with met.medir("verificar_zip"):
+            problemas, n_malos = verificar_zips(ZIP_DIR, zips_etl, args.workers)
+            write_csv(VERIFICACION_ZIP_CSV, problemas, VERIFICACION_FIELDS)
+        print("✅ Verificación de ZIP lista (no se procesaron XML)")
+        print(f"ZIP verificados: {len(zips_etl)} | Con problemas: {n_malos} -> {VERIFICACION_ZIP_CSV}")
+        for tipo in sorted({p["Problema"] for p in problemas}):
+            print(f"  {tipo}: {sum(p['Problema'] == tipo for p in problemas)}")
+        print(f"Resumen control -> {RESUMEN_CONTROL_CSV}")
+        print(f"Faltantes (rangos) -> {FALTANTES_CSV}")
+        print(f"Duplicados/No-parseables -> {DUPLICADOS_CSV}")
+        return
+
+    if args.solo_cabeceras:
+        # SOLO CABECERAS: archivos de control propios; sin manifest (ningún sha256), items ni notas
+        with met.medir("solo_cabeceras"):
+            etl = escanear_cabeceras(zips_etl, args, met)
+    else:
+        # INCREMENTAL: reutilizo lo ya procesado de ZIPs sin cambios
+        # (el manifest se mantiene en toda corrida; así el sha256 solo se calcula para ZIPs nuevos/tocados)
+        with met.medir("manifest"):
+            manifest = load_manifest(MANIFEST_JSON)
+            firmas, sin_cambios = classify_zips(ZIP_DIR, zips_etl, manifest)
+        reutilizar = sin_cambios if args.incremental and manifest else set()
+
+        try:
+            etl = procesar_zips(zips_etl, firmas, manifest, reutilizar, args, met)
+        except ManifestMismatch as e:
+            print(f"⚠️ Salida anterior no coincide con el manifest ({e}); se reprocesa todo")
+            etl = procesar_zips(zips_etl, firmas, manifest, set(), args, met)
+
+    # ====== SALIDA COLUMNAR (opcional) ======
+    parquet_filas = None
+    if args.parquet:
+        with met.medir("parquet"):
+            parquet_filas = export_parquet(TABLAS_PARQUET)
+
+    print("✅ Listo" + (" (solo cabeceras)" if args.solo_cabeceras else ""))
     print(f"ZIP encontrados: {len(zips)}")
+    if args.notas_dir:
+        print(f"ZIP de carpetas adicionales (--notas-dir): {len(zips_etl) - len(zips)}")
+    if args.incremental:
+        print(f"ZIP reutilizados (sin cambios): {etl['reutilizados']} | ZIP parseados: {etl['parseados']}")
     print(f"Resumen control -> {RESUMEN_CONTROL_CSV}")
-    print(f"Faltantes -> {FALTANTES_CSV}")
+    print(f"Faltantes (rangos) -> {FALTANTES_CSV}")
+    if args.faltantes_detalle:
+        print(f"Faltantes (uno por número) -> {FALTANTES_DETALLE_CSV}")
     print(f"Duplicados/No-parseables -> {DUPLICADOS_CSV}")
-    print(f"Documentos (facturas + notas) -> {FACTURAS_CSV}")
-    print(f"Items (solo Invoice) -> {ITEMS_CSV}")
-    print(f"Anulaciones (NCE motivo 01) -> {ANULACIONES_CSV}")
-    print(f"Errores -> {ERRORES_CSV}")
+    if args.solo_cabeceras:
+        print(f"Documentos (solo cabecera) -> {FACTURAS_CABECERA_CSV}")
+        print(f"Anulaciones (NCE motivo 01) -> {ANULACIONES_CABECERA_CSV}")
+        print(f"Errores -> {ERRORES_CABECERA_CSV}")
+    else:
+        print(f"Documentos (facturas + notas) -> {FACTURAS_CSV}")
+        print(f"Items (solo Invoice) -> {ITEMS_CSV}")
+        print(f"Anulaciones (NCE motivo 01) -> {ANULACIONES_CSV}")
+        print(f"Notas de crédito -> {NC_CSV} | Items NCE -> {NC_ITEMS_CSV}")
+        print(f"Errores -> {ERRORES_CSV}")
+    if etl["agregados"] is not None:
+        print("Ventas pre-agregadas (sin anuladas) -> " +
+              " | ".join(f"{os.path.join(OUT_DIR, k)}: {v}" for k, v in etl["agregados"].items()))
+    if etl["pipeline"] is not None:
+        print(f"Pipeline -> {etl['pipeline']}")
+    if etl["xml_omitidos"] is not None:
+        print(f"XML repetidos en otro ZIP (omitidos): {etl['xml_omitidos']} | "
+              f"Conflictos (mismo DocumentoKey, otro contenido): {etl['xml_conflictos']} -> {CONFLICTOS_XML_CSV}")
+    if etl["sqlite_ingeridos"] is not None:
+        print(f"SQLite -> {args.sqlite} (ZIP ingeridos en esta corrida: {etl['sqlite_ingeridos']})")
+    if parquet_filas is not None:
+        print(f"Parquet por año-mes -> {PARQUET_DIR}/ ({', '.join(f'{k}: {v}' for k, v in parquet_filas.items())})")
 
     # Mensaje rápido del control
     if resumen_rows:
@@ -440,8 +1155,9 @@ def main():
             )
 
     # Mensaje rápido de anulaciones
-    print(f"NCE de anulación detectadas: {len(anulaciones_rows)}")
-    print(f"Documentos marcados como anulados (Invoice): {sum(1 for d in docs_rows if d.get('TipoDocumentoXML')=='Invoice' and d.get('EsAnulado')=='SI')}")
+    print(f"NCE detectadas: {etl['notas_credito']}")
+    print(f"NCE de anulación detectadas: {etl['anulaciones']}")
+    print(f"Documentos marcados como anulados (Invoice): {etl['anulados']}")
 
 if __name__ == "__main__":
     main()
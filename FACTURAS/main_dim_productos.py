@@ -2,292 +2,449 @@
 # Lee:  salida_csv/items.csv  (columna: Descripcion)
 # Crea: salida_csv/dim_productos.csv  con Producto_PBI (igual a DAX DISTINCT de Descripcion)
 #      y además ProductoStd + Familia/Característica/ProcesoExtra/Material/Medida/Color
+#      + ProductoId / ProductoCanonico / Confianza (typos consolidados, ver consolidacion_productos.py)
+# Caché: salida_csv/dim_productos_cache.json (solo se clasifican las descripciones nuevas)
+# Reglas: reglas_sogas.json (o --reglas RUTA), ver reglas_productos.py
+# Muestra de control: reglas_sogas_muestra.csv (--verificar)
 
 from pathlib import Path
+import os
 import re
+import json
 import unicodedata
+from functools import lru_cache
+import argparse
+import sys
+import numpy as np
 import pandas as pd
 
+import reglas_productos
+from consolidacion_productos import consolidar
+from agregados_ventas import VENTAS_MES_FAMILIA, ventas_familia_material
+from reglas_productos import REGLAS_DEFAULT, cargar_reglas, version_archivos
+
 BASE_DIR = Path("salida_csv")
 ITEMS_CSV = BASE_DIR / "items.csv"
 OUT_CSV = BASE_DIR / "dim_productos.csv"
+CACHE_JSON = BASE_DIR / "dim_productos_cache.json"
+
+# Descripciones con el ProductoStd y los atributos que daba la clasificación escrita en el código
+# (antes de reglas_sogas.json). --verificar compara contra ella cuando se usan las reglas por defecto.
+MUESTRA_REGLAS = REGLAS_DEFAULT.with_name("reglas_sogas_muestra.csv")
+
+# Filas de items.csv por lote al buscar las descripciones distintas (la memoria depende de cuántos
+# productos distintos hay, no de cuántas líneas de items)
+FILAS_LOTE = 200_000
 
 # -----------------------------
 # Utilidades
 # -----------------------------
-REPLACE_CHARS = r"[#\-\*\.,]"  # # - * . ,
+REPLACE_CHARS = re.compile(r"[#\-\*\.,]")  # # - * . ,
 MULTISPACE = re.compile(r"\s+")
 
 def strip_accents(s: str) -> str:
+    # ASCII puro (la gran mayoría): NFKD no cambia nada, me salto el recorrido por carácter
+    if s.isascii():
+        return s
     s = unicodedata.normalize("NFKD", s)
     return "".join(ch for ch in s if not unicodedata.combining(ch))
 
-def normalize_text(s: str) -> str:
-    s = (s or "")
+# -----------------------------
+# Reglas de normalización (variantes / ruido vienen del archivo de reglas, ver reglas_productos.py)
+# -----------------------------
+RE_MM_JUNTO = re.compile(r"\b(\d+)\s*MM\b")          # "2 MM" -> "2MM"
+RE_SEMIESTATICA = re.compile(r"\bSEMI\s*ESTATICA\b")
+RE_PAGO_ANTICIPADO = re.compile(r"\bPAGO\s+ANTICIPADO\b")
+
+def compile_word_table(table):
+    """
+    {palabra: reemplazo} -> función que reemplaza todas las palabras completas en una pasada.
+    Las más largas van primero en la alternancia (con el límite de palabra final solo calza la palabra entera).
+    """
+    words = sorted(table, key=len, reverse=True)
+    rx = re.compile(r"\b(?:" + "|".join(map(re.escape, words)) + r")\b")
+    repl = lambda m: table[m.group()]
+    return lambda s: rx.sub(repl, s)
+
+def configure_normalization(reglas):
+    """
+    Typos / variantes (palabra completa -> forma canónica) y ruido (palabras que se borran, van DESPUÉS
+    de SEMIESTATICA) de las reglas. Se compilan una sola vez a un único regex + dict por tabla,
+    así es UNA pasada en vez de un re.sub por regla. Vacía las cachés de normalize_text.
+    """
+    global sub_variantes, sub_ruido
+    variantes = {v: canon for canon, vs in reglas.variantes.items() for v in vs}
+    sub_variantes = compile_word_table(variantes) if variantes else (lambda s: s)
+    sub_ruido = compile_word_table({w: " " for w in reglas.ruido}) if reglas.ruido else (lambda s: s)
+    _normalize_crudo.cache_clear()
+    _normalize_clave.cache_clear()
+
+# Caché LRU acotada (por texto crudo y por texto ya limpiado de mayúsculas/tildes/puntuación)
+NORMALIZE_CACHE_SIZE = 200_000
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _normalize_clave(s: str) -> str:
+    # s ya viene en mayúsculas, sin tildes ni puntuación y con espacios compactados:
+    # descripciones que solo difieren en eso comparten esta entrada
+    s = RE_MM_JUNTO.sub(r"\1MM", s)
+    s = sub_variantes(s)
+    s = RE_SEMIESTATICA.sub("SEMIESTATICA", s)
+
+    # Limpieza de ruido
+    s = sub_ruido(s)
+    s = RE_PAGO_ANTICIPADO.sub(" ", s)
+
+    # Compactar espacios
+    return MULTISPACE.sub(" ", s).strip()
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _normalize_crudo(s: str) -> str:
     s = s.strip()
     if not s:
         return ""
 
     # Normalización estilo "Python" (lo que ya veníamos haciendo)
     s = strip_accents(s.upper())
-    s = re.sub(REPLACE_CHARS, " ", s)
-
-    # unir "2 MM" -> "2MM"
-    s = re.sub(r"\b(\d+)\s*MM\b", r"\1MM", s)
-
-    # --- Typos / variantes (ajusta aquí cuando encuentres más) ---
-    # DRIZA (incluye DRIZ, DIZA, DRYZA, DRIUZA, DRISA, DRIZAS, etc.)
-    s = re.sub(r"\b(DRIUZA|DRYZA|DRISA|DIZA|DRIZAS|DRIZ)\b", "DRIZA", s)
-
-    # ALQUITRANADO
-    s = re.sub(r"\bALQUITRANAD[OA]S?\b", "ALQUITRANADO", s)
-
-    # TORCIDO
-    s = re.sub(r"\b(TORCIDI|TORZIDO|TORCID[OA]S?)\b", "TORCIDO", s)
-
-    # TRENZADO
-    s = re.sub(r"\bTRENZAD[OA]S?\b", "TRENZADO", s)
-
-    # POLIESTER
-    s = re.sub(r"\b(DEPOLIESTER|POLYESTER|POLYESTERS|POLIESTERS)\b", "POLIESTER", s)
+    s = REPLACE_CHARS.sub(" ", s)
+    s = MULTISPACE.sub(" ", s).strip()
+    return _normalize_clave(s)
 
-    # POLIPROPILENO (incluye PP y error POLIPROPIENO)
-    s = re.sub(r"\bPOLIPROPIENO\b", "POLIPROPILENO", s)
-    s = re.sub(r"\bPP\b", "POLIPROPILENO", s)
+def normalize_text(s: str) -> str:
+    return _normalize_crudo(s or "")
 
-    # NYLON (NAYLON)
-    s = re.sub(r"\bNAYLON\b", "NYLON", s)
+# Reglas por defecto (main() las cambia con --reglas)
+REGLAS = cargar_reglas()
+configure_normalization(REGLAS)
 
-    # SEMIESTATICA
-    s = re.sub(r"\bSEMI\s*ESTATICA\b", "SEMIESTATICA", s)
-
-    # Limpieza de ruido
-    s = re.sub(r"\bKILOGRAMO(S)?\b", " ", s)
-    s = re.sub(r"\bROLLOS?\b", " ", s)
-    s = re.sub(r"\bPAGO\s+ANTICIPADO\b", " ", s)
-
-    # Compactar espacios
-    s = MULTISPACE.sub(" ", s).strip()
-    return s
+def normalize_cache_stats():
+    """Aciertos/fallos de la caché de normalize_text (crudo = texto tal cual, clave = ya limpiado)."""
+    stats = {}
+    for nombre, fn in (("crudo", _normalize_crudo), ("clave", _normalize_clave)):
+        info = fn.cache_info()
+        stats[nombre] = {"hits": info.hits, "misses": info.misses, "size": info.currsize, "maxsize": info.maxsize}
+    return stats
 
 def tokenize(s: str):
     return s.split(" ") if s else []
 
 # -----------------------------
-# Reglas de Familia / Característica / Proceso / Material
+# Clasificación (Familia / Característica / ProcesoExtra / Material / Medida / Color)
+# -----------------------------
+# Las reglas son datos (reglas_sogas.json por defecto); aquí solo se aplican, de dos formas equivalentes:
+# una pasada por los tokens de cada producto (Reglas.clasificar) o por columnas completas con numpy.
+def classify_rowwise(df_prod, reglas):
+    """Una pasada por producto con las tablas compiladas. Requiere ProductoStd y Tokens."""
+    filas = [reglas.clasificar(std, tokens) for std, tokens in zip(df_prod["ProductoStd"], df_prod["Tokens"])]
+    valores = list(zip(*filas)) if filas else [()] * len(reglas.nombres)
+    for col, vals in zip(reglas.nombres, valores):
+        df_prod[col] = pd.Series(vals, index=df_prod.index, dtype=object)
+    return df_prod
+
+class TokenMasks:
+    """
+    Máscaras booleanas "token in set(tokens)" para todas las palabras clave de las reglas,
+    armadas en una sola pasada sobre los tokens aplanados (sin set() ni Series por fila).
+    """
+
+    def __init__(self, tokens, keywords):
+        lens = tokens.str.len().to_numpy()
+        filas = np.repeat(np.arange(len(tokens)), lens)
+        planos = pd.Series([t for ts in tokens for t in ts], dtype=object)
+
+        self.keywords = {k: i for i, k in enumerate(dict.fromkeys(keywords))}
+        kw = planos.map(self.keywords).to_numpy()
+        ok = ~pd.isna(kw)
+
+        self.matriz = np.zeros((len(tokens), len(self.keywords)), dtype=bool)
+        self.matriz[filas[ok], kw[ok].astype(np.int64)] = True
+        self._filas = filas
+        self._planos = planos
+
+    def __getitem__(self, token):
+        return self.matriz[:, self.keywords[token]]
+
+    def ends_with(self, suffix):
+        # algún token termina en `suffix`
+        m = np.zeros(self.matriz.shape[0], dtype=bool)
+        m[self._filas[self._planos.str.endswith(suffix).to_numpy(dtype=bool)]] = True
+        return m
+
+def classify_vectorized(df_prod, reglas):
+    """
+    Misma prioridad que Reglas.clasificar, sobre columnas completas: cada regla es una máscara y se
+    asigna solo a las filas que ninguna regla anterior de la columna resolvió.
+    """
+    # object: regex de Python (igual que la versión por producto), no el motor de pyarrow
+    std = df_prod["ProductoStd"].astype(object)
+    tk = TokenMasks(df_prod["Tokens"], reglas.keywords)
+    n = len(df_prod)
+    cols = {}
+    for col, default, reglas_col in reglas.columnas:
+        valor = np.full(n, default, dtype=object)
+        pendiente = np.ones(n, dtype=bool)
+        for r in reglas_col:
+            if not pendiente.any():
+                break
+            cond = pendiente.copy()
+            if r.sufijo:
+                cond &= tk.ends_with(r.sufijo)
+            if r.contiene is not None:
+                cond &= std.str.contains(r.contiene, regex=False).to_numpy(dtype=bool)
+            for c, vs in r.si:
+                cond &= np.isin(cols[c], list(vs))
+            for c, vs in r.si_no:
+                cond &= ~np.isin(cols[c], list(vs))
+            if r.regex is not None:
+                # Solo sobre las filas pendientes (cada regex de Medida deja menos para la siguiente)
+                idx = np.flatnonzero(cond)
+                ms = list(map(r.regex.search, std.to_numpy()[idx]))
+                ok = np.fromiter((m is not None for m in ms), dtype=bool, count=len(ms))
+                valor[idx[ok]] = [r.formato(m) for m in ms if m is not None]
+                pendiente[idx[ok]] = False
+            elif r.tokens:
+                # El valor es el primer token de la lista que está (o el fijo de la regla)
+                for tok in r.tokens:
+                    c_tok = cond & tk[tok]
+                    valor[c_tok] = r.valor if r.valor is not None else tok
+                    pendiente &= ~c_tok
+                    cond &= ~c_tok
+            else:
+                valor[cond] = r.valor
+                pendiente &= ~cond
+        cols[col] = valor
+        df_prod[col] = valor
+    return df_prod
+
+def compare_classifications(df_prod, reglas, max_ejemplos=10):
+    """
+    Corre ambas versiones sobre el mismo df_prod y retorna {columna: [(Producto_PBI, fila, vectorizada), ...]}
+    solo con las columnas que difieren (vacío = equivalentes).
+    """
+    base = df_prod[["Producto_PBI", "ProductoStd", "Tokens"]]
+    ref = classify_rowwise(base.copy(), reglas)
+    vec = classify_vectorized(base.copy(), reglas)
+
+    diferencias = {}
+    for col in reglas.nombres:
+        a = ref[col].astype(str).to_numpy()
+        b = vec[col].astype(str).to_numpy()
+        idx = np.flatnonzero(a != b)
+        if len(idx):
+            diferencias[col] = [(base["Producto_PBI"].iat[i], a[i], b[i]) for i in idx[:max_ejemplos]]
+    return diferencias
+
+def compare_muestra(path, reglas, max_ejemplos=10):
+    """
+    Normaliza y clasifica (por columnas y producto por producto) las descripciones de la muestra y
+    retorna {columna: [(Producto_PBI, muestra, obtenido), ...]} solo con las columnas que difieren.
+    """
+    muestra = pd.read_csv(path, dtype=str, keep_default_na=False, encoding="utf-8")
+    productos = muestra["Producto_PBI"].tolist()
+    columnas = cache_cols(reglas)
+    diferencias = {}
+    for por_fila in (False, True):
+        obtenidos = classify_new(productos, reglas, por_fila)
+        for j, col in enumerate(columnas):
+            if col not in muestra:
+                continue
+            for prod, esperado in zip(productos, muestra[col]):
+                valor = str(obtenidos[prod][j])
+                ejemplos = diferencias.setdefault(col, [])
+                if valor != esperado and (prod, esperado, valor) not in ejemplos and len(ejemplos) < max_ejemplos:
+                    ejemplos.append((prod, esperado, valor))
+    return {col: ejemplos for col, ejemplos in diferencias.items() if ejemplos}
+
+# -----------------------------
+# Caché persistente de clasificación
 # -----------------------------
-COLOR_LIST = [
-    "BLANCO","NEGRO","ROJO","VERDE","AZUL","AMARILLO","NARANJA","CELESTE","GRIS","MARRON",
-    "BEIGE","CREMA","ROSADO","MORADO","VIOLETA","FUCSIA","TURQUESA","DORADO","PLATEADO",
-    "NATURAL","COLOR"
-]
-
-def pick_family(tokens):
-    st = set(tokens)
-
-    # prioridad: ALQUITRANADO gana a todo
-    if "ALQUITRANADO" in st:
-        return "ALQUITRANADO"
-
-    # DRIZA gana a SOGA
-    if "DRIZA" in st:
-        return "DRIZA"
-
-    for fam in ["CABO","CINTA","CORDEL","CUERDA","HILO","FIBRA"]:
-        if fam in st:
-            return fam
-
-    # POLIESTER solo si no cayó en anteriores
-    if "POLIESTER" in st:
-        return "POLIESTER"
-
-    if "SOGA" in st:
-        return "SOGA"
-
-    if "TRENZADO" in st:
-        return "TRENZADO"
-
-    return "NO ESPECIFICADO"
-
-def pick_caracteristica(tokens, family):
-    st = set(tokens)
-
-    if "SEMIESTATICA" in st:
-        return "SEMIESTATICA"
-    if "IRLANDES" in st:
-        return "IRLANDES"
-    if "PLANO" in st:
-        return "PLANO"
-
-    if "TORCIDO" in st:
-        # Torcido solo si familia HILO (y también útil en CABO)
-        if family in ("HILO", "CABO"):
-            return "TORCIDO"
-        return "TORCIDO"
-
-    # TRENZADO solo si familia CORDEL
-    if family == "CORDEL" and "TRENZADO" in st:
-        return "TRENZADO"
-
-    return "NO ESPECIFICADO"
-
-def pick_proceso_extra(tokens, family):
-    st = set(tokens)
-    if "ALQUITRANADO" in st and family != "ALQUITRANADO":
-        return "ALQUITRANADO"
-    return "NO ESPECIFICADO"
-
-def pick_material(tokens, family, proceso_extra, producto_std):
-    st = set(tokens)
-
-    if "MIXTO" in st:
-        return "MIXTO"
-
-    # NYLON reglas fuertes
-    if family == "CORDEL":
-        return "NYLON"
-    if proceso_extra == "ALQUITRANADO":
-        return "NYLON"
-    if "/210" in producto_std:
-        return "NYLON"
-
-    # CUERDA: si tiene DIAMETRO o MM => POLIESTER
-    if family == "CUERDA" and ("DIAMETRO" in st or any(tok.endswith("MM") for tok in tokens)):
-        return "POLIESTER"
-    if "/250" in producto_std:
-        return "POLIESTER"
-
-    if "MACRAME" in st:
-        return "MACRAME"
-    if "RAFIA" in st:
-        return "RAFIA"
-    if "POLIPROPILENO" in st:
-        return "POLIPROPILENO"
-    if "NYLON" in st:
-        return "NYLON"
-    if "POLIESTER" in st:
-        return "POLIESTER"
-
-    return "NO ESPECIFICADO"
+# Producto_PBI -> [ProductoStd, FamiliaProducto, ..., ColorStd]. Tokens y TokensStr salen de ProductoStd.
+# Lleva el hash de las reglas: cualquier cambio en el archivo de reglas o en el código que las aplica la descarta.
+CACHE_VERSION = 1
+
+def cache_cols(reglas):
+    return ["ProductoStd"] + reglas.nombres
+
+def version_reglas(path=REGLAS_DEFAULT):
+    return version_archivos(__file__, reglas_productos.__file__, path)
+
+def load_cache(path, reglas, columnas):
+    """{Producto_PBI: [ProductoStd, ...]}; vacía si no existe, está dañada o es de otras reglas."""
+    if not path.exists():
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != CACHE_VERSION or data.get("reglas") != reglas or data.get("columnas") != columnas:
+        print("Reglas de clasificación cambiadas: se vuelve a clasificar todo el catálogo")
+        return {}
+    return data.get("productos", {})
+
+def save_cache(path, reglas, columnas, productos):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = str(path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": CACHE_VERSION, "reglas": reglas, "columnas": columnas, "productos": productos},
+                  f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def classify_new(productos, reglas, por_fila=False):
+    """Normaliza y clasifica una lista de Producto_PBI; retorna {Producto_PBI: [ProductoStd, ...]}."""
+    df = pd.DataFrame({"Producto_PBI": productos})
+    df["ProductoStd"] = df["Producto_PBI"].apply(normalize_text)
+    df["Tokens"] = df["ProductoStd"].apply(tokenize)
+    if por_fila:
+        classify_rowwise(df, reglas)
+    else:
+        classify_vectorized(df, reglas)
+    return dict(zip(df["Producto_PBI"], df[cache_cols(reglas)].astype(object).values.tolist()))
 
 # -----------------------------
-# Medida y Color
+# Lectura de items.csv (solo la columna Descripcion, por lotes)
 # -----------------------------
-RE_FRAC = re.compile(r"\b(\d+)\s*/\s*(\d+)\b")                 # 48/210, 3/32
-RE_DENIER_COMP = re.compile(r"\b(\d{3,5}D/\d{2,4})\b")          # 1000D/192
-RE_DENIER = re.compile(r"\b(\d+)\s*(DENIER(S)?)\b")            # 1000 DENIER(S)
-RE_D = re.compile(r"\b(\d{3,5})D\b")                           # 1000D
-RE_MM = re.compile(r"\b(\d+)\s*MM\b")                          # 2MM
-RE_PULG = re.compile(r"\b(\d+)\s*(PULGADAS?|PULG|PUL)\b")       # 3 PULG
-RE_PULG_JUNTO = re.compile(r"\b(\d+)(PULGADAS?|PULG|PUL)\b")    # 3PULG
-RE_NUM = re.compile(r"\b(\d+)\b")                              # número suelto
-
-def pick_medida(producto_std: str):
-    # 1) fracción ##/##
-    m = RE_FRAC.search(producto_std)
-    if m:
-        return f"{m.group(1)}/{m.group(2)}"
-
-    # 2) denier compuesto 1000D/192
-    m = RE_DENIER_COMP.search(producto_std)
-    if m:
-        return m.group(1)
-
-    # 3) denier: “1000 DENIER(S)” o “1000D”
-    m = RE_DENIER.search(producto_std)
-    if m:
-        return f"{m.group(1)} DENIER"
-    m = RE_D.search(producto_std)
-    if m:
-        return f"{m.group(1)} DENIER"
-
-    # 4) mm
-    m = RE_MM.search(producto_std)
-    if m:
-        return f"{m.group(1)}MM"
-
-    # 5) pulgada (3PULG / 3 PULG)
-    m = RE_PULG_JUNTO.search(producto_std)
-    if m:
-        return f"{m.group(1)} PULGADA"
-    m = RE_PULG.search(producto_std)
-    if m:
-        return f"{m.group(1)} PULGADA"
-
-    # 6) número suelto (último recurso)
-    m = RE_NUM.search(producto_std)
-    if m:
-        return m.group(1)
-
-    return ""
-
-def pick_color(tokens):
-    st = set(tokens)
-    for c in COLOR_LIST:
-        if c in st:
+def find_desc_column(path):
+    """Nombre de la columna "Descripcion" según la cabecera (sin leer el resto del archivo)."""
+    columnas = pd.read_csv(path, nrows=0, encoding="utf-8").columns
+    for c in columnas:
+        if c.strip().lower() == "descripcion":
             return c
-    return ""
+    raise ValueError(f"No encontré columna 'Descripcion'. Columnas: {list(columnas)}")
+
+def distinct_descriptions(path, col, filas_lote=FILAS_LOTE):
+    """
+    Descripciones distintas, no vacías, en orden de primera aparición (lo mismo que drop_duplicates
+    sobre la columna completa), leyendo solo esa columna de a `filas_lote` filas.
+    Retorna (descripciones, líneas leídas).
+    """
+    vistos = {}
+    lineas = 0
+    # dtype=str: el texto tal cual (sin inferir números por lote); vacíos y "NA" quedan NaN, como antes
+    for lote in pd.read_csv(path, usecols=[col], dtype=str, chunksize=filas_lote, encoding="utf-8"):
+        lineas += len(lote)
+        vistos.update(dict.fromkeys(lote[col].dropna().drop_duplicates().tolist()))
+    vistos.pop("", None)
+    return list(vistos), lineas
 
 # -----------------------------
 # Main
 # -----------------------------
-def main():
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Dimensión de productos (DISTINCT estilo Power BI + atributos)")
+    ap.add_argument("--por-fila", action="store_true",
+                    help="Clasifica producto por producto (una pasada por sus tokens) en vez de por columnas")
+    ap.add_argument("--verificar", action="store_true",
+                    help="Compara la clasificación vectorizada contra la de --por-fila y, con las reglas por defecto, "
+                         f"contra la muestra {MUESTRA_REGLAS.name}, antes de guardar; sale con error si difieren")
+    ap.add_argument("--reglas", default=str(REGLAS_DEFAULT), metavar="RUTA",
+                    help=f"Archivo JSON con las reglas de normalización y clasificación (default {REGLAS_DEFAULT.name})")
+    ap.add_argument("--sin-consolidar", action="store_true",
+                    help="No agrega ProductoId / ProductoCanonico / Confianza (consolidación automática de typos)")
+    ap.add_argument("--filas-lote", type=int, default=FILAS_LOTE, metavar="N",
+                    help=f"Filas de items.csv por lote al leer las descripciones (default {FILAS_LOTE})")
+    ap.add_argument("--cache", default=str(CACHE_JSON), metavar="RUTA",
+                    help=f"Caché de clasificación por descripción (default {CACHE_JSON}); se invalida si cambian las reglas")
+    ap.add_argument("--sin-cache", action="store_true",
+                    help="Clasifica todo el catálogo de nuevo (ignora la caché guardada y la reescribe)")
+    return ap.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    reglas_path = Path(args.reglas)
+    reglas = REGLAS
+    if reglas_path.resolve() != REGLAS_DEFAULT.resolve():
+        reglas = cargar_reglas(reglas_path)
+        configure_normalization(reglas)
+    columnas = cache_cols(reglas)
+
     if not ITEMS_CSV.exists():
         raise FileNotFoundError(f"No existe: {ITEMS_CSV}")
 
-    df_items = pd.read_csv(ITEMS_CSV, encoding="utf-8", low_memory=False)
-
     # Detecta columna "Descripcion"
-    col_desc = None
-    for c in df_items.columns:
-        if c.strip().lower() == "descripcion":
-            col_desc = c
-            break
-    if col_desc is None:
-        raise ValueError(f"No encontré columna 'Descripcion'. Columnas: {list(df_items.columns)}")
+    col_desc = find_desc_column(ITEMS_CSV)
 
     # 1) "DISTINCT" como Power BI: tal cual viene la descripción (sin limpiar)
-    df_prod = pd.DataFrame({
-        "Producto_PBI": df_items[col_desc].fillna("").astype(str)
-    })
-
-    # OJO: Esto imita el DISTINCT crudo: drop_duplicates sobre el texto tal cual
-    df_prod = df_prod[df_prod["Producto_PBI"] != ""].drop_duplicates(subset=["Producto_PBI"]).reset_index(drop=True)
-
-    # 2) Ahora sí, hacemos la estandarización "Python"
-    df_prod["ProductoStd"] = df_prod["Producto_PBI"].apply(normalize_text)
+    # OJO: Esto imita el DISTINCT crudo: distintos sobre el texto tal cual, en orden de aparición
+    productos_pbi, lineas = distinct_descriptions(ITEMS_CSV, col_desc, args.filas_lote)
+    df_prod = pd.DataFrame({"Producto_PBI": pd.Series(productos_pbi, dtype=object)})
+
+    # 2) - 9) Estandarización "Python" + Familia, Característica, ProcesoExtra, Material, Medida y Color:
+    # solo para las descripciones que no están en la caché (el catálogo casi no cambia entre corridas)
+    cache_path = Path(args.cache)
+    version = version_reglas(reglas_path)
+    previos = {} if args.sin_cache else load_cache(cache_path, version, columnas)
+    nuevos = [p for p in df_prod["Producto_PBI"] if p not in previos]
+    clasificados = classify_new(nuevos, reglas, args.por_fila) if nuevos else {}
+    productos = {p: previos.get(p) or clasificados[p] for p in df_prod["Producto_PBI"]}
+
+    attrs = pd.DataFrame(list(productos.values()), columns=columnas, dtype=object)
+    df_prod["ProductoStd"] = attrs["ProductoStd"]
     df_prod["Tokens"] = df_prod["ProductoStd"].apply(tokenize)
     df_prod["TokensStr"] = df_prod["Tokens"].apply(lambda xs: "|".join(xs))
-
-    # 4) Familia
-    df_prod["FamiliaProducto"] = df_prod["Tokens"].apply(pick_family)
-
-    # 5) Característica
-    df_prod["Caracteristica"] = df_prod.apply(lambda r: pick_caracteristica(r["Tokens"], r["FamiliaProducto"]), axis=1)
-
-    # 6) Proceso extra
-    df_prod["ProcesoExtra"] = df_prod.apply(lambda r: pick_proceso_extra(r["Tokens"], r["FamiliaProducto"]), axis=1)
-
-    # 7) Material
-    df_prod["Material"] = df_prod.apply(
-        lambda r: pick_material(r["Tokens"], r["FamiliaProducto"], r["ProcesoExtra"], r["ProductoStd"]),
-        axis=1
-    )
-
-    # 8) Medida
-    df_prod["MedidaStd"] = df_prod["ProductoStd"].apply(pick_medida)
-
-    # 9) Color
-    df_prod["ColorStd"] = df_prod["Tokens"].apply(pick_color)
-
-    # Guardar
+    for col in reglas.nombres:
+        df_prod[col] = attrs[col]
+
+    if args.verificar:
+        diferencias = compare_classifications(df_prod, reglas)
+        if diferencias:
+            print("⚠️ La clasificación vectorizada NO coincide con la de producto por producto:")
+            for col, ejemplos in diferencias.items():
+                for prod, ref, vec in ejemplos:
+                    print(f"  {col}: {prod!r} -> fila={ref!r} vectorizada={vec!r}")
+            return 1
+        print(f"✅ Clasificación vectorizada equivalente a la de producto por producto ({len(df_prod)} productos)")
+
+        if reglas is REGLAS:
+            diferencias = compare_muestra(MUESTRA_REGLAS, reglas)
+            if diferencias:
+                print(f"⚠️ {reglas_path.name} ya no clasifica igual que la muestra {MUESTRA_REGLAS.name}:")
+                for col, ejemplos in diferencias.items():
+                    for prod, esperado, obtenido in ejemplos:
+                        print(f"  {col}: {prod!r} -> muestra={esperado!r} obtenido={obtenido!r}")
+                return 1
+            print(f"✅ Clasificación igual a la muestra {MUESTRA_REGLAS.name}")
+        else:
+            print(f"(La muestra {MUESTRA_REGLAS.name} es de {REGLAS_DEFAULT.name}; con --reglas no se compara)")
+
+    # 10) Consolidación de typos: ProductoStd parecidos -> un mismo ProductoId (no se cachea: depende del
+    # catálogo completo, y es una pasada por el vocabulario)
+    consolidacion = None
+    if not args.sin_consolidar:
+        ids, canonicos, confianzas, consolidacion = consolidar(df_prod["ProductoStd"].tolist(), reglas.keywords)
+        df_prod["ProductoId"] = ids
+        df_prod["ProductoCanonico"] = canonicos
+        df_prod["Confianza"] = confianzas
+
+    # Guardar (la caché queda con el catálogo actual)
     BASE_DIR.mkdir(parents=True, exist_ok=True)
     df_prod.to_csv(OUT_CSV, index=False, encoding="utf-8")
+    save_cache(cache_path, version, columnas, productos)
+
+    # Ventas por mes × familia × material, desde ventas_mes_producto.csv de main.py (si está)
+    filas_familia = None
+    if {"FamiliaProducto", "Material"} <= set(reglas.nombres):
+        clasificacion = dict(zip(df_prod["Producto_PBI"], zip(df_prod["FamiliaProducto"], df_prod["Material"])))
+        filas_familia = ventas_familia_material(BASE_DIR, clasificacion)
 
     print("✅ Listo")
-    print(f"Productos DISTINCT estilo Power BI (Producto_PBI): {len(df_prod)}")
+    print(f"Productos DISTINCT estilo Power BI (Producto_PBI): {len(df_prod)} (de {lineas} líneas de items)")
     print(f"Archivo generado: {OUT_CSV}")
+    if consolidacion is not None:
+        print(
+            f"Consolidación: {consolidacion['productos_std']} ProductoStd -> {consolidacion['canonicos']} productos "
+            f"canónicos ({consolidacion['palabras_corregidas']} palabras corregidas)"
+        )
+    if filas_familia is not None:
+        print(f"Ventas por mes/familia/material -> {BASE_DIR / VENTAS_MES_FAMILIA} ({filas_familia} filas)")
+    print(f"Reglas: {reglas_path} ({reglas.nombre or 'sin nombre'}, {len(reglas.nombres)} atributos)")
+    print(f"Caché de clasificación: {len(productos) - len(nuevos)} reutilizados / {len(nuevos)} clasificados -> {cache_path}")
+    cache = normalize_cache_stats()
+    print(
+        f"Caché normalize_text: crudo {cache['crudo']['hits']} aciertos / {cache['crudo']['misses']} fallos | "
+        f"clave {cache['clave']['hits']} aciertos / {cache['clave']['misses']} fallos"
+    )
     print("Relación 1 a 1 sugerida en Power BI: Productos[Producto_PBI] -> Items[Descripcion]")
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,140 @@
+# manifest_zip.py
+# Manifest de ZIPs procesados, usado por main.py --incremental.
+#
+# Por cada ZIP guarda: nombre, tamaño, mtime, sha256 y cuántas filas aportó a cada CSV.
+# Como main.py escribe los CSV en el orden de los ZIP, con esos conteos se puede
+# recortar el "segmento" de cada ZIP en la salida anterior y reutilizarlo sin re-parsear.
+
+import os
+import csv
+import json
+import hashlib
+
+MANIFEST_VERSION = 2  # 2: + notas_credito / notas_credito_items
+
+def file_sha256(path, bufsize=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(bufsize), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def load_manifest(path):
+    """
+    Retorna la lista de entradas del manifest (en el orden de la salida anterior),
+    o None si no existe / es de otra versión / está dañado.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("version") != MANIFEST_VERSION:
+        return None
+    return data.get("zips", [])
+
+def save_manifest(path, entries):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": MANIFEST_VERSION, "zips": entries}, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+def classify_zips(zip_dir, zips, manifest):
+    """
+    Compara los ZIP actuales contra el manifest.
+    Retorna (firmas, sin_cambios):
+      - firmas: {zip: {"zip", "size", "mtime_ns", "sha256"}} para el manifest nuevo
+      - sin_cambios: set de ZIP cuyo contenido es el mismo de la corrida anterior
+    El sha256 solo se recalcula si cambió tamaño o mtime (ej. ZIP re-descargado o tocado).
+    """
+    previos = {e["zip"]: e for e in (manifest or [])}
+    firmas = {}
+    sin_cambios = set()
+
+    for zname in zips:
+        st = os.stat(os.path.join(zip_dir, zname))
+        prev = previos.get(zname)
+
+        if prev and prev["size"] == st.st_size and prev["mtime_ns"] == st.st_mtime_ns:
+            sha = prev["sha256"]
+            sin_cambios.add(zname)
+        else:
+            sha = file_sha256(os.path.join(zip_dir, zname))
+            if prev and prev["sha256"] == sha:
+                sin_cambios.add(zname)
+
+        firmas[zname] = {"zip": zname, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": sha}
+
+    return firmas, sin_cambios
+
+class ManifestMismatch(ValueError):
+    """Los CSV anteriores no calzan con el manifest (editados a mano, columnas nuevas, etc.)."""
+
+def iter_segments(salidas, manifest):
+    """
+    Lee los CSV anteriores y los corta por ZIP según los conteos del manifest, de a un segmento
+    (no carga toda la salida anterior en memoria).
+      - salidas: lista de (ruta_csv, fieldnames) en el mismo orden que entry["filas"]
+    Genera (zip, (filas_csv_1, filas_csv_2, ...)) en el orden de la salida anterior.
+    Lanza ManifestMismatch si los CSV no calzan con el manifest.
+    """
+    files = []
+    try:
+        readers = []
+        for path, fieldnames in salidas:
+            try:
+                f = open(path, "r", newline="", encoding="utf-8")
+            except OSError as e:
+                raise ManifestMismatch(f"no se pudo abrir {path}: {e}")
+            files.append(f)
+            r = csv.DictReader(f)
+            if r.fieldnames != fieldnames:
+                raise ManifestMismatch(f"columnas distintas en {path}")
+            readers.append(r)
+
+        for entry in manifest:
+            filas = entry["filas"]
+            if len(filas) != len(readers):
+                raise ManifestMismatch("manifest con otro número de salidas")
+            seg = []
+            for r, n in zip(readers, filas):
+                rows = []
+                for _ in range(n):
+                    row = next(r, None)
+                    if row is None:
+                        raise ManifestMismatch("CSV más corto que lo indicado en el manifest")
+                    rows.append(row)
+                seg.append(rows)
+            yield entry["zip"], tuple(seg)
+
+        for r, (path, _) in zip(readers, salidas):
+            if next(r, None) is not None:
+                raise ManifestMismatch(f"{path} tiene filas que no están en el manifest")
+    finally:
+        for f in files:
+            f.close()
+
+def merge_segments(zips, reutilizar, segmentos, nuevos):
+    """
+    Une, en el orden de `zips`, los segmentos anteriores de los ZIP en `reutilizar`
+    con los resultados nuevos (`nuevos` entrega uno por cada ZIP que no se reutiliza).
+    Ambos lados vienen ordenados igual (sorted de nombres), así que basta un recorrido.
+    Genera (zip, filas, reutilizado).
+    """
+    for zname in zips:
+        if zname in reutilizar:
+            for zprev, seg in segmentos:
+                if zprev == zname:
+                    break
+            else:
+                raise ManifestMismatch(f"no encontré el segmento de {zname}")
+            yield zname, seg, True
+        else:
+            yield zname, next(nuevos), False
+
+    # Termino de leer la salida anterior para validar que no sobren filas
+    for _ in segmentos:
+        pass
@@ -0,0 +1,125 @@
+# metricas.py
+# Instrumentación opcional de main.py (--metricas / --perfil).
+#
+# Toma el tiempo de cada etapa (scan + control, extracción de cada ZIP, parseo de cada XML,
+# marcado de anulaciones, cada write_csv...) y cuenta documentos, líneas, bytes y errores.
+# Guarda un JSON con percentiles por etapa y los N más lentos (ZIP / XML), para encontrar
+# ZIPs patológicos y regresiones sin adivinar.
+#
+# Memoria acotada: por etapa solo se guardan los tiempos (array de floats) y un heap con los N
+# más lentos, no una clave por muestra.
+
+import os
+import json
+import math
+import heapq
+import time
+from array import array
+from contextlib import contextmanager, nullcontext
+
+def percentil(ordenados, p):
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not ordenados:
+        return None
+    k = max(0, math.ceil(p / 100 * len(ordenados)) - 1)
+    return ordenados[min(k, len(ordenados) - 1)]
+
+class Metricas:
+    def __init__(self, top=10):
+        self.top = top
+        self.tiempos = {}      # etapa -> array('d') de segundos
+        self.lentos = {}       # etapa -> heap [(segundos, clave)] con los `top` más lentos
+        self.contadores = {}
+        self.detalles = {}     # resúmenes ya armados (ej. etapas de --pipeline)
+
+    def registrar(self, etapa, seg, clave=""):
+        t = self.tiempos.get(etapa)
+        if t is None:
+            t = self.tiempos[etapa] = array("d")
+            self.lentos[etapa] = []
+        t.append(seg)
+        if clave:
+            self._candidato(self.lentos[etapa], seg, clave)
+
+    def _candidato(self, h, seg, clave):
+        if len(h) < self.top:
+            heapq.heappush(h, (seg, clave))
+        elif seg > h[0][0]:
+            heapq.heapreplace(h, (seg, clave))
+
+    @contextmanager
+    def medir(self, etapa, clave=""):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar(etapa, time.perf_counter() - t0, clave)
+
+    def contar(self, nombre, n=1):
+        self.contadores[nombre] = self.contadores.get(nombre, 0) + n
+
+    def anotar(self, nombre, valor):
+        self.detalles[nombre] = valor
+
+    # --- para traer las métricas de un proceso worker (--workers) ---
+    def exportar(self):
+        return {
+            "tiempos": {e: t.tobytes() for e, t in self.tiempos.items()},
+            "lentos": self.lentos,
+            "contadores": self.contadores,
+        }
+
+    def unir(self, datos):
+        for etapa, crudo in datos["tiempos"].items():
+            t = array("d")
+            t.frombytes(crudo)
+            self.tiempos.setdefault(etapa, array("d")).extend(t)
+            h = self.lentos.setdefault(etapa, [])
+            for seg, clave in datos["lentos"].get(etapa, []):
+                self._candidato(h, seg, clave)
+        for nombre, n in datos["contadores"].items():
+            self.contar(nombre, n)
+
+    def resumen(self):
+        etapas = {}
+        for etapa, t in self.tiempos.items():
+            ordenados = sorted(t)
+            total = sum(ordenados)
+            etapas[etapa] = {
+                "n": len(ordenados),
+                "total_seg": round(total, 6),
+                "media_seg": round(total / len(ordenados), 6) if ordenados else None,
+                "p50_seg": percentil(ordenados, 50),
+                "p90_seg": percentil(ordenados, 90),
+                "p99_seg": percentil(ordenados, 99),
+                "max_seg": ordenados[-1] if ordenados else None,
+                "mas_lentos": [{"clave": c, "seg": round(s, 6)} for s, c in sorted(self.lentos[etapa], reverse=True)],
+            }
+        return {"etapas": etapas, "contadores": dict(self.contadores), **self.detalles}
+
+    def guardar(self, path, extra=None):
+        data = {**(extra or {}), **self.resumen()}
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+        return data
+
+class SinMetricas:
+    """Misma interfaz que Metricas, sin costo (por defecto, cuando no se pide --metricas)."""
+
+    _nulo = nullcontext()
+
+    def medir(self, etapa, clave=""):
+        return self._nulo
+
+    def registrar(self, etapa, seg, clave=""):
+        pass
+
+    def contar(self, nombre, n=1):
+        pass
+
+    def anotar(self, nombre, valor):
+        pass
+
+SIN_METRICAS = SinMetricas()
@@ -0,0 +1,134 @@
+# nota_credito.py
+# Filas de Notas de Crédito (notas_credito.csv / notas_credito_items.csv).
+# Lo usan NOTAS DE CREDITO/main.py y la ingesta unificada de FACTURAS/main.py.
+
+from ubl_extractor import HEADER_PATHS, DISCREPANCY_GROUP, line_group, compile_spec
+
+NC_FIELDS = [
+    "NotaCreditoKey", "ZIP_Origen", "ArchivoXML",
+    "NumeroNotaCredito", "FechaEmision", "HoraEmision", "Moneda",
+    "RUC_Emisor", "Nombre_Emisor",
+    "RUC_Receptor", "Nombre_Receptor",
+    "DocReferencia", "DocReferencia_Normalizado",
+    "MotivoCodigo", "MotivoDescripcion", "EsAnulacionOperacion",
+    "BaseImponible", "IGV", "SubtotalSinIGV", "Total",
+]
+
+NC_ITEMS_FIELDS = [
+    "NotaCreditoKey", "NumeroNotaCredito", "FechaEmision",
+    "LineaID", "Descripcion", "Cantidad", "Unidad",
+    "PrecioUnitario", "ValorLineaSinIGV", "ImpuestoLinea",
+    "DocReferencia_Normalizado", "MotivoCodigo", "EsAnulacionOperacion",
+]
+
+def norm_doc_id(s: str) -> str:
+    # Normaliza "E001 - 1093" => "E001-1093"
+    s = (s or "").strip().upper()
+    s = s.replace(" ", "")
+    s = s.replace("–", "-").replace("—", "-")
+    # si quedó como E001-1093 ok, si quedó E001-1093 ya ok
+    return s
+
+# Spec compilado una sola vez (ver ubl_extractor.py). Cubre también lo que necesita
+# facturas.csv (cabecera + DiscrepancyResponse), así un CreditNote se parsea una sola vez.
+CREDITNOTE_SPEC = compile_spec(
+    {**HEADER_PATHS, "billing_ref": ".//cac:BillingReference//cac:InvoiceDocumentReference//cbc:ID"},
+    {"discrepancy": DISCREPANCY_GROUP, "lines": line_group("CreditNoteLine", "CreditedQuantity")},
+)
+
+def parse_creditnote_reference(doc):
+    """
+    Retorna:
+      ref_id_raw, ref_id_norm, motivo_codigo, motivo_desc
+    Busca en:
+      1) DiscrepancyResponse/ReferenceID
+      2) BillingReference/InvoiceDocumentReference/ID (fallback)
+    """
+    dr = doc.groups["discrepancy"]
+    ref_raw = dr["ref_id"]
+    motivo_codigo = dr["motivo_codigo"]
+    motivo_desc = dr["motivo_desc"]
+
+    if not ref_raw:
+        ref_raw = doc.values["billing_ref"]
+
+    return ref_raw, norm_doc_id(ref_raw), motivo_codigo, motivo_desc
+
+def creditnote_rows(doc, xml_name):
+    """
+    Filas de notas_credito / notas_credito_items a partir de un CreditNote ya extraído
+    con CREDITNOTE_SPEC. Retorna (header, items).
+    """
+    v = doc.values
+    nc_id = v["doc_id"]
+    issue_date = v["issue_date"]
+    issue_time = v["issue_time"]
+    currency = v["currency"]
+
+    # Emisor
+    supplier_ruc = v["supplier_ruc"]
+    supplier_name = v["supplier_name"] or v["supplier_name_alt"]
+
+    # Receptor
+    customer_ruc = v["customer_ruc"]
+    customer_name = v["customer_name"] or v["customer_name_alt"]
+
+    # Referencia y motivo
+    ref_raw, ref_norm, motivo_codigo, motivo_desc = parse_creditnote_reference(doc)
+    es_anulacion = "SI" if motivo_codigo == "01" else "NO"
+
+    # Totales
+    base_imponible = v["base_imponible"]
+    igv_total = v["igv_total"]
+    subtotal_sin_igv = v["subtotal_sin_igv"]
+    total = v["total"]
+
+    nc_key = f"{supplier_ruc}-CN-{nc_id}-{issue_date}"
+
+    header = {
+        "NotaCreditoKey": nc_key,
+        "ArchivoXML": xml_name,
+        "NumeroNotaCredito": nc_id,
+        "FechaEmision": issue_date,
+        "HoraEmision": issue_time,
+        "Moneda": currency,
+
+        "RUC_Emisor": supplier_ruc,
+        "Nombre_Emisor": supplier_name,
+        "RUC_Receptor": customer_ruc,
+        "Nombre_Receptor": customer_name,
+
+        "DocReferencia": ref_raw,
+        "DocReferencia_Normalizado": ref_norm,
+        "MotivoCodigo": motivo_codigo,
+        "MotivoDescripcion": motivo_desc,
+        "EsAnulacionOperacion": es_anulacion,
+
+        "BaseImponible": base_imponible,
+        "IGV": igv_total,
+        "SubtotalSinIGV": subtotal_sin_igv,
+        "Total": total,
+    }
+
+    # Items (CreditNoteLine)
+    items = []
+
+    for line in doc.groups["lines"]:
+        items.append({
+            "NotaCreditoKey": nc_key,
+            "NumeroNotaCredito": nc_id,
+            "FechaEmision": issue_date,
+            "LineaID": line["line_id"],
+            "Descripcion": line["desc"],
+            "Cantidad": line["qty"],
+            "Unidad": line["unit"],
+            "PrecioUnitario": line["precio_unit"],
+            "ValorLineaSinIGV": line["valor_linea"],
+            "ImpuestoLinea": line["impuesto_linea"],
+
+            "DocReferencia_Normalizado": ref_norm,
+            "MotivoCodigo": motivo_codigo,
+            "EsAnulacionOperacion": es_anulacion,
+        })
+
+    return header, items
@@ -0,0 +1,202 @@
+# pipeline.py
+# Etapas en paralelo para main.py --pipeline: lectura de ZIP / parseo / escritura.
+#
+#   [hilos de lectura] --cola--> [parseo] --cola--> [escritor]
+#
+# - Lectura: hilos que traen los bytes de cada ZIP (en disco de red es casi todo espera de I/O,
+#   que no toma el GIL). Van adelantados como máximo `max_cola` ZIPs: eso acota la memoria.
+# - Parseo: el hilo principal (o el pool de procesos con --workers).
+# - Escritura: un hilo que agrega las filas a los CSV / SQLite / manifest, en orden.
+#
+# Las colas son acotadas: si una etapa se atrasa, las anteriores se bloquean (back-pressure) en vez
+# de acumular. Cada etapa mide su tiempo ocupado y cada cola su profundidad, así se ve cuál es la
+# etapa lenta (utilización cerca de 100%) y cuáles esperan.
+
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+class Etapa:
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.ocupado = 0.0
+        self.n = 0
+
+    @contextmanager
+    def trabajo(self):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.ocupado += time.perf_counter() - t0
+            self.n += 1
+
+    def resumen(self, total, hilos=1):
+        return {
+            "items": self.n,
+            "ocupado_seg": round(self.ocupado, 6),
+            "utilizacion": round(self.ocupado / (total * hilos), 4) if total > 0 else None,
+        }
+
+class Cola:
+    """Profundidad de una cola acotada: se muestrea en cada put (promedio y máximo) + tiempo bloqueado."""
+
+    def __init__(self, nombre, maximo):
+        self.nombre = nombre
+        self.maximo = maximo
+        self.muestras = 0
+        self.suma = 0
+        self.pico = 0
+        self.bloqueado_put = 0.0   # productor esperando porque la cola está llena (back-pressure)
+        self.bloqueado_get = 0.0   # consumidor esperando porque la cola está vacía
+
+    def muestrear(self, profundidad):
+        self.muestras += 1
+        self.suma += profundidad
+        self.pico = max(self.pico, profundidad)
+
+    def resumen(self):
+        return {
+            "maximo": self.maximo,
+            "profundidad_media": round(self.suma / self.muestras, 2) if self.muestras else 0,
+            "profundidad_pico": self.pico,
+            "productor_bloqueado_seg": round(self.bloqueado_put, 6),
+            "consumidor_esperando_seg": round(self.bloqueado_get, 6),
+        }
+
+class Pipeline:
+    """Estado compartido de las etapas de una corrida (para --metricas y el resumen final)."""
+
+    def __init__(self, hilos_lectura=4, max_cola=8, max_escritura=32):
+        self.hilos_lectura = hilos_lectura
+        self.max_cola = max_cola
+        self.max_escritura = max_escritura
+        self.lectura = Etapa("lectura")
+        self.parseo = Etapa("parseo")
+        self.escritura = Etapa("escritura")
+        self.cola_lectura = Cola("lectura->parseo", max_cola)
+        self.cola_escritura = Cola("parseo->escritura", max_escritura)
+        self.t0 = time.perf_counter()
+
+    def resumen(self):
+        total = time.perf_counter() - self.t0
+        return {
+            "total_seg": round(total, 6),
+            "etapas": {
+                "lectura": {**self.lectura.resumen(total, self.hilos_lectura), "hilos": self.hilos_lectura},
+                "parseo": self.parseo.resumen(total),
+                "escritura": self.escritura.resumen(total),
+            },
+            "colas": {c.nombre: c.resumen() for c in (self.cola_lectura, self.cola_escritura)},
+        }
+
+    def texto(self):
+        r = self.resumen()
+        etapas = " | ".join(f"{k} {v['utilizacion'] or 0:.0%}" for k, v in r["etapas"].items())
+        colas = " | ".join(f"{k} prom {v['profundidad_media']}/{v['maximo']}" for k, v in r["colas"].items())
+        return f"utilización: {etapas} · colas: {colas}"
+
+    # --- Lectura adelantada ---
+    def prefetch(self, claves, leer):
+        """
+        Genera (clave, leer(clave)) en el mismo orden de `claves`, con hasta max_cola lecturas
+        adelantadas en hilos. Si leer() falla se entrega None (el parseo reporta el error como siempre).
+        """
+        def tarea(clave):
+            with self.lectura.trabajo():
+                try:
+                    return leer(clave)
+                except OSError:
+                    return None
+
+        pendientes = deque()
+        it = iter(claves)
+        with ThreadPoolExecutor(max_workers=self.hilos_lectura, thread_name_prefix="lectura") as ex:
+            for clave in it:
+                pendientes.append((clave, ex.submit(tarea, clave)))
+                if len(pendientes) >= self.max_cola:
+                    break
+            while pendientes:
+                clave, fut = pendientes.popleft()
+                self.cola_lectura.muestrear(sum(1 for _, f in pendientes if f.done()) + fut.done())
+                t0 = time.perf_counter()
+                datos = fut.result()
+                self.cola_lectura.bloqueado_get += time.perf_counter() - t0
+                siguiente = next(it, None)
+                if siguiente is not None:
+                    pendientes.append((siguiente, ex.submit(tarea, siguiente)))
+                yield clave, datos
+
+    def parsear(self, fuentes):
+        """Envuelve un generador de resultados para medir el tiempo que pasa produciendo cada uno."""
+        it = iter(fuentes)
+        try:
+            while True:
+                with self.parseo.trabajo():
+                    try:
+                        item = next(it)
+                    except StopIteration:
+                        return
+                yield item
+        finally:
+            if hasattr(it, "close"):
+                it.close()
+
+class Escritor:
+    """
+    Hilo que llama a escribir(*item) para cada item de una cola acotada, en orden.
+    Si escribir() falla, el error se relanza en el hilo principal en el siguiente put() o en cerrar().
+    """
+
+    _FIN = object()
+
+    def __init__(self, escribir, pipeline):
+        self.escribir = escribir
+        self.pipeline = pipeline
+        self.cola = queue.Queue(maxsize=pipeline.max_escritura)
+        self.error = None
+        self.cancelado = False
+        self.hilo = threading.Thread(target=self._correr, name="escritura", daemon=True)
+        self.hilo.start()
+
+    def _correr(self):
+        stats = self.pipeline.cola_escritura
+        while True:
+            t0 = time.perf_counter()
+            item = self.cola.get()
+            stats.bloqueado_get += time.perf_counter() - t0
+            if item is self._FIN:
+                return
+            if self.error is not None or self.cancelado:
+                continue   # se vacía la cola para no bloquear al productor
+            try:
+                with self.pipeline.escritura.trabajo():
+                    self.escribir(*item)
+            except BaseException as e:
+                self.error = e
+
+    def put(self, *item):
+        if self.error is not None:
+            raise self.error
+        stats = self.pipeline.cola_escritura
+        stats.muestrear(self.cola.qsize())
+        t0 = time.perf_counter()
+        self.cola.put(item)
+        stats.bloqueado_put += time.perf_counter() - t0
+
+    def cerrar(self):
+        """Espera a que se escriba todo lo encolado; relanza el error del escritor si lo hubo."""
+        self.cola.put(self._FIN)
+        self.hilo.join()
+        if self.error is not None:
+            raise self.error
+
+    def abortar(self):
+        """Descarta lo que quede en la cola y termina el hilo (la corrida falló en otra etapa)."""
+        if self.hilo.is_alive():
+            self.cancelado = True
+            self.cola.put(self._FIN)
+            self.hilo.join()
@@ -0,0 +1,145 @@
+# reglas_productos.py
+# Motor de reglas de la dimensión de productos (main_dim_productos.py --reglas).
+#
+# Las reglas de cada empresa van en un JSON (por defecto reglas_sogas.json, las del catálogo de sogas):
+#   - normalizacion: variantes (forma canónica -> typos) y ruido (palabras que se borran)
+#   - atributos: columnas en orden (una puede depender de las anteriores), cada una con su
+#     default y reglas por prioridad; gana la primera que se cumple. Condiciones de una regla
+#     (todas deben cumplirse):
+#       "tokens":   alguno de estos tokens está (el valor es el primero de la lista presente)
+#       "sufijo":   algún token termina así
+#       "contiene": ProductoStd contiene el texto
+#       "regex":    búsqueda en ProductoStd; "valor" puede usar los grupos: "{1}/{2}"
+#       "si":       {columna anterior: [valores]} / "si_no": la columna NO tiene esos valores
+#     "valor" fija el resultado (si no, el token encontrado). "nota" es un comentario libre.
+#
+# Se compila a tablas token -> (regla, prioridad): clasificar un producto es UNA pasada por sus
+# tokens y después, por columna, recorrer sus reglas hasta la primera que se cumple.
+
+import re
+import json
+import hashlib
+from pathlib import Path
+
+REGLAS_DEFAULT = Path(__file__).with_name("reglas_sogas.json")
+
+CONDICIONES = {"tokens", "sufijo", "contiene", "regex", "si", "si_no", "valor", "nota"}
+
+class Regla:
+    __slots__ = ("uid", "tokens", "sufijo", "contiene", "regex", "si", "si_no", "valor")
+
+    def __init__(self, uid, spec, anteriores, donde):
+        desconocidas = set(spec) - CONDICIONES
+        if desconocidas:
+            raise ValueError(f"{donde}: condición desconocida {sorted(desconocidas)} (válidas: {sorted(CONDICIONES)})")
+        self.uid = uid
+        self.tokens = list(spec.get("tokens") or [])
+        self.sufijo = spec.get("sufijo")
+        self.contiene = spec.get("contiene")
+        self.regex = re.compile(spec["regex"]) if spec.get("regex") else None
+        self.si = [(c, set(vs)) for c, vs in (spec.get("si") or {}).items()]
+        self.si_no = [(c, set(vs)) for c, vs in (spec.get("si_no") or {}).items()]
+        self.valor = spec.get("valor")
+        for c, _ in self.si + self.si_no:
+            if c not in anteriores:
+                raise ValueError(f"{donde}: 'si'/'si_no' sobre {c!r}, que no es una columna anterior")
+        if self.valor is None and not self.tokens:
+            raise ValueError(f"{donde}: sin 'valor' la regla necesita 'tokens' (el valor es el token encontrado)")
+
+    def formato(self, m):
+        # Grupos que no participaron quedan vacíos
+        return self.valor.format(m.group(0), *[g or "" for g in m.groups()])
+
+class Reglas:
+    """Reglas de un JSON, compiladas. clasificar() retorna una tupla con un valor por columna."""
+
+    def __init__(self, data, origen=""):
+        self.origen = origen
+        self.nombre = data.get("nombre", "")
+        norm = data.get("normalizacion") or {}
+        self.variantes = {canon: list(vs) for canon, vs in (norm.get("variantes") or {}).items()}
+        self.ruido = list(norm.get("ruido") or [])
+
+        self.columnas = []   # [(columna, default, [Regla])]
+        self.tabla = {}      # token -> [(uid, prioridad dentro de la regla)]
+        self.sufijos = []    # [(sufijo, uid)]
+        self.keywords = []   # todos los tokens que consulta alguna regla (para el modo vectorizado)
+        uid = 0
+        for i, attr in enumerate(data.get("atributos") or []):
+            col = attr["columna"]
+            anteriores = [c for c, _, _ in self.columnas]
+            if col in anteriores:
+                raise ValueError(f"{origen}: columna repetida {col!r}")
+            reglas = []
+            for j, spec in enumerate(attr.get("reglas") or []):
+                r = Regla(uid, spec, anteriores, f"{origen}: {col}, regla {j + 1}")
+                for prioridad, tok in enumerate(r.tokens):
+                    self.tabla.setdefault(tok, []).append((uid, prioridad))
+                    self.keywords.append(tok)
+                if r.sufijo:
+                    self.sufijos.append((r.sufijo, uid))
+                reglas.append(r)
+                uid += 1
+            self.columnas.append((col, attr.get("default", ""), reglas))
+        if not self.columnas:
+            raise ValueError(f"{origen}: no define 'atributos'")
+        self.keywords = list(dict.fromkeys(self.keywords))
+
+    @property
+    def nombres(self):
+        return [c for c, _, _ in self.columnas]
+
+    def clasificar(self, producto_std, tokens):
+        # 1) Una pasada por los tokens: qué reglas calzan por token (y con cuál) o por sufijo
+        encontrados = {}
+        sufijos = set()
+        tabla = self.tabla
+        for tok in tokens:
+            hits = tabla.get(tok)
+            if hits:
+                for uid, prioridad in hits:
+                    previo = encontrados.get(uid)
+                    if previo is None or prioridad < previo[0]:
+                        encontrados[uid] = (prioridad, tok)
+            for sufijo, uid in self.sufijos:
+                if tok.endswith(sufijo):
+                    sufijos.add(uid)
+
+        # 2) Por columna, la primera regla que se cumple
+        valores = {}
+        for col, default, reglas in self.columnas:
+            valor = default
+            for r in reglas:
+                if r.tokens and r.uid not in encontrados:
+                    continue
+                if r.sufijo and r.uid not in sufijos:
+                    continue
+                if r.contiene is not None and r.contiene not in producto_std:
+                    continue
+                if r.si and any(valores[c] not in vs for c, vs in r.si):
+                    continue
+                if r.si_no and any(valores[c] in vs for c, vs in r.si_no):
+                    continue
+                if r.regex is not None:
+                    m = r.regex.search(producto_std)
+                    if m is None:
+                        continue
+                    valor = r.formato(m)
+                else:
+                    valor = r.valor if r.valor is not None else encontrados[r.uid][1]
+                break
+            valores[col] = valor
+        return tuple(valores.values())
+
+def cargar_reglas(path=REGLAS_DEFAULT):
+    path = Path(path)
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return Reglas(data, str(path))
+
+def version_archivos(*paths):
+    """sha256 del contenido de varios archivos (reglas + código que las aplica)."""
+    h = hashlib.sha256()
+    for p in paths:
+        h.update(Path(p).read_bytes())
+    return h.hexdigest()
@@ -0,0 +1,183 @@
+# salida_columnar.py
+# Salida columnar opcional (Parquet con pyarrow), usada por --parquet en ambos main.py.
+#
+# Los CSV siguen siendo la salida principal (el manifest y --incremental se apoyan en ellos).
+# Al terminar, cada CSV se convierte por lotes a un dataset Parquet con tipos reales
+# (montos en decimal exacto, fechas como date) particionado por año-mes de emisión:
+#
+#   salida_parquet/items/Periodo=2024-03/part-0.parquet
+#
+# Así Power BI / pandas / pyarrow leen solo los meses y columnas que necesitan, sin volver
+# a parsear ni inferir tipos en cada refresh.
+
+import os
+import shutil
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+PARQUET_DIR = "salida_parquet"
+PERIODO_COL = "Periodo"
+SIN_FECHA = "SIN_FECHA"
+
+# SUNAT admite hasta 10 decimales en cantidades y precios unitarios
+DECIMAL_PRECISION = 38
+DECIMAL_ESCALA = 10
+
+COLUMNAS_DECIMALES = {
+    "BaseImponible", "IGV", "SubtotalSinIGV", "Total", "TotalNCE",
+    "Cantidad", "PrecioUnitario", "ValorLineaSinIGV", "ImpuestoLinea",
+}
+COLUMNAS_FECHA = {"FechaEmision", "FechaNCE"}
+
+# Tamaño de cada lote al leer el CSV (la memoria depende de esto, no del tamaño del CSV)
+BLOQUE_BYTES = 8 << 20
+
+def _pyarrow():
+    # Import perezoso: pyarrow solo hace falta con --parquet
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.csv as pacsv
+        import pyarrow.dataset as ds
+    except ImportError as e:
+        raise ImportError("La salida Parquet (--parquet) necesita pyarrow: pip install pyarrow") from e
+    return pa, pc, pacsv, ds
+
+# =========================
+# Conversión de valores
+# =========================
+def to_decimal(s):
+    """Texto SUNAT -> Decimal exacto, o None si está vacío / no es número / no cabe en la escala."""
+    s = (s or "").strip()
+    if not s:
+        return None
+    try:
+        d = Decimal(s)
+    except InvalidOperation:
+        return None
+    if not d.is_finite() or d.as_tuple().exponent < -DECIMAL_ESCALA:
+        return None
+    if d.adjusted() >= DECIMAL_PRECISION - DECIMAL_ESCALA:
+        return None
+    return d
+
+def to_date(s):
+    try:
+        return date.fromisoformat((s or "").strip())
+    except ValueError:
+        return None
+
+def schema_for(fieldnames):
+    """Esquema tipado: decimales y fechas por nombre de columna, el resto texto."""
+    pa, _, _, _ = _pyarrow()
+    campos = []
+    for name in fieldnames:
+        if name in COLUMNAS_DECIMALES:
+            tipo = pa.decimal128(DECIMAL_PRECISION, DECIMAL_ESCALA)
+        elif name in COLUMNAS_FECHA:
+            tipo = pa.date32()
+        else:
+            tipo = pa.string()
+        campos.append(pa.field(name, tipo))
+    campos.append(pa.field(PERIODO_COL, pa.string()))
+    return pa.schema(campos)
+
+def _cast_columna(col, tipo, conv):
+    """
+    Camino rápido: cast de pyarrow (en C++). Si algún valor no es válido (ej. "1,234.00"),
+    ese lote se convierte valor por valor y lo inválido queda nulo (el CSV conserva el texto).
+    """
+    pa, pc, _, _ = _pyarrow()
+    col = pc.if_else(pc.equal(pc.utf8_trim_whitespace(col), ""), pa.scalar(None, pa.string()), col)
+    try:
+        return pc.cast(col, tipo)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return pa.array([conv(v) for v in col.to_pylist()], type=tipo)
+
+def _iter_batches(csv_path, schema, fecha_col):
+    pa, pc, pacsv, _ = _pyarrow()
+    names = schema.names[:-1]
+
+    # Todo se lee como texto (sin inferencia); los tipos se aplican columna por columna
+    reader = pacsv.open_csv(
+        csv_path,
+        read_options=pacsv.ReadOptions(block_size=BLOQUE_BYTES),
+        parse_options=pacsv.ParseOptions(newlines_in_values=True),
+        convert_options=pacsv.ConvertOptions(
+            column_types={n: pa.string() for n in names},
+            strings_can_be_null=False,
+        ),
+    )
+    if reader.schema.names != names:
+        raise ValueError(f"columnas distintas en {csv_path}")
+
+    for batch in reader:
+        cols = []
+        for name, field in zip(names, schema):
+            col = batch.column(name)
+            if name in COLUMNAS_DECIMALES:
+                col = _cast_columna(col, field.type, to_decimal)
+            elif name in COLUMNAS_FECHA:
+                col = _cast_columna(col, field.type, to_date)
+            cols.append(col)
+
+        fechas = cols[names.index(fecha_col)]
+        per = pc.fill_null(pc.strftime(fechas, format="%Y-%m"), SIN_FECHA)
+        cols.append(per)
+        yield pa.RecordBatch.from_arrays(cols, schema=schema)
+
+# =========================
+# CSV -> dataset Parquet particionado
+# =========================
+def csv_to_parquet(csv_path, fieldnames, out_dir, fecha_col="FechaEmision"):
+    """
+    Convierte `csv_path` (con columnas `fieldnames`) a un dataset Parquet en `out_dir`,
+    particionado por Periodo (AAAA-MM de `fecha_col`; SIN_FECHA si no tiene fecha válida).
+    Se escribe en out_dir.tmp y se reemplaza al final. Retorna la cantidad de filas.
+    """
+    pa, _, _, ds = _pyarrow()
+    schema = schema_for(fieldnames)
+
+    tmp = out_dir + ".tmp"
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+
+    n = 0
+
+    def contar(batches):
+        nonlocal n
+        for b in batches:
+            n += b.num_rows
+            yield b
+
+    # use_threads=False: dentro de cada partición las filas quedan en el orden del CSV
+    ds.write_dataset(
+        contar(_iter_batches(csv_path, schema, fecha_col)),
+        tmp,
+        schema=schema,
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([schema.field(PERIODO_COL)]), flavor="hive"),
+        basename_template="part-{i}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        use_threads=False,
+    )
+
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    os.replace(tmp, out_dir)
+    return n
+
+def check_pyarrow():
+    """Lanza ImportError con un mensaje claro si pyarrow no está instalado."""
+    _pyarrow()
+
+def export_parquet(tablas, base_dir=PARQUET_DIR):
+    """
+    tablas: lista de (nombre, ruta_csv, fieldnames, columna_fecha).
+    Retorna {nombre: filas}.
+    """
+    filas = {}
+    for nombre, csv_path, fieldnames, fecha_col in tablas:
+        filas[nombre] = csv_to_parquet(csv_path, fieldnames, os.path.join(base_dir, nombre), fecha_col)
+    return filas
@@ -0,0 +1,213 @@
+# ubl_extractor.py
+# Extractor UBL compilado (compartido por Facturas y Notas de Crédito).
+#
+# Antes cada campo era un root.find(".//...", NS): en cada llamada ElementPath vuelve a
+# tokenizar/buscar la ruta en su caché y arma una cadena de generadores en Python, y eso se
+# repetía ~15 veces por documento y 4-5 veces por CADA línea.
+#
+# Aquí cada ruta se compila una sola vez a una lista de pasos con tags ya resueltos
+# ("{uri}ID") y se evalúa directo con elem.iter(tag) / elem.find(tag), que corren en C.
+# Las búsquedas de cada línea quedan confinadas al subárbol de esa línea, y las de
+# cabecera se cortan en el primer resultado.
+#
+# Semántica: se replica el orden de ElementPath (para cada match del paso 1, en orden de
+# documento, se busca el paso 2 dentro, etc.), así que el primer resultado es exactamente
+# el mismo que devuelve find() y los grupos ALL el mismo orden que findall().
+
+import xml.etree.ElementTree as ET
+
+NS = {
+    "cbc": "urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2",
+    "cac": "urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2",
+}
+
+CHILD = "/"
+DESC = "//"
+
+# Grupos: FIRST = solo el primer elemento ancla (como find), ALL = cada ancla (como findall)
+FIRST = "first"
+ALL = "all"
+
+# =========================
+# Rutas comunes UBL (Invoice + CreditNote)
+# =========================
+HEADER_PATHS = {
+    "doc_id": ".//cbc:ID",
+    "issue_date": ".//cbc:IssueDate",
+    "issue_time": ".//cbc:IssueTime",
+    "currency": ".//cbc:DocumentCurrencyCode",
+    "supplier_ruc": ".//cac:AccountingSupplierParty//cac:PartyIdentification//cbc:ID",
+    "supplier_name": ".//cac:AccountingSupplierParty//cac:PartyLegalEntity//cbc:RegistrationName",
+    "supplier_name_alt": ".//cac:AccountingSupplierParty//cac:PartyName//cbc:Name",
+    "customer_ruc": ".//cac:AccountingCustomerParty//cac:PartyIdentification//cbc:ID",
+    "customer_name": ".//cac:AccountingCustomerParty//cac:PartyLegalEntity//cbc:RegistrationName",
+    "customer_name_alt": ".//cac:AccountingCustomerParty//cac:PartyName//cbc:Name",
+    "payment_means": ".//cac:PaymentTerms//cbc:PaymentMeansID",
+    "base_imponible": ".//cac:TaxTotal//cac:TaxSubtotal//cbc:TaxableAmount",
+    "igv_total": ".//cac:TaxTotal//cbc:TaxAmount",
+    "subtotal_sin_igv": ".//cac:LegalMonetaryTotal//cbc:LineExtensionAmount",
+    "total": ".//cac:LegalMonetaryTotal//cbc:PayableAmount",
+}
+
+DISCREPANCY_GROUP = (".//cac:DiscrepancyResponse", FIRST, {
+    "ref_id": "cbc:ReferenceID",
+    "motivo_codigo": "cbc:ResponseCode",
+    "motivo_desc": "cbc:Description",
+})
+
+def line_group(line_tag, qty_tag):
+    """Grupo de líneas (InvoiceLine / CreditNoteLine) con sus campos relativos a cada línea."""
+    return (f".//cac:{line_tag}", ALL, {
+        "line_id": "cbc:ID",
+        "qty": f"cbc:{qty_tag}",
+        "unit": f"cbc:{qty_tag}/@unitCode",
+        "desc": ".//cac:Item//cbc:Description",
+        "valor_linea": "cbc:LineExtensionAmount",
+        "precio_unit": ".//cac:Price//cbc:PriceAmount",
+        "impuesto_linea": ".//cac:TaxTotal//cbc:TaxAmount",
+    })
+
+def localname(tag: str) -> str:
+    return tag.split("}")[-1] if "}" in tag else tag
+
+# =========================
+# Compilación de rutas
+# =========================
+def _qname(step):
+    if ":" in step:
+        prefix, local = step.split(":", 1)
+        return f"{{{NS[prefix]}}}{local}"
+    return step
+
+def compile_path(path):
+    """
+    ".//cac:A//cbc:B" -> [("//", "{ns}A"), ("//", "{ns}B")]
+    "cbc:X/@attr"    -> ([("/", "{ns}X")], "attr")
+    Retorna (steps, attr).
+    """
+    attr = None
+    if "/@" in path:
+        path, attr = path.rsplit("/@", 1)
+
+    if path.startswith(".//"):
+        rest, axis = path[3:], DESC
+    elif path.startswith("./"):
+        rest, axis = path[2:], CHILD
+    else:
+        rest, axis = path, CHILD
+
+    steps = []
+    for part in rest.split("/"):
+        if part == "":
+            # "//" deja un segmento vacío: el siguiente paso es descendiente
+            axis = DESC
+            continue
+        steps.append((axis, _qname(part)))
+        axis = CHILD
+    return steps, attr
+
+class CompiledSpec:
+    """
+    Spec compilado: campos (ruta -> pasos) + grupos (ancla con campos relativos a cada ancla).
+    """
+
+    def __init__(self, fields=None, groups=None):
+        fields = fields or {}
+        groups = groups or {}
+        self.fields = [(name, *compile_path(path)) for name, path in fields.items()]
+        self.groups = []
+        for name, (anchor, mode, sub) in groups.items():
+            steps, _ = compile_path(anchor)
+            self.groups.append((name, steps, mode, CompiledSpec(sub)))
+
+def compile_spec(fields=None, groups=None):
+    return CompiledSpec(fields, groups)
+
+# =========================
+# Evaluación (misma semántica que ElementPath)
+# =========================
+def _first(elem, steps, i=0):
+    axis, tag = steps[i]
+    last = i == len(steps) - 1
+
+    if axis == CHILD:
+        if last:
+            return elem.find(tag)       # tag simple: Element.find itera los hijos en C
+        for c in elem:
+            if c.tag == tag:
+                r = _first(c, steps, i + 1)
+                if r is not None:
+                    return r
+        return None
+
+    for e in elem.iter(tag):
+        if e is elem:
+            continue
+        if last:
+            return e
+        r = _first(e, steps, i + 1)
+        if r is not None:
+            return r
+    return None
+
+def _all(elem, steps, i=0):
+    axis, tag = steps[i]
+    last = i == len(steps) - 1
+    matches = (c for c in elem if c.tag == tag) if axis == CHILD else (e for e in elem.iter(tag) if e is not elem)
+    for e in matches:
+        if last:
+            yield e
+        else:
+            yield from _all(e, steps, i + 1)
+
+def _values(elem, spec):
+    values = {}
+    for name, steps, attr in spec.fields:
+        e = _first(elem, steps)
+        if e is None:
+            values[name] = ""
+        elif attr is not None:
+            values[name] = e.attrib.get(attr, "")
+        else:
+            values[name] = (e.text or "").strip()
+    return values
+
+class ExtractResult:
+    """Resultado: tipo de documento (tag raíz), valores de cabecera y grupos."""
+
+    def __init__(self, doc_type, values, groups):
+        self.doc_type = doc_type
+        self.values = values
+        self.groups = groups
+
+def extract_root(root, spec):
+    values = _values(root, spec)
+    groups = {}
+    for name, steps, mode, sub in spec.groups:
+        if mode == FIRST:
+            anchor = _first(root, steps)
+            groups[name] = _values(anchor, sub) if anchor is not None else {n: "" for n, _, _ in sub.fields}
+        else:
+            groups[name] = [_values(anchor, sub) for anchor in _all(root, steps)]
+    return ExtractResult(localname(root.tag), values, groups)
+
+def parse_etree(source, specs, default_spec):
+    root = ET.parse(source).getroot()
+    spec = specs.get(localname(root.tag), default_spec)
+    return extract_root(root, spec)
+
+# Backend de parseo en uso (ubl_parsers.usar_parser cambia a expat / lxml)
+_parse = parse_etree
+
+def set_parser(parse):
+    global _parse
+    _parse = parse
+
+def extract(source, specs, default_spec=None):
+    """
+    Parsea `source` (ruta o archivo) y extrae los campos del spec que corresponda al
+    tipo de documento (tag raíz): specs = {"Invoice": CompiledSpec, ...}.
+    """
+    return _parse(source, specs, default_spec or EMPTY_SPEC)
+
+EMPTY_SPEC = CompiledSpec()
@@ -0,0 +1,316 @@
+# ubl_parsers.py
+# Backends de parseo XML detrás de ubl_extractor.extract (main.py --parser, también NOTAS DE CREDITO).
+#
+#   - etree: xml.etree.ElementTree.parse + evaluación sobre el árbol (el de siempre, default)
+#   - expat: streaming con xml.parsers.expat, sin armar árbol (solo se guarda el texto de los
+#            elementos que alguna ruta necesita)
+#   - lxml:  lxml.etree.parse (opcional: pip install lxml) + la misma evaluación sobre el árbol
+#
+# Los tres dan el mismo ExtractResult, y los XML dañados el mismo mensaje de error (expat es el
+# mismo parser que usa ElementTree; si lxml falla se reintenta con ElementTree). Cuál conviene
+# depende de la máquina y de los XML: BENCHMARK/benchmark.py --parsers los mide y verifica que
+# den filas idénticas.
+#
+# Streaming: cada ruta compilada se evalúa al abrir un elemento, con la pila de ancestros.
+# Si varios elementos calzan, gana el que ElementPath habría devuelto primero: el de menor
+# clave = (posición en el documento del elemento de cada paso de la ruta, en orden).
+#
+# parse_cabecera (main.py --solo-cabeceras) es el mismo streaming con corte: en UBL todos los
+# agregados de cabecera (emisor, receptor, DiscrepancyResponse, TaxTotal, LegalMonetaryTotal)
+# van antes de la primera línea, así que al abrir la primera InvoiceLine / CreditNoteLine /
+# DebitNoteLine hija de la raíz se deja de leer el XML.
+
+import xml.etree.ElementTree as ET
+from xml.parsers import expat
+
+from ubl_extractor import CHILD, DESC, FIRST, NS, ExtractResult, extract_root, localname, parse_etree, set_parser
+
+PARSER_DEFAULT = "etree"
+
+def _lxml():
+    # Import perezoso: lxml solo hace falta con --parser lxml
+    try:
+        from lxml import etree
+    except ImportError as e:
+        raise ImportError("--parser lxml necesita lxml: pip install lxml") from e
+    return etree
+
+# =========================
+# lxml
+# =========================
+_LXML_PARSER = None
+
+def parse_lxml(source, specs, default_spec):
+    global _LXML_PARSER
+    etree = _lxml()
+    if _LXML_PARSER is None:
+        # Sin comentarios ni PI, como el árbol de ElementTree (si no, cortan el .text de un elemento)
+        _LXML_PARSER = etree.XMLParser(remove_comments=True, remove_pis=True, no_network=True, huge_tree=True)
+    try:
+        root = etree.parse(source, _LXML_PARSER).getroot()
+    except etree.XMLSyntaxError:
+        # Mismo error (o el mismo resultado) que con ElementTree: errores.csv no depende del backend
+        if hasattr(source, "seek"):
+            source.seek(0)
+        return parse_etree(source, specs, default_spec)
+    spec = specs.get(localname(root.tag), default_spec)
+    return extract_root(root, spec)
+
+# =========================
+# expat (streaming)
+# =========================
+# Una "clave" es la tupla de posiciones en el documento de los elementos que calzan cada paso
+# (el último es el elemento evaluado, tope de la pila). ElementPath devuelve primero la menor.
+def _primera(tags, inicios, steps, desde, i=0):
+    """Menor clave de steps[i:] sobre la pila tags[desde:], o None si la ruta no calza."""
+    axis, tag = steps[i]
+    fin = len(tags) - 1
+    if i == len(steps) - 1:
+        if (desde == fin if axis == CHILD else desde <= fin) and tags[fin] == tag:
+            return (inicios[fin],)
+        return None
+    for p in ((desde,) if axis == CHILD else range(desde, fin)):
+        if p < fin and tags[p] == tag:
+            resto = _primera(tags, inicios, steps, p + 1, i + 1)
+            if resto is not None:
+                return (inicios[p],) + resto
+    return None
+
+def _claves(tags, inicios, steps, desde, i=0):
+    """Todas las claves, en orden (una por cada forma de calzar la ruta, como findall)."""
+    axis, tag = steps[i]
+    fin = len(tags) - 1
+    if i == len(steps) - 1:
+        if (desde == fin if axis == CHILD else desde <= fin) and tags[fin] == tag:
+            yield (inicios[fin],)
+        return
+    for p in ((desde,) if axis == CHILD else range(desde, fin)):
+        if p < fin and tags[p] == tag:
+            for resto in _claves(tags, inicios, steps, p + 1, i + 1):
+                yield (inicios[p],) + resto
+
+def _tag_expat(tag):
+    # expat con namespace_separator="}" entrega "uri}local" (ElementTree le antepone "{")
+    return tag[1:] if tag.startswith("{") else tag
+
+class _Plan:
+    """
+    Rutas de un CompiledSpec indexadas por el tag de su último paso. Una ruta solo con pasos "//"
+    queda resuelta con el primer elemento que calza (nadie que empiece después puede ganarle).
+    """
+
+    def __init__(self, spec, grupos=True):
+        self.nombres = [name for name, _, _ in spec.fields]
+        self.campos = {}   # tag -> [(nombre, steps, attr, solo_desc)]
+        for name, steps, attr in spec.fields:
+            steps = [(axis, _tag_expat(tag)) for axis, tag in steps]
+            solo_desc = all(axis == DESC for axis, _ in steps)
+            self.campos.setdefault(steps[-1][1], []).append((name, steps, attr, solo_desc))
+        self.grupos = []   # (nombre, modo, plan)
+        self.anclas = {}   # tag -> [(índice de grupo, steps)]
+        if grupos:
+            # Como extract_root: solo hay grupos en la raíz (los de un sub-spec no se evalúan)
+            for i, (name, steps, mode, sub) in enumerate(spec.groups):
+                steps = [(axis, _tag_expat(tag)) for axis, tag in steps]
+                self.grupos.append((name, mode, _Plan(sub, grupos=False)))
+                self.anclas.setdefault(steps[-1][1], []).append((i, steps))
+        # Tags que le importan a alguna ruta: los demás elementos solo entran y salen de la pila
+        self.relevantes = set(self.campos) | set(self.anclas)
+        for _, _, sub in self.grupos:
+            self.relevantes |= sub.relevantes
+
+_PLANES = {}
+
+def _plan(spec):
+    plan = _PLANES.get(id(spec))
+    if plan is None:
+        plan = _PLANES[id(spec)] = (spec, _Plan(spec))   # se guarda el spec: id() no se reutiliza
+    return plan[1]
+
+class _Contexto:
+    """Evaluación de un plan relativa a un elemento (la raíz o un ancla de grupo) en la pila."""
+
+    def __init__(self, plan, base):
+        self.plan = plan
+        self.base = base
+        self.valores = dict.fromkeys(plan.nombres, "")
+        self.claves = {}
+        self.resueltos = set()
+        self.primero = [None] * len(plan.grupos)   # FIRST: (clave, contexto)
+        self.todos = [[] for _ in plan.grupos]    # ALL: [(clave, contexto)]
+
+def _resultado(raiz, doc_type):
+    groups = {}
+    for i, (name, mode, sub) in enumerate(raiz.plan.grupos):
+        if mode == FIRST:
+            primero = raiz.primero[i]
+            groups[name] = primero[1].valores if primero is not None else dict.fromkeys(sub.nombres, "")
+        else:
+            groups[name] = [hijo.valores for _, hijo in sorted(raiz.todos[i], key=lambda t: t[0])]
+    return ExtractResult(doc_type, raiz.valores, groups)
+
+# Tags (en la forma de expat) donde corta parse_cabecera: la primera línea hija de la raíz
+CORTE_LINEAS = frozenset(f"{NS['cac']}}}{tag}" for tag in ("InvoiceLine", "CreditNoteLine", "DebitNoteLine"))
+
+class _Corte(Exception):
+    pass
+
+def parse_expat(source, specs, default_spec, corte=()):
+    # Los handlers son closures (no métodos): se llaman 2 veces por elemento y así se ahorran
+    # los accesos a atributos.
+    # corte: tags que, al abrirse como hijos de la raíz, terminan el parseo (el resto del XML
+    # no se lee ni se valida)
+    tags = []
+    inicios = []
+    capturas = []      # por nivel: (trozos de texto, [(contexto, nombre, clave)]) o None
+    contextos = []     # [raíz, anclas abiertas...]
+    texto = None       # trozos del elemento abierto, hasta su primer hijo (como .text)
+    relevantes = ()
+    n = 0
+    doc_type = None
+
+    def start(tag, attrs):
+        nonlocal texto, relevantes, n, doc_type
+        if corte and len(tags) == 1 and tag in corte:
+            raise _Corte
+        tags.append(tag)
+        inicios.append(n)
+        n += 1
+        texto = None
+        if tag not in relevantes:
+            if not contextos:
+                doc_type = localname(tag)
+                contextos.append(_Contexto(_plan(specs.get(doc_type, default_spec)), 0))
+                relevantes = contextos[0].plan.relevantes
+            capturas.append(None)
+            return
+
+        destinos = None
+        for j in range(len(contextos)):   # sin los contextos que se abren en este mismo elemento
+            ctx = contextos[j]
+            campos = ctx.plan.campos.get(tag)
+            if campos:
+                for name, steps, attr, solo_desc in campos:
+                    if name in ctx.resueltos:
+                        continue
+                    clave = _primera(tags, inicios, steps, ctx.base + 1)
+                    if clave is None or (name in ctx.claves and ctx.claves[name] <= clave):
+                        continue
+                    ctx.claves[name] = clave
+                    if solo_desc:
+                        ctx.resueltos.add(name)
+                    if attr is not None:
+                        ctx.valores[name] = attrs.get(attr, "")
+                    elif destinos is None:
+                        destinos = [(ctx, name, clave)]
+                    else:
+                        destinos.append((ctx, name, clave))
+            if ctx.plan.anclas and tag in ctx.plan.anclas:
+                abrir_anclas(ctx, tag)
+
+        if destinos is not None:
+            texto = []
+            capturas.append((texto, destinos))
+        else:
+            capturas.append(None)
+
+    def abrir_anclas(ctx, tag):
+        nivel = len(tags) - 1
+        for i, steps in ctx.plan.anclas[tag]:
+            claves = list(_claves(tags, inicios, steps, ctx.base + 1))
+            if not claves:
+                continue
+            name, mode, sub = ctx.plan.grupos[i]
+            hijo = _Contexto(sub, nivel)
+            contextos.append(hijo)
+            if mode == FIRST:
+                if ctx.primero[i] is None or claves[0] < ctx.primero[i][0]:
+                    ctx.primero[i] = (claves[0], hijo)
+            else:
+                # Con pasos anidados ElementPath repite el ancla una vez por cada forma de llegar a ella
+                ctx.todos[i].extend((clave, hijo) for clave in claves)
+
+    def end(tag):
+        nonlocal texto
+        captura = capturas.pop()
+        if captura is not None:
+            valor = "".join(captura[0]).strip()
+            for ctx, name, clave in captura[1]:
+                if ctx.claves.get(name) == clave:
+                    ctx.valores[name] = valor
+        texto = None
+        tags.pop()
+        inicios.pop()
+        nivel = len(tags)
+        while len(contextos) > 1 and contextos[-1].base == nivel:
+            contextos.pop()
+
+    def data(trozo):
+        if texto is not None:
+            texto.append(trozo)
+
+    parser = expat.ParserCreate(None, "}")
+    parser.buffer_text = True
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = data
+
+    def default(trozo):
+        # Entidad no declarada: mismo error que XMLParser de ElementTree
+        if trozo[:1] == "&":
+            raise expat.error("undefined entity %s: line %d, column %d" % (
+                trozo, parser.ErrorLineNumber, parser.ErrorColumnNumber))
+
+    parser.DefaultHandlerExpand = default
+    try:
+        if hasattr(source, "read"):
+            parser.ParseFile(source)
+        else:
+            with open(source, "rb") as f:
+                parser.ParseFile(f)
+    except _Corte:
+        pass
+    except expat.error as e:
+        raise ET.ParseError(str(e)) from None
+    return _resultado(contextos[0], doc_type)
+
+def parse_cabecera(source, specs, default_spec):
+    """
+    Solo cabecera: parse_expat cortando en la primera línea. Con `source` abierto en streaming
+    (ej. ZipFile.open) tampoco se descomprime el resto. Los specs no deberían tener grupos de
+    líneas (quedarían vacíos) y un campo que solo aparece dentro de una línea queda vacío.
+    """
+    return parse_expat(source, specs, default_spec, CORTE_LINEAS)
+
+# =========================
+# Selección
+# =========================
+PARSERS = {"etree": parse_etree, "expat": parse_expat, "lxml": parse_lxml}
+
+def parsers_disponibles():
+    disponibles = []
+    for nombre in PARSERS:
+        try:
+            if nombre == "lxml":
+                _lxml()
+        except ImportError:
+            continue
+        disponibles.append(nombre)
+    return disponibles
+
+def check_parser(nombre):
+    """Lanza ImportError con un mensaje claro si el backend necesita algo no instalado."""
+    if nombre == "lxml":
+        _lxml()
+
+_EN_USO = PARSER_DEFAULT
+
+def usar_parser(nombre):
+    """Cambia el backend de ubl_extractor.extract en este proceso (los workers lo reciben al iniciar)."""
+    global _EN_USO
+    check_parser(nombre)
+    set_parser(PARSERS[nombre])
+    _EN_USO = nombre
+
+def parser_en_uso():
+    return _EN_USO
@@ -0,0 +1,114 @@
+# verificacion_zip.py
+# Verificación de integridad de los ZIP antes del ETL (main.py --verificar-zip).
+#
+# Un ZIP truncado o corrupto recién aparecía cuando la extracción fallaba a mitad de una corrida
+# larga. Aquí cada ZIP se revisa en segundos, en paralelo (un proceso por CPU):
+#   1) se lee el directorio central (ZipFile): si falta o está dañado -> ZIP_ILEGIBLE
+#   2) cada miembro se lee entero en streaming, por bloques, sin guardarlo: zipfile compara el
+#      CRC-32 al llegar al final (y un deflate cortado falla antes) -> CRC
+#   3) al menos un miembro .xml -> SIN_XML
+#   4) la raíz de cada XML (solo el primer elemento, con expat, mientras se lee para el CRC) debe
+#      estar en un namespace UBL (urn:oasis:...:Invoice-2, CreditNote-2, ...) -> NO_UBL, o
+#      XML_INVALIDO si ni siquiera se llega a la raíz
+# Solo se reportan los problemas: una fila por problema (ArchivoXML vacío si es de todo el ZIP).
+
+import os
+import zlib
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from xml.parsers import expat
+
+VERIFICACION_NOMBRE = "verificacion_zip.csv"
+VERIFICACION_FIELDS = ["ZIP", "ArchivoXML", "Problema", "Detalle"]
+
+UBL_NS = "urn:oasis:names:specification:ubl:schema:xsd:"
+BLOQUE = 1 << 16
+
+class _Raiz(Exception):
+    pass
+
+def _raiz_ubl(tag):
+    # expat con namespace_separator="}" entrega "uri}local"; UBL 2: uri = UBL_NS + local + "-2"
+    uri, _, local = tag.rpartition("}")
+    return uri == f"{UBL_NS}{local}-2"
+
+def _leer_miembro(z, info):
+    """Lee el miembro entero (verifica CRC). Retorna (raíz "uri}local" o None, error de XML o None)."""
+    raiz, error = None, None
+    parser = None
+    if info.filename.lower().endswith(".xml"):
+        parser = expat.ParserCreate(None, "}")
+
+        def start(tag, attrs):
+            raise _Raiz(tag)
+
+        parser.StartElementHandler = start
+    with z.open(info) as f:
+        while True:
+            bloque = f.read(BLOQUE)
+            if not bloque:
+                break
+            if parser is not None:
+                try:
+                    parser.Parse(bloque)
+                except _Raiz as r:
+                    raiz, parser = r.args[0], None
+                except expat.error as e:
+                    error, parser = str(e), None
+    if parser is not None and raiz is None and error is None:
+        error = "sin elemento raíz"
+    return raiz, error
+
+def verificar_zip(zip_path, zname=None):
+    """Problemas de un ZIP como filas de VERIFICACION_FIELDS (lista vacía = ZIP sano)."""
+    zname = zname or os.path.basename(zip_path)
+    problemas = []
+
+    def problema(xml, tipo, detalle):
+        problemas.append({"ZIP": zname, "ArchivoXML": xml, "Problema": tipo, "Detalle": detalle})
+
+    try:
+        z = zipfile.ZipFile(zip_path, "r")
+    except (zipfile.BadZipFile, OSError, ValueError) as e:
+        problema("", "ZIP_ILEGIBLE", str(e))
+        return problemas
+
+    n_xml = 0
+    with z:
+        for info in z.infolist():
+            if info.is_dir():
+                continue
+            nombre = os.path.basename(info.filename)
+            es_xml = info.filename.lower().endswith(".xml")
+            n_xml += es_xml
+            try:
+                raiz, error = _leer_miembro(z, info)
+            except (zipfile.BadZipFile, zlib.error, EOFError, OSError, NotImplementedError, RuntimeError) as e:
+                # CRC distinto, deflate cortado, cabecera local dañada, compresión o cifrado no soportado
+                problema(nombre, "CRC", str(e) or type(e).__name__)
+                continue
+            if not es_xml:
+                continue
+            if error is not None:
+                problema(nombre, "XML_INVALIDO", error)
+            elif not _raiz_ubl(raiz):
+                problema(nombre, "NO_UBL", "raíz " + ("{" + raiz if "}" in raiz else raiz))
+        if not n_xml:
+            problema("", "SIN_XML", f"{len(z.infolist())} miembros, ninguno .xml")
+    return problemas
+
+def verificar_zips(zip_dir, zips, workers=None):
+    """
+    Verifica `zips` (relativos a zip_dir) con `workers` procesos (None = uno por CPU).
+    Retorna (problemas en el orden de zips, cantidad de ZIP con algún problema).
+    """
+    workers = workers or os.cpu_count() or 1
+    paths = [os.path.join(zip_dir, z) for z in zips]
+    if workers <= 1 or len(zips) <= 1:
+        resultados = map(verificar_zip, paths, zips)
+        filas = [r for rs in resultados for r in rs]
+    else:
+        chunksize = max(1, len(zips) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            filas = [r for rs in ex.map(verificar_zip, paths, zips, chunksize=chunksize) for r in rs]
+    return filas, len({r["ZIP"] for r in filas})
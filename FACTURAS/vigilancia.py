@@ -0,0 +1,178 @@
+# vigilancia.py
+# Modo vigilancia de main.py (--vigilar): queda corriendo y procesa los ZIP apenas llegan.
+#
+# Detecta cambios en las carpetas con watchdog (inotify / FSEvents / ReadDirectoryChanges) si está
+# instalado; si no, revisa las carpetas cada `intervalo` segundos (polling, sin dependencias).
+# En ambos casos la decisión sale de una foto (tamaño, mtime) de los .zip: watchdog solo avisa antes.
+#
+# Antirrebote: un ZIP se considera listo cuando su tamaño y mtime no cambian durante `estable`
+# segundos y es un ZIP válido (un archivo a medio copiar todavía no tiene el directorio central).
+# Recién ahí se llama a `procesar(listos)` con la foto de los ZIP listos: los que siguen copiándose
+# no entran a esa corrida (main.py corre en modo incremental: solo parsea lo nuevo).
+
+import os
+import time
+import zipfile
+import threading
+
+# Si un archivo lleva estable este múltiplo de `estable` pero no es ZIP válido, se procesa igual
+# (quedará en errores.csv) en vez de esperarlo para siempre
+FACTOR_INVALIDO = 10
+
+# Con cambios llegando sin parar, no se posterga el proceso de lo ya listo más de esto (segundos)
+ESPERA_MAXIMA = 30.0
+
+def _watchdog():
+    # Import perezoso: watchdog es opcional
+    try:
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+    except ImportError:
+        return None
+    return Observer, FileSystemEventHandler
+
+def foto_zips(carpetas):
+    """{ruta: (tamaño, mtime_ns)} de los .zip de las carpetas (las que no existen se omiten)."""
+    foto = {}
+    for carpeta in carpetas:
+        try:
+            entradas = os.scandir(carpeta)
+        except OSError:
+            continue
+        with entradas:
+            for e in entradas:
+                if e.name.lower().endswith(".zip") and e.is_file():
+                    try:
+                        st = e.stat()
+                    except OSError:
+                        continue   # borrado entre scandir y stat
+                    foto[e.path] = (st.st_size, st.st_mtime_ns)
+    return foto
+
+class Antirrebote:
+    """
+    Sigue la última firma (tamaño, mtime) de cada ZIP y desde cuándo la tiene.
+    hay_cambios() dice si lo listo difiere de lo último procesado y si todavía hay archivos a medio copiar.
+    """
+
+    def __init__(self, estable=2.0):
+        self.estable = estable
+        self.vistos = {}        # ruta -> (firma, desde)
+        self.procesado = {}     # ruta -> firma en el último proceso
+        self.pendiente_desde = None
+
+    def observar(self, foto, ahora, desde=None):
+        """desde: desde cuándo se dan por quietos los ZIP que no se habían visto (default: ahora)."""
+        desde = ahora if desde is None else desde
+        vistos = {}
+        for ruta, firma in foto.items():
+            prev = self.vistos.get(ruta)
+            vistos[ruta] = prev if prev and prev[0] == firma else (firma, desde)
+        self.vistos = vistos
+
+    def _listo(self, ruta, firma, desde, ahora):
+        quieto = ahora - desde
+        if quieto < self.estable:
+            return False
+        return quieto >= self.estable * FACTOR_INVALIDO or zipfile.is_zipfile(ruta)
+
+    def revisar(self, ahora):
+        """
+        Retorna (listos, copiando): foto de los ZIP listos y cuántos siguen cambiando.
+        Solo revisa (abre) los ZIP cuya firma difiere de la ya procesada.
+        """
+        listos = {}
+        copiando = 0
+        for ruta, (firma, desde) in self.vistos.items():
+            if self.procesado.get(ruta) == firma or self._listo(ruta, firma, desde, ahora):
+                listos[ruta] = firma
+            else:
+                copiando += 1
+        return listos, copiando
+
+    def debe_procesar(self, ahora):
+        listos, copiando = self.revisar(ahora)
+        if listos == self.procesado:
+            self.pendiente_desde = None
+            return None
+        if self.pendiente_desde is None:
+            self.pendiente_desde = ahora
+        # Espero a que terminen de copiarse los demás, salvo que ya se esperó demasiado
+        if copiando and ahora - self.pendiente_desde < ESPERA_MAXIMA:
+            return None
+        return listos
+
+    def marcar_procesado(self, listos):
+        self.procesado = listos
+        self.pendiente_desde = None
+
+def vigilar(carpetas, procesar, intervalo=1.0, estable=2.0, usar_watchdog=True):
+    """
+    Llama a procesar(listos) al inicio (cuando los ZIP que ya estaban terminan de copiarse) y cada vez
+    que hay ZIP nuevos, modificados o borrados ya estables. listos: {ruta: (tamaño, mtime_ns)} de los
+    ZIP ya copiados; pasado ESPERA_MAXIMA puede haber otros a medio copiar, que no están en listos.
+    Si procesar() falla, muestra el error y sigue vigilando (se reintenta con el próximo cambio).
+    Termina con Ctrl+C.
+    """
+    aviso = threading.Event()
+    observer = None
+    wd = _watchdog() if usar_watchdog else None
+    if wd is not None:
+        Observer, FileSystemEventHandler = wd
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                aviso.set()
+
+        observer = Observer()
+        for carpeta in carpetas:
+            if os.path.isdir(carpeta):
+                observer.schedule(Handler(), carpeta, recursive=False)
+        observer.start()
+        modo = "watchdog"
+    else:
+        modo = f"polling cada {intervalo:g}s"
+
+    print(f"👀 Vigilando {', '.join(carpetas)} ({modo}; ZIP estable tras {estable:g}s). Ctrl+C para salir.")
+    ab = Antirrebote(estable)
+    # Los ZIP que ya están al arrancar se dan por quietos (no se espera `estable` por ellos), pero
+    # igual tienen que ser ZIP válidos: uno a medio copiar se espera como cualquier otro
+    ahora = time.monotonic()
+    ab.observar(foto_zips(carpetas), ahora, desde=ahora - estable)
+    primera = True
+    try:
+        while True:
+            ahora = time.monotonic()
+            ab.observar(foto_zips(carpetas), ahora)
+            listos = ab.debe_procesar(ahora)
+            if listos is None and primera:
+                # Carpeta vacía: la corrida inicial igual se hace (control y CSV al día)
+                listos, copiando = ab.revisar(ahora)
+                if copiando:
+                    listos = None
+            if listos is not None:
+                nuevos = sum(1 for r, f in listos.items() if ab.procesado.get(r) != f)
+                if not primera:
+                    print(f"🔔 {time.strftime('%H:%M:%S')} cambios en {nuevos} ZIP; procesando...")
+                t0 = time.perf_counter()
+                try:
+                    procesar(listos)
+                except Exception as e:
+                    print(f"⚠️ Falló el proceso ({type(e).__name__}: {e}); se reintenta con el próximo cambio")
+                else:
+                    print(f"⏱️ Actualizado en {time.perf_counter() - t0:.1f}s")
+                ab.marcar_procesado(listos)
+                primera = False
+
+            # Con watchdog se despierta apenas hay un evento; si hay algo a medio copiar, se revisa igual
+            # cada `intervalo` para ver cuándo queda estable
+            _, copiando = ab.revisar(time.monotonic())
+            espera = intervalo if (observer is None or copiando or ab.pendiente_desde) else max(intervalo, 30.0)
+            aviso.wait(espera)
+            aviso.clear()
+    except KeyboardInterrupt:
+        print("Vigilancia detenida")
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
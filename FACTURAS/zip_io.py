@@ -0,0 +1,75 @@
+# zip_io.py
+# Lectura de ZIP/XML y escritura de CSV (compartido por Facturas y Notas de Crédito).
+
+import os
+import io
+import zipfile
+import shutil
+import csv
+
+TMP_DIR = "_tmp_extract"
+
+def extract_zip(zip_path, extract_to):
+    with zipfile.ZipFile(zip_path, "r") as z:
+        z.extractall(extract_to)
+
+def find_xmls(folder):
+    xmls = []
+    for rootdir, _, files in os.walk(folder):
+        for f in files:
+            if f.lower().endswith(".xml"):
+                xmls.append(os.path.join(rootdir, f))
+    return xmls
+
+def read_zip_xmls(zip_path):
+    """
+    Lee los XML del ZIP directo en memoria (sin extraer a disco).
+    Retorna lista de (ArchivoXML, fuente) donde fuente es un BytesIO listo para el parser.
+    Se leen todos los miembros dentro del mismo try que antes hacía extractall,
+    así un ZIP corrupto sigue saliendo como "No se pudo extraer ZIP".
+    """
+    xmls = []
+    with zipfile.ZipFile(zip_path, "r") as z:
+        for info in z.infolist():
+            if info.is_dir() or not info.filename.lower().endswith(".xml"):
+                continue
+            with z.open(info) as f:
+                data = f.read()
+            xmls.append((os.path.basename(info.filename), io.BytesIO(data)))
+    return xmls
+
+def iter_zip_xml_streams(zip_path):
+    """
+    Como read_zip_xmls pero sin leer los miembros: genera (ArchivoXML, archivo) con cada XML
+    abierto en streaming (se descomprime solo lo que el parser pida) mientras el ZIP queda
+    abierto. Lo usa main.py --solo-cabeceras, que lee solo el comienzo de cada XML.
+    """
+    with zipfile.ZipFile(zip_path, "r") as z:
+        for info in z.infolist():
+            if info.is_dir() or not info.filename.lower().endswith(".xml"):
+                continue
+            with z.open(info) as f:
+                yield os.path.basename(info.filename), f
+
+def load_zip_xmls(zip_path, en_disco=False, tmp_dir=TMP_DIR):
+    """
+    Devuelve [(ArchivoXML, fuente)] de un ZIP.
+      - en_disco=False: lectura en memoria (por defecto)
+      - en_disco=True : modo antiguo, extrae en tmp_dir y parsea desde archivo
+    """
+    if not en_disco:
+        return read_zip_xmls(zip_path)
+
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir, exist_ok=True)
+    extract_zip(zip_path, tmp_dir)
+    return [(os.path.basename(p), p) for p in find_xmls(tmp_dir)]
+
+def write_csv(path, rows, fieldnames):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=fieldnames)
+        w.writeheader()
+        for r in rows:
+            w.writerow(r)
@@ -1,187 +1,114 @@
 import os
-import zipfile
-import shutil
-import csv
-import xml.etree.ElementTree as ET
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+# Módulos compartidos con FACTURAS (extractor UBL, lectura de ZIP, filas de NCE)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "FACTURAS"))
+from ubl_extractor import extract
+from zip_io import TMP_DIR, load_zip_xmls, write_csv
+from nota_credito import NC_FIELDS, NC_ITEMS_FIELDS, CREDITNOTE_SPEC, creditnote_rows
+from salida_columnar import PARQUET_DIR, check_pyarrow, export_parquet
+from indice_anulaciones import INDICE_NOMBRE, IndiceAnulaciones, marcar_csv
+from ubl_parsers import PARSER_DEFAULT, PARSERS, parser_en_uso, usar_parser
+from agregados_ventas import ajustar_agregados
 
 ZIP_DIR = "descargas_zip"
-TMP_DIR = "_tmp_extract"
 OUT_DIR = "salida_csv"
 
 NC_CSV = os.path.join(OUT_DIR, "notas_credito.csv")
 NC_ITEMS_CSV = os.path.join(OUT_DIR, "notas_credito_items.csv")
 ERRORES_CSV = os.path.join(OUT_DIR, "errores.csv")
 
-# Namespaces UBL
-NS = {
-    "cbc": "urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2",
-    "cac": "urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2",
-}
-
-def t(elem):
-    return (elem.text or "").strip() if elem is not None else ""
-
-def find1(root, path):
-    return root.find(path, NS)
-
-def findall(root, path):
-    return root.findall(path, NS)
-
-def extract_zip(zip_path, extract_to):
-    with zipfile.ZipFile(zip_path, "r") as z:
-        z.extractall(extract_to)
-
-def find_xmls(folder):
-    xmls = []
-    for rootdir, _, files in os.walk(folder):
-        for f in files:
-            if f.lower().endswith(".xml"):
-                xmls.append(os.path.join(rootdir, f))
-    return xmls
-
-def write_csv(path, rows, fieldnames):
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=fieldnames)
-        w.writeheader()
-        for r in rows:
-            w.writerow(r)
-
-def localname(tag: str) -> str:
-    return tag.split("}")[-1] if "}" in tag else tag
-
-def detect_doc_type(root) -> str:
-    return localname(root.tag)
-
-def norm_doc_id(s: str) -> str:
-    # Normaliza "E001 - 1093" => "E001-1093"
-    s = (s or "").strip().upper()
-    s = s.replace(" ", "")
-    s = s.replace("–", "-").replace("—", "-")
-    # si quedó como E001-1093 ok, si quedó E001-1093 ya ok
-    return s
-
-def parse_creditnote_reference(root):
+# Índice de anulaciones compartido con FACTURAS (carpeta hermana) y su facturas.csv a re-marcar
+FACTURAS_OUT_DIR = os.path.join("..", "FACTURAS", "salida_csv")
+INDICE_JSON = os.path.join(FACTURAS_OUT_DIR, INDICE_NOMBRE)
+FACTURAS_CSV = os.path.join(FACTURAS_OUT_DIR, "facturas.csv")
+
+def parse_creditnote(xml_path, xml_name=None):
+    # xml_path puede ser ruta o archivo en memoria (BytesIO); xml_name manda para ArchivoXML
+    doc = extract(xml_path, {"CreditNote": CREDITNOTE_SPEC})
+
+    if doc.doc_type != "CreditNote":
+        raise ValueError("El XML no es CreditNote")
+
+    return creditnote_rows(doc, xml_name or os.path.basename(xml_path))
+
+def process_zip(zname, en_disco=False, tmp_dir=TMP_DIR):
     """
-    Retorna:
-      ref_id_raw, ref_id_norm, motivo_codigo, motivo_desc
-    Busca en:
-      1) DiscrepancyResponse/ReferenceID
-      2) BillingReference/InvoiceDocumentReference/ID (fallback)
+    Procesa un ZIP completo y retorna sus filas: (nc_rows, nc_items_rows, errores_rows)
     """
-    ref_raw = ""
-    motivo_codigo = ""
-    motivo_desc = ""
+    zip_path = os.path.join(ZIP_DIR, zname)
+    nc_rows = []
+    nc_items_rows = []
+    errores_rows = []
+
+    try:
+        xml_files = load_zip_xmls(zip_path, en_disco=en_disco, tmp_dir=tmp_dir)
+    except Exception as e:
+        errores_rows.append({"ZIP_Origen": zname, "ArchivoXML": "", "Error": f"No se pudo extraer ZIP: {e}"})
+        return nc_rows, nc_items_rows, errores_rows
+
+    if not xml_files:
+        errores_rows.append({"ZIP_Origen": zname, "ArchivoXML": "", "Error": "ZIP sin XML"})
+        return nc_rows, nc_items_rows, errores_rows
 
-    dr = root.find(".//cac:DiscrepancyResponse", NS)
-    if dr is not None:
-        ref_raw = t(dr.find("cbc:ReferenceID", NS))
-        motivo_codigo = t(dr.find("cbc:ResponseCode", NS))
-        motivo_desc = t(dr.find("cbc:Description", NS))
+    for xml_name, xml_src in xml_files:
+        try:
+            header, items = parse_creditnote(xml_src, xml_name)
+            header["ZIP_Origen"] = zname
+            nc_rows.append(header)
+            nc_items_rows.extend(items)
+        except Exception as e:
+            errores_rows.append({"ZIP_Origen": zname, "ArchivoXML": xml_name, "Error": str(e)})
 
-    if not ref_raw:
-        br = root.find(".//cac:BillingReference//cac:InvoiceDocumentReference//cbc:ID", NS)
-        ref_raw = t(br)
+    return nc_rows, nc_items_rows, errores_rows
 
-    return ref_raw, norm_doc_id(ref_raw), motivo_codigo, motivo_desc
+def _init_worker(parser):
+    usar_parser(parser)
 
-def parse_creditnote(xml_path):
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
+def _process_zip_worker(zname, en_disco):
+    # Cada proceso usa su propia carpeta temporal (solo aplica con --extraer-disco)
+    return process_zip(zname, en_disco, tmp_dir=f"{TMP_DIR}_{os.getpid()}")
 
-    if detect_doc_type(root) != "CreditNote":
-        raise ValueError("El XML no es CreditNote")
+def iter_zip_results(zips, workers=1, en_disco=False):
+    """
+    Genera el resultado de cada ZIP en el mismo orden de `zips` (serial o con pool de procesos).
+    """
+    if workers <= 1 or len(zips) <= 1:
+        for zname in zips:
+            yield process_zip(zname, en_disco)
+        return
+
+    chunksize = max(1, len(zips) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(parser_en_uso(),)) as ex:
+        yield from ex.map(_process_zip_worker, zips, repeat(en_disco), chunksize=chunksize)
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="ETL SUNAT: Notas de crédito + Items")
+    ap.add_argument("--extraer-disco", action="store_true",
+                    help="Modo antiguo: extrae cada ZIP en _tmp_extract en vez de leerlo en memoria")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="Procesos en paralelo para parsear ZIPs (1 = serial)")
+    ap.add_argument("--parser", choices=list(PARSERS), default=PARSER_DEFAULT,
+                    help="Backend de parseo XML: etree (default), expat (streaming) o lxml (pip install lxml)")
+    ap.add_argument("--parquet", action="store_true",
+                    help=f"Además de los CSV, genera Parquet tipado por año-mes en {PARQUET_DIR}/ (requiere pyarrow)")
+    ap.add_argument("--indice", default=INDICE_JSON, metavar="RUTA",
+                    help=f"Índice persistente de anulaciones compartido con FACTURAS (default {INDICE_JSON})")
+    ap.add_argument("--facturas-csv", default=FACTURAS_CSV, metavar="RUTA",
+                    help=f"facturas.csv donde re-marcar EsAnulado con el índice, si existe (default {FACTURAS_CSV})")
+    ap.add_argument("--sin-marcar", action="store_true",
+                    help="No actualiza el índice ni re-marca facturas.csv")
+    return ap.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.parquet:
+        check_pyarrow()
+    usar_parser(args.parser)
 
-    nc_id = t(find1(root, ".//cbc:ID"))
-    issue_date = t(find1(root, ".//cbc:IssueDate"))
-    issue_time = t(find1(root, ".//cbc:IssueTime"))
-    currency = t(find1(root, ".//cbc:DocumentCurrencyCode"))
-
-    # Emisor
-    supplier_ruc = t(find1(root, ".//cac:AccountingSupplierParty//cac:PartyIdentification//cbc:ID"))
-    supplier_name = t(find1(root, ".//cac:AccountingSupplierParty//cac:PartyLegalEntity//cbc:RegistrationName"))
-    if not supplier_name:
-        supplier_name = t(find1(root, ".//cac:AccountingSupplierParty//cac:PartyName//cbc:Name"))
-
-    # Receptor
-    customer_ruc = t(find1(root, ".//cac:AccountingCustomerParty//cac:PartyIdentification//cbc:ID"))
-    customer_name = t(find1(root, ".//cac:AccountingCustomerParty//cac:PartyLegalEntity//cbc:RegistrationName"))
-    if not customer_name:
-        customer_name = t(find1(root, ".//cac:AccountingCustomerParty//cac:PartyName//cbc:Name"))
-
-    # Referencia y motivo
-    ref_raw, ref_norm, motivo_codigo, motivo_desc = parse_creditnote_reference(root)
-    es_anulacion = "SI" if motivo_codigo == "01" else "NO"
-
-    # Totales
-    base_imponible = t(find1(root, ".//cac:TaxTotal//cac:TaxSubtotal//cbc:TaxableAmount"))
-    igv_total = t(find1(root, ".//cac:TaxTotal//cbc:TaxAmount"))
-    subtotal_sin_igv = t(find1(root, ".//cac:LegalMonetaryTotal//cbc:LineExtensionAmount"))
-    total = t(find1(root, ".//cac:LegalMonetaryTotal//cbc:PayableAmount"))
-
-    nc_key = f"{supplier_ruc}-CN-{nc_id}-{issue_date}"
-
-    header = {
-        "NotaCreditoKey": nc_key,
-        "ArchivoXML": os.path.basename(xml_path),
-        "NumeroNotaCredito": nc_id,
-        "FechaEmision": issue_date,
-        "HoraEmision": issue_time,
-        "Moneda": currency,
-
-        "RUC_Emisor": supplier_ruc,
-        "Nombre_Emisor": supplier_name,
-        "RUC_Receptor": customer_ruc,
-        "Nombre_Receptor": customer_name,
-
-        "DocReferencia": ref_raw,
-        "DocReferencia_Normalizado": ref_norm,
-        "MotivoCodigo": motivo_codigo,
-        "MotivoDescripcion": motivo_desc,
-        "EsAnulacionOperacion": es_anulacion,
-
-        "BaseImponible": base_imponible,
-        "IGV": igv_total,
-        "SubtotalSinIGV": subtotal_sin_igv,
-        "Total": total,
-    }
-
-    # Items (CreditNoteLine)
-    items = []
-    lines = findall(root, ".//cac:CreditNoteLine")
-
-    for line in lines:
-        line_id = t(line.find("cbc:ID", NS))
-
-        qty_el = line.find("cbc:CreditedQuantity", NS)
-        qty = t(qty_el)
-        unit = qty_el.attrib.get("unitCode", "") if qty_el is not None else ""
-
-        desc = t(line.find(".//cac:Item//cbc:Description", NS))
-        valor_linea = t(line.find("cbc:LineExtensionAmount", NS))
-        precio_unit = t(line.find(".//cac:Price//cbc:PriceAmount", NS))
-        impuesto_linea = t(line.find(".//cac:TaxTotal//cbc:TaxAmount", NS))
-
-        items.append({
-            "NotaCreditoKey": nc_key,
-            "NumeroNotaCredito": nc_id,
-            "FechaEmision": issue_date,
-            "LineaID": line_id,
-            "Descripcion": desc,
-            "Cantidad": qty,
-            "Unidad": unit,
-            "PrecioUnitario": precio_unit,
-            "ValorLineaSinIGV": valor_linea,
-            "ImpuestoLinea": impuesto_linea,
-
-            "DocReferencia_Normalizado": ref_norm,
-            "MotivoCodigo": motivo_codigo,
-            "EsAnulacionOperacion": es_anulacion,
-        })
-
-    return header, items
-
-def main():
     os.makedirs(ZIP_DIR, exist_ok=True)
     os.makedirs(OUT_DIR, exist_ok=True)
 
@@ -191,63 +118,57 @@ def main():
     nc_items_rows = []
     errores_rows = []
 
-    for zname in zips:
-        zip_path = os.path.join(ZIP_DIR, zname)
-
-        if os.path.exists(TMP_DIR):
-            shutil.rmtree(TMP_DIR)
-        os.makedirs(TMP_DIR, exist_ok=True)
-
-        try:
-            extract_zip(zip_path, TMP_DIR)
-        except Exception as e:
-            errores_rows.append({"ZIP_Origen": zname, "ArchivoXML": "", "Error": f"No se pudo extraer ZIP: {e}"})
-            continue
-
-        xml_files = find_xmls(TMP_DIR)
-        if not xml_files:
-            errores_rows.append({"ZIP_Origen": zname, "ArchivoXML": "", "Error": "ZIP sin XML"})
-            continue
-
-        for xml_path in xml_files:
-            try:
-                header, items = parse_creditnote(xml_path)
-                header["ZIP_Origen"] = zname
-                nc_rows.append(header)
-                nc_items_rows.extend(items)
-            except Exception as e:
-                errores_rows.append({"ZIP_Origen": zname, "ArchivoXML": os.path.basename(xml_path), "Error": str(e)})
-
-    nc_fields = [
-        "NotaCreditoKey", "ZIP_Origen", "ArchivoXML",
-        "NumeroNotaCredito", "FechaEmision", "HoraEmision", "Moneda",
-        "RUC_Emisor", "Nombre_Emisor",
-        "RUC_Receptor", "Nombre_Receptor",
-        "DocReferencia", "DocReferencia_Normalizado",
-        "MotivoCodigo", "MotivoDescripcion", "EsAnulacionOperacion",
-        "BaseImponible", "IGV", "SubtotalSinIGV", "Total",
-    ]
-
-    nc_items_fields = [
-        "NotaCreditoKey", "NumeroNotaCredito", "FechaEmision",
-        "LineaID", "Descripcion", "Cantidad", "Unidad",
-        "PrecioUnitario", "ValorLineaSinIGV", "ImpuestoLinea",
-        "DocReferencia_Normalizado", "MotivoCodigo", "EsAnulacionOperacion",
-    ]
+    for znc, znc_items, zerrores in iter_zip_results(zips, args.workers, args.extraer_disco):
+        nc_rows.extend(znc)
+        nc_items_rows.extend(znc_items)
+        errores_rows.extend(zerrores)
 
     errores_fields = ["ZIP_Origen", "ArchivoXML", "Error"]
 
-    write_csv(NC_CSV, nc_rows, nc_fields)
-    write_csv(NC_ITEMS_CSV, nc_items_rows, nc_items_fields)
+    write_csv(NC_CSV, nc_rows, NC_FIELDS)
+    write_csv(NC_ITEMS_CSV, nc_items_rows, NC_ITEMS_FIELDS)
     write_csv(ERRORES_CSV, errores_rows, errores_fields)
 
+    # ÍNDICE DE ANULACIONES: reemplazo las entradas de notas y re-marco facturas.csv
+    # (solo EsAnulado, sin volver a parsear los XML de facturas)
+    marcado = None
+    ajustados = None
+    if not args.sin_marcar:
+        indice = IndiceAnulaciones.cargar(args.indice)
+        indice.reemplazar("notas", (
+            (r["RUC_Emisor"], r["DocReferencia_Normalizado"], r["NumeroNotaCredito"], r["FechaEmision"])
+            for r in nc_rows if r.get("EsAnulacionOperacion") == "SI"
+        ))
+        indice.guardar()
+        if os.path.exists(args.facturas_csv):
+            cambios = []
+            marcado = marcar_csv(args.facturas_csv, args.facturas_csv, indice.claves(), cambios)
+            # Ventas pre-agregadas de FACTURAS (mismo directorio): solo se ajustan las facturas que cambiaron
+            facturas_dir = os.path.dirname(args.facturas_csv)
+            ajustados = ajustar_agregados(facturas_dir, cambios, os.path.join(facturas_dir, "items.csv"))
+
+    parquet_filas = None
+    if args.parquet:
+        parquet_filas = export_parquet([
+            ("notas_credito", NC_CSV, NC_FIELDS, "FechaEmision"),
+            ("notas_credito_items", NC_ITEMS_CSV, NC_ITEMS_FIELDS, "FechaEmision"),
+        ])
+
     print("✅ Listo")
     print(f"ZIP encontrados: {len(zips)}")
     print(f"Notas de crédito -> {NC_CSV}")
     print(f"Items NCE -> {NC_ITEMS_CSV}")
     print(f"Errores -> {ERRORES_CSV}")
+    if parquet_filas is not None:
+        print(f"Parquet por año-mes -> {PARQUET_DIR}/ ({', '.join(f'{k}: {v}' for k, v in parquet_filas.items())})")
     print(f"NCE detectadas: {len(nc_rows)}")
     print(f"NCE Anulación (Motivo 01): {sum(1 for r in nc_rows if r.get('EsAnulacionOperacion')=='SI')}")
+    if not args.sin_marcar:
+        print(f"Índice de anulaciones -> {args.indice}")
+    if marcado is not None:
+        print(f"Facturas re-marcadas -> {args.facturas_csv} (anuladas: {marcado[0]} | cambiaron: {marcado[1]})")
+    if ajustados is not None:
+        print(f"Ventas pre-agregadas ajustadas en {os.path.dirname(args.facturas_csv)} (documentos: {ajustados})")
 
 if __name__ == "__main__":
     main()